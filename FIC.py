@@ -1,30 +1,55 @@
-import hashlib
+import argparse
+import fnmatch
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import messagebox
-import os
-import json
+from tkinter import ttk
+from baseline_record import record_hash
+from fic_core import IntegrityChecker, SCAN_CHANGED, SCAN_REMOVED, SCAN_NOT_CHANGED, SCAN_ADDED, SCAN_RENAMED
+from metrics import METRICS
 
 
-class FileIntegrityCheckerApp:
-    def __init__(self, root):
+#results moved from the scan thread into the Text widget per Tk tick, keeps the GUI responsive on huge scans
+RESULTS_PER_TICK = 2000
+SCAN_POLL_MS = 100
+#rows per page in the unchanged files view
+UNCHANGED_PAGE_SIZE = 1000
+#rows rendered at a time in the Verify Changes list, whatever the number of results
+SELECTION_ROWS = 30
+
+
+class FileIntegrityCheckerApp(IntegrityChecker):
+    """Tk front end, the baseline and scanning logic lives in fic_core.IntegrityChecker."""
+
+    def __init__(self, root, data_dir=None, hash_mode='thread', hash_workers=None, paranoid_every=10,
+                 hash_algorithm='sha256', prefilter_algorithm=None, chunk_threshold=None):
         self.root = root
         self.root.title("IntegriSecure")
-                
-        # Initialize variables
-        self.app_data_path = os.environ['APPDATA']
-        self.baseline_file_path = os.path.join(self.app_data_path, "FIC", "baseline_hashes.json")
         
+        super().__init__(data_dir=data_dir, hash_mode=hash_mode, hash_workers=hash_workers, paranoid_every=paranoid_every,
+                         hash_algorithm=hash_algorithm, prefilter_algorithm=prefilter_algorithm,
+                         chunk_threshold=chunk_threshold)
+        
+        #the baseline is sealed (FIC_SEAL_KEY) but its signature does not match, nothing it says can be trusted
+        for problem in self.seal_problems:
+            messagebox.showwarning("Baseline Seal", problem)
         
-        #create baseline_file
-        self.create_baseline_file()
+        self.quick_check_var = tk.IntVar(value=0)
         
-        #intializing variables depending on baseline_file
-        self.baseline_hashes = self.retrieve_data_from_baseline_hashes()
-        self.files_to_check = set(self.baseline_hashes.keys())
-        self.added_folders = set()
-        self.added_files = set()
-        self.current_hashes = {}
+        #state of the background integrity check
+        self.scan_thread = None
+        self.scan_queue = queue.Queue()
+        self.scan_cancel_event = threading.Event()
+        self.scan_counts = {}
+        self.unchanged_results = []
+        #status -> file paths of the last completed check, what Verify Changes picks from
+        self.check_results = None
+        self.pending_results = {}
+        #Verify Changes without a completed check starts one and opens the review when it finishes
+        self.verify_after_check = False
         
         # Create UI elements
         self.add_file_button = tk.Button(self.root, text="Add File(s)", command= self.add_files)
@@ -37,14 +62,29 @@ class FileIntegrityCheckerApp:
         #self.check_button_var = tk.StringVar(value="Check Integrity")
         self.check_button = tk.Button(self.root, text = "Check Integrity", command = self.check_integrity)
         self.check_button.grid(row=0, column=9, pady=10, columnspan= 2, rowspan= 2)
+        
+        self.quick_check_box = tk.Checkbutton(self.root, text="Quick Check", variable=self.quick_check_var)
+        self.quick_check_box.grid(row=0, column=11, pady=10)
+        
+        self.cancel_button = tk.Button(self.root, text="Cancel", command=self.cancel_check, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=12, pady=10)
+        
+        self.show_unchanged_button = tk.Button(self.root, text="Show Unchanged", command=self.show_unchanged)
+        self.show_unchanged_button.grid(row=0, column=13, pady=10)
+        
+        #scan progress
+        self.progress_bar = ttk.Progressbar(self.root, orient="horizontal", mode="determinate", length=400)
+        self.progress_bar.grid(row=1, column=0, columnspan=9, padx=10, sticky="w")
+        self.counters_label = tk.Label(self.root, text="")
+        self.counters_label.grid(row=1, column=11, columnspan=9, sticky="w")
 
         #show hash button
         self.show_hash_button = tk.Button(self.root, text = "Show Hashes", command = self.show_hashes)
         self.show_hash_button.grid(row=0, column=0, pady=10, padx=0)
         
         #verify button
-        self.show_hash_button = tk.Button(self.root, text = "Verify Changes", command = self.verify_changes)
-        self.show_hash_button.grid(row=0, column=1, pady=10)
+        self.verify_button = tk.Button(self.root, text = "Verify Changes", command = self.verify_changes)
+        self.verify_button.grid(row=0, column=1, pady=10)
 
         
         #result space
@@ -54,10 +94,6 @@ class FileIntegrityCheckerApp:
         self.result_text.insert(tk.END, f"{'IntegriSecure':^{162}}\n")
         self.result_text.insert(tk.END, "-"*160 + "\n")
     
-    def get_files_to_check(self):
-        return self.files_to_check
-        
-        
     def add_files(self):
         
         #tuple of files added till now
@@ -65,69 +101,29 @@ class FileIntegrityCheckerApp:
         
         #due to multiple file slection is enabled, tuple is returned by askopenfilename. therefore parsing of each file needs to be done
         if file_paths:
-            for file_path in file_paths:
-                #normalising file_path
-                file_path = self.normalise_file_path(file_path)
-                
-                #adding file to files_to_check to keep track of what files to check
-                self.add_file_to_added_files(file_path)
-                
-                #creating hash and addding to baseline_hashes file & dict and files_to_check to keep real time tracking
-                self.save_baseline(file_path)
-                
-            self.result_text.insert(tk.END, f"Added {len(file_paths)} file(s).\n")
+            file_count = self.add_files_to_baseline(file_paths)
+            self.result_text.insert(tk.END, f"Added {file_count} file(s).\n")
             
     def add_folders(self):
         folder_path = filedialog.askdirectory(parent=self.root, title = "Select folder(s) to add")
         if folder_path:
-            
-            #add to folders set to keep real time tracking of selected folders
-            self.add_folder_to_added_folders(folder_path)
-            
-            file_count = 0
-            # Iterate through all files in the folder
-            for root_dir, _, files in os.walk(folder_path):
-                for file_name in files:
-                    #joining directory path with file name for creating full file_path
-                    file_path = os.path.join(root_dir, file_name)
-                    
-                    #normalising file_path for having consistency
-                    file_path = self.normalise_file_path(file_path)
-                    
-                    #adding files that are not already added.
-                    if file_path not in self.files_to_check:
-                        #compute hash and add file to baseline_hashes and files_to_check
-                        self.save_baseline(file_path)
-                        print(f"{file_path} added\n")
-                        #increase file_count for every successful file add
-                        file_count += 1
+            file_count = self.add_folder_to_baseline(folder_path)
             self.result_text.insert(tk.END, f"Added {file_count} file(s).\n")
-                    
-    
-    def compute_file_hash(self, file_path, hash_algorithm='sha256'):
-        """Compute the hash of a file."""
-        hash_func = hashlib.new(hash_algorithm)
-        try:
-            with open(file_path, 'rb') as file:
-                while chunk := file.read(8192):
-                    hash_func.update(chunk)
-            return hash_func.hexdigest()
-        except Exception as e:
-            print(f"Could not read file {file_path}: {e}")
-            return None
     
     def check_integrity(self):
+        """Start an integrity check on a background thread and stream its results into the result area.
+
+        Only changed and removed files are rendered, unchanged ones are kept for the Show Unchanged view.
+        """
+        if self.scan_thread is not None and self.scan_thread.is_alive():
+            return
+        
         #creating tags for changing forground colors of the file names 
         self.result_text.tag_configure("changed", foreground= "red")
         self.result_text.tag_configure("removed", foreground= "grey")
         self.result_text.tag_configure("renamed", foreground= "yellow")
         self.result_text.tag_configure("not_changed", foreground= "green")
-        
-        #sorting files according to their integrity
-        changed = list()
-        removed = list()
-        renamed = list()
-        not_changed = list()
+        self.result_text.tag_configure("added", foreground= "blue")
         
         #clearing the older outputs
         self.result_text.delete(1.0, tk.END)
@@ -140,198 +136,336 @@ class FileIntegrityCheckerApp:
         self.result_text.insert(tk.END, f"{'INTEGRITY CHECK':^{162}}\n")
         self.result_text.insert(tk.END, "-"*160 + "\n")
         
-        for file_path in self.files_to_check:
-            #checking if file_path in files_to_check is not in os.path, which means file is moved or deleted
-            if not os.path.isfile(file_path):
-                #self.result_text.insert(tk.END, f"Removed: {file_path}\n", "removed")
-                removed.append(file_path)
+        #each section gets a mark that new results are inserted at, so both sections grow while the scan runs
+        self.result_text.insert(tk.END, "CHANGED\n")
+        changed_end = self.result_text.index("end-1c")
+        self.result_text.insert(tk.END, "\n\nREMOVED\n")
+        removed_end = self.result_text.index("end-1c")
+        self.result_text.insert(tk.END, "\n\nADDED\n")
+        added_end = self.result_text.index("end-1c")
+        self.result_text.insert(tk.END, "\n\nRENAMED\n")
+        renamed_end = self.result_text.index("end-1c")
+        self.result_text.insert(tk.END, "\n\n")
+        #marks are set once the layout is in place, right gravity keeps them after every inserted line
+        self.result_text.mark_set("changed_end", changed_end)
+        self.result_text.mark_gravity("changed_end", tk.RIGHT)
+        self.result_text.mark_set("removed_end", removed_end)
+        self.result_text.mark_gravity("removed_end", tk.RIGHT)
+        self.result_text.mark_set("added_end", added_end)
+        self.result_text.mark_gravity("added_end", tk.RIGHT)
+        self.result_text.mark_set("renamed_end", renamed_end)
+        self.result_text.mark_gravity("renamed_end", tk.RIGHT)
+        
+        self.scan_counts = {SCAN_CHANGED: 0, SCAN_REMOVED: 0, SCAN_NOT_CHANGED: 0, SCAN_ADDED: 0, SCAN_RENAMED: 0}
+        self.unchanged_results = []
+        self.pending_results = {SCAN_CHANGED: [], SCAN_REMOVED: [], SCAN_ADDED: [], SCAN_RENAMED: []}
+        self.check_results = None
+        self.progress_bar.configure(maximum=len(self.files_to_check), value=0)
+        self.update_counters()
+        
+        #decided on the Tk thread, it updates the paranoid sweep counter in the store
+        quick = self.use_quick_check(self.quick_check_var.get())
+        
+        self.scan_queue = queue.Queue()
+        self.scan_cancel_event = threading.Event()
+        self.scan_thread = threading.Thread(target=self.run_scan, args=(quick, self.scan_queue, self.scan_cancel_event), daemon=True)
+        
+        self.check_button.configure(state=tk.DISABLED)
+        self.verify_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.scan_thread.start()
+        self.root.after(SCAN_POLL_MS, self.drain_scan_queue)
+    
+    def run_scan(self, quick, results_queue, cancel_event):
+        """Scan thread: push every result into the queue, None marks the end of the scan."""
+        try:
+            for result in self.iter_scan(quick=quick, cancel_event=cancel_event):
+                results_queue.put(result)
+        finally:
+            results_queue.put(None)
+    
+    def drain_scan_queue(self):
+        """Tk thread: render the results queued by the scan thread since the last tick."""
+        start = time.perf_counter()
+        finished = False
+        rendered = 0
+        for _ in range(RESULTS_PER_TICK):
+            try:
+                result = self.scan_queue.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                finished = True
+                break
             
-            #if file path is present in OS then checking if hash is same
+            status, file_path, _ = result
+            rendered += 1
+            self.scan_counts[status] += 1
+            if status == SCAN_CHANGED:
+                self.result_text.insert("changed_end", f"{file_path}\n", "changed")
+                #chunked files also show which byte ranges changed
+                for start, end in self.changed_ranges.get(file_path, ()):
+                    self.result_text.insert("changed_end", f"    bytes {start}-{end}\n", "changed")
+            elif status == SCAN_REMOVED:
+                self.result_text.insert("removed_end", f"{file_path}\n", "removed")
+            elif status == SCAN_ADDED:
+                self.result_text.insert("added_end", f"{file_path}\n", "added")
+            elif status == SCAN_RENAMED:
+                self.result_text.insert("renamed_end", f"{self.renamed_files[file_path]} -> {file_path}\n", "renamed")
+            if status == SCAN_NOT_CHANGED:
+                self.unchanged_results.append(file_path)
             else:
-                #if hash is not same
-                if not self.check_hash(file_path):
-                    #self.result_text.insert(tk.END, f"File Changed: {file_path}\n", "changed")
-                    changed.append(file_path)
-                
-                #if hash is same
-                else:
-                    #self.result_text.insert(tk.END, f"no changes: {file_path}\n", "not_changed")
-                    not_changed.append(file_path)
-        
-        if changed:
-            changed.sort()
-            self.result_text.insert(tk.END, "CHANGED\n")            
-            for file_path in changed:
-                self.result_text.insert(tk.END, f"{file_path}\n", "changed")
-            self.result_text.insert(tk.END, "\n\n")
-        
-        if removed:
-            removed.sort()
-            self.result_text.insert(tk.END, "REMOVED\n")
-            for file_path in removed:
-                self.result_text.insert(tk.END, f"{file_path}\n", "removed")
-            self.result_text.insert(tk.END, "\n\n")
-        
-        if not_changed:
-            not_changed.sort()
-            self.result_text.insert(tk.END, "NO CHANGES\n")
-            for file_path in not_changed:
-                self.result_text.insert(tk.END, f"{file_path}\n", "not_changed")
-            self.result_text.insert(tk.END, "\n\n")
-                   
+                self.pending_results[status].append(file_path)
+        
+        #added files are found after the baseline files, they are not part of the progress
+        self.progress_bar.configure(value=self.checked_count())
+        self.update_counters()
+        METRICS.add_time('gui_render', time.perf_counter() - start)
+        METRICS.inc('gui_rows_rendered', rendered)
+        
+        if finished:
+            self.finish_check()
+        else:
+            self.root.after(SCAN_POLL_MS, self.drain_scan_queue)
+    
+    def finish_check(self):
+        cancelled = self.scan_cancel_event.is_set()
+        self.check_button.configure(state=tk.NORMAL)
+        self.verify_button.configure(state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED)
+        #a cancelled check did not see every file, Verify Changes scans again then
+        self.check_results = None if cancelled else {**self.pending_results, SCAN_NOT_CHANGED: self.unchanged_results}
+        
         self.result_text.insert(tk.END, "-"*158 + "\n")    
-        self.result_text.insert(tk.END, f"{'Integrity Check Completed':^162}\n")
+        if cancelled:
+            self.result_text.insert(tk.END, f"{'Integrity Check Cancelled':^162}\n")
+        else:
+            self.result_text.insert(tk.END, f"{'Integrity Check Completed':^162}\n")
+        self.result_text.insert(tk.END, f"{self.scan_counts[SCAN_NOT_CHANGED]} file(s) with no changes, use Show Unchanged to list them.\n", "not_changed")
+        
+        if self.verify_after_check:
+            self.verify_after_check = False
+            if not cancelled:
+                self.verify_changes()
+    
+    def cancel_check(self):
+        self.scan_cancel_event.set()
+        self.cancel_button.configure(state=tk.DISABLED)
+    
+    def update_counters(self):
+        self.counters_label.configure(text=(
+            f"Checked {self.checked_count()}/{len(self.files_to_check)}   "
+            f"Changed {self.scan_counts.get(SCAN_CHANGED, 0)}   "
+            f"Removed {self.scan_counts.get(SCAN_REMOVED, 0)}   "
+            f"Added {self.scan_counts.get(SCAN_ADDED, 0)}   "
+            f"Renamed {self.scan_counts.get(SCAN_RENAMED, 0)}   "
+            f"No changes {self.scan_counts.get(SCAN_NOT_CHANGED, 0)}"
+        ))
+    
+    def checked_count(self):
+        #a rename stands for one baselined file, the added file it was found as is not part of the progress
+        return sum(count for status, count in self.scan_counts.items() if status != SCAN_ADDED)
+    
+    def show_unchanged(self):
+        """Paginated view of the unchanged files of the last check, one page of rows in a Listbox at a time."""
+        unchanged = sorted(self.unchanged_results)
+        page_count = max(1, (len(unchanged) + UNCHANGED_PAGE_SIZE - 1) // UNCHANGED_PAGE_SIZE)
+        page = [0]
+        
+        window = tk.Toplevel(self.root)
+        window.title("Unchanged Files")
+        
+        listbox = tk.Listbox(window, width=160, height=40, foreground="green")
+        scrollbar = tk.Scrollbar(window, orient="vertical", command=listbox.yview)
+        listbox.configure(yscrollcommand=scrollbar.set)
+        listbox.grid(row=0, column=0, columnspan=3, padx=10, pady=10)
+        scrollbar.grid(row=0, column=3, sticky="ns")
+        
+        page_label = tk.Label(window)
+        page_label.grid(row=1, column=1)
+        
+        def render():
+            start = page[0] * UNCHANGED_PAGE_SIZE
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *unchanged[start:start + UNCHANGED_PAGE_SIZE])
+            page_label.configure(text=f"Page {page[0] + 1} of {page_count} ({len(unchanged)} files)")
+        
+        def move(step):
+            page[0] = min(max(page[0] + step, 0), page_count - 1)
+            render()
+        
+        tk.Button(window, text="< Previous", command=lambda: move(-1)).grid(row=1, column=0, pady=10)
+        tk.Button(window, text="Next >", command=lambda: move(1)).grid(row=1, column=2, pady=10)
+        render()
   
-    def select_items_from_lists(self, titles_and_elements):
-        selected_items = []
+    def select_items_from_lists(self, results):
+        """Window to pick the scan results to accept, a filterable list that only renders the rows in view.
 
+        Selection is kept in a set of row numbers, so lists of many thousand changes stay responsive.
+        The filter takes a substring or a glob (e.g. *.log) and Select Shown picks every row it matches,
+        Select Folder picks every result inside a folder.
+        """
+        rows = list()
+        for status in (SCAN_CHANGED, SCAN_REMOVED, SCAN_ADDED, SCAN_RENAMED):
+            for file_path in sorted(results[status]):
+                label = f"{self.renamed_files.get(file_path)} -> {file_path}" if status == SCAN_RENAMED else file_path
+                rows.append((status, file_path, label))
+        chosen = set()
+        shown = list(range(len(rows)))
+        offset = [0]
+        
+        selection_window = tk.Toplevel(self.root)
+        selection_window.title("Select Changes to Accept")
+        
+        filter_var = tk.StringVar()
+        status_var = tk.StringVar(value="all")
+        tk.Label(selection_window, text="Filter").grid(row=0, column=0, padx=10, sticky="w")
+        filter_entry = tk.Entry(selection_window, textvariable=filter_var, width=80)
+        filter_entry.grid(row=0, column=1, columnspan=3, sticky="we")
+        status_box = ttk.Combobox(selection_window, textvariable=status_var, state="readonly", width=12,
+                                  values=("all", SCAN_CHANGED, SCAN_REMOVED, SCAN_ADDED, SCAN_RENAMED))
+        status_box.grid(row=0, column=4, padx=10)
+        
+        listbox = tk.Listbox(selection_window, width=160, height=SELECTION_ROWS, selectmode=tk.EXTENDED,
+                             font=("Courier", 10))
+        scrollbar = tk.Scrollbar(selection_window, orient="vertical")
+        listbox.grid(row=1, column=0, columnspan=5, padx=10, pady=10)
+        scrollbar.grid(row=1, column=5, sticky="ns")
+        count_label = tk.Label(selection_window)
+        count_label.grid(row=2, column=0, columnspan=5, sticky="w", padx=10)
+        
+        colours = {SCAN_CHANGED: "red", SCAN_REMOVED: "grey", SCAN_ADDED: "blue", SCAN_RENAMED: "orange"}
+        
+        def render():
+            #only the rows in view exist in the Listbox, scrolling renders the next window of the filtered rows
+            offset[0] = min(max(offset[0], 0), max(len(shown) - SELECTION_ROWS, 0))
+            listbox.delete(0, tk.END)
+            for line, row in enumerate(shown[offset[0]:offset[0] + SELECTION_ROWS]):
+                status, _, label = rows[row]
+                listbox.insert(tk.END, f"{'[x]' if row in chosen else '[ ]'} {status:<8} {label}")
+                listbox.itemconfigure(line, foreground=colours[status])
+            if shown:
+                scrollbar.set(offset[0] / len(shown), min(offset[0] + SELECTION_ROWS, len(shown)) / len(shown))
+            else:
+                scrollbar.set(0, 1)
+            count_label.configure(text=f"{len(shown)} of {len(rows)} result(s) shown, {len(chosen)} selected")
+        
+        def apply_filter(*_):
+            text = filter_var.get().strip()
+            status = status_var.get()
+            #a filter with glob characters is matched against the full path, anything else is a substring
+            if any(character in text for character in "*?["):
+                matches = lambda row: fnmatch.fnmatch(rows[row][1], text)
+            else:
+                matches = lambda row: text.lower() in rows[row][2].lower()
+            shown[:] = [row for row in range(len(rows)) if (status == "all" or rows[row][0] == status) and matches(row)]
+            offset[0] = 0
+            render()
+        
+        def scroll(*args):
+            if args[0] == "moveto":
+                offset[0] = int(float(args[1]) * len(shown))
+            else:
+                step = SELECTION_ROWS if args[2] == "pages" else 1
+                offset[0] += int(args[1]) * step
+            render()
+        
+        def wheel(event):
+            if getattr(event, 'num', None) == 4 or event.delta > 0:
+                offset[0] -= 3
+            else:
+                offset[0] += 3
+            render()
+            return "break"
+        
+        def toggle(_=None):
+            for line in listbox.curselection():
+                row = shown[offset[0] + line]
+                if row in chosen:
+                    chosen.discard(row)
+                else:
+                    chosen.add(row)
+            render()
+            return "break"
+        
+        def set_shown(selected):
+            if selected:
+                chosen.update(shown)
+            else:
+                chosen.difference_update(shown)
+            render()
+        
+        def select_folder():
+            folder = filedialog.askdirectory(parent=selection_window, title="Select the results inside a folder")
+            if folder:
+                selection = self.select_changes(results, directories=[folder])
+                picked = {file_path for file_paths in selection for file_path in file_paths}
+                chosen.update(row for row in range(len(rows)) if rows[row][1] in picked)
+                render()
+        
         def submit():
-            selected_items.clear()
-            for i, (title, check_vars) in enumerate(check_vars_list):
-                selected_list = []
-                for j, var in enumerate(check_vars):
-                    if var.get():
-                        selected_list.append(titles_and_elements[i][1][j])  # Append selected items from the list
-                selected_items.append((title, selected_list))  # Append the title and the selected items
-            #messagebox.showinfo("Selected Items", f"Selected items: {selected_items}")
-            
-            #updating baseline hash
-            for title, items in selected_items:
-                if title == "changed":
-                    for item in items:
-                        new_hash = self.compute_file_hash(item)
-                        self.update_baseline_hashes('change', item, new_hash=new_hash)
-                elif title == "removed":
-                    for item in items:
-                        self.update_baseline_hashes('remove', item)
+            selected_items = [(status, [rows[row][1] for row in sorted(chosen) if rows[row][0] == status])
+                              for status in (SCAN_CHANGED, SCAN_REMOVED, SCAN_ADDED, SCAN_RENAMED)]
+            selected = dict(selected_items)
+            #one batched write, changed files keep the digest the check already computed
+            accepted = self.accept_changes(selected[SCAN_CHANGED], selected[SCAN_REMOVED], selected[SCAN_ADDED],
+                                           selected[SCAN_RENAMED])
+            #accepted files are no longer results of the last check
+            done = {rows[row][1] for row in chosen}
+            for status in results:
+                results[status][:] = [file_path for file_path in results[status] if file_path not in done]
             
-            self.display_selected_items(selected_items)  # Display selected items
-            selection_window.destroy()  # Close the selection window
-
-        def toggle_select_all(check_vars, select_all_var):
-            """Toggle all checkboxes when 'Select All' is checked or unchecked."""
-            select_all_checked = select_all_var.get()
-            for var in check_vars:
-                var.set(select_all_checked)
-
-        # Create a new window for selection
-        selection_window = tk.Toplevel(self.root)
-        selection_window.title("Select Items")
-
-        # List to store check_vars for each list of elements
-        check_vars_list = []
-
-        # Loop through each title and its corresponding list of elements
-        for title, elements in titles_and_elements:
-            # Title Label for each list
-            tk.Label(selection_window, text=title, font=("Arial", 14)).pack(pady=10)
-
-            # Frame for each set of checkboxes
-            frame = tk.Frame(selection_window)
-            frame.pack(padx=20, pady=10)
-
-            # Create a list to hold IntVar objects for each checkbox
-            check_vars = []
-
-            # Add a "Select All" checkbox for each list
-            select_all_var = tk.IntVar()
-            select_all_checkbox = tk.Checkbutton(frame, text="Select All", variable=select_all_var, 
-                                                 command=lambda v=check_vars, sv=select_all_var: toggle_select_all(v, sv))
-            select_all_checkbox.pack(anchor="w")
-
-            # Dynamically create a checkbox for each element in the list
-            for element in elements:
-                var = tk.IntVar()
-                checkbox = tk.Checkbutton(frame, text=element, variable=var)
-                checkbox.pack(anchor="w")
-                check_vars.append(var)
-
-            # Append check_vars for the current list to the main check_vars_list
-            check_vars_list.append((title, check_vars))
-
-        # Submit button
-        submit_button = tk.Button(selection_window, text="Submit", command=submit)
-        submit_button.pack(pady=10)
+            self.display_selected_items(selected_items, accepted)
+            selection_window.destroy()
+        
+        scrollbar.configure(command=scroll)
+        filter_var.trace_add("write", apply_filter)
+        status_box.bind("<<ComboboxSelected>>", apply_filter)
+        listbox.bind("<MouseWheel>", wheel)
+        listbox.bind("<Button-4>", wheel)
+        listbox.bind("<Button-5>", wheel)
+        listbox.bind("<Double-Button-1>", toggle)
+        listbox.bind("<space>", toggle)
         
-    def display_selected_items(self, selected_items):
-        """Display the selected items in the result text area."""
+        tk.Button(selection_window, text="Toggle Highlighted", command=toggle).grid(row=3, column=0, pady=10)
+        tk.Button(selection_window, text="Select Shown", command=lambda: set_shown(True)).grid(row=3, column=1, pady=10)
+        tk.Button(selection_window, text="Clear Shown", command=lambda: set_shown(False)).grid(row=3, column=2, pady=10)
+        tk.Button(selection_window, text="Select Folder...", command=select_folder).grid(row=3, column=3, pady=10)
+        tk.Button(selection_window, text="Accept Selected", command=submit).grid(row=3, column=4, pady=10)
+        render()
+        filter_entry.focus_set()
+        
+    def display_selected_items(self, selected_items, accepted):
+        """Display the accepted items in the result text area."""
         self.result_text.delete(1.0, tk.END)  # Clear previous results
         self.result_text.insert(tk.END, "-" * 160 + "\n")
-        self.result_text.insert(tk.END, f"{'Selected Items':^{162}}\n")
+        self.result_text.insert(tk.END, f"{'Accepted Items':^{162}}\n")
+        self.result_text.insert(tk.END, "-" * 160 + "\n")
+        self.result_text.insert(tk.END, "Accepted {} change(s), {} removal(s), {} addition(s) and {} rename(s).\n".format(*accepted))
         self.result_text.insert(tk.END, "-" * 160 + "\n")
 
         for title, items in selected_items:
-            self.result_text.insert(tk.END, f"{title}: {', '.join(items)}\n")
-            self.result_text.insert(tk.END, "-" * 160 + "\n")
+            if items:
+                self.result_text.insert(tk.END, f"{title}:\n" + "".join(f"    {item}\n" for item in items))
+                self.result_text.insert(tk.END, "-" * 160 + "\n")
     
 
     def verify_changes(self):
-        """Method to handle the Verify Changes button click."""
-        
-        #sorting files according to their integrity
-        changed = list()
-        removed = list()
-        not_changed = list()
-        
-        for file_path in self.files_to_check:
-            #checking if file_path in files_to_check is not in os.path, which means file is moved or deleted
-            if not os.path.isfile(file_path):
-                #self.result_text.insert(tk.END, f"Removed: {file_path}\n", "removed")
-                removed.append(file_path)
-            
-            #if file path is present in OS then checking if hash is same
-            else:
-                #if hash is not same
-                if not self.check_hash(file_path):
-                    #self.result_text.insert(tk.END, f"File Changed: {file_path}\n", "changed")
-                    changed.append(file_path)
-                
-                #if hash is same
-                else:
-                    #self.result_text.insert(tk.END, f"no changes: {file_path}\n", "not_changed")
-                    not_changed.append(file_path)
-                            
-        # Example data for verification (can be replaced with actual logic)
-        titles_and_elements = list()
-        if changed:
-            titles_and_elements.append(('changed', changed))
-        if removed:
-            titles_and_elements.append(('removed', removed))
-        
-        if titles_and_elements:
-            self.select_items_from_lists(titles_and_elements)
-        else:
-            messagebox.showinfo("Nothing to Verify", "There is no file change to verify.")
-        
-    #compute hash and add file to baseline_hashes
-    def save_baseline(self, file_path):
-        file_hash = self.compute_file_hash(file_path)
-        
-        #normalisig file path to have consistency in file path formats
-        normalise_file_path = self.normalise_file_path(file_path)
-        
-        #creating dictionary to add in baseline_hashes file
-        data = {normalise_file_path: file_hash}
-        self.append_to_baseline_hashes(data)
-                
-        #adding to baseline_hashes dictionary for real time consistency
-        self.baseline_hashes[normalise_file_path] = file_hash
-        
-        #adding to files_to_check to keep track of what files to check
-        self.files_to_check.add(normalise_file_path)
-
-    def load_baseline(self, file_path):
-        # Load from file or database
-        self.saved_hash = self.baseline_hashes[file_path]
-        return self.saved_hash
+        """Method to handle the Verify Changes button click.
 
-    def check_hash(self, file_path):
-        saved_hash = self.load_baseline(file_path)
-        current_hash = self.compute_file_hash(file_path)
-        if current_hash == saved_hash:
-            return True
+        The results of the last completed check are reused, without one a check is started in the background
+        and the review opens once it has finished.
+        """
+        results = self.check_results
+        if results is None:
+            self.check_integrity()
+            self.verify_after_check = self.scan_thread is not None and self.scan_thread.is_alive()
+            return
+        
+        if any(results[status] for status in (SCAN_CHANGED, SCAN_REMOVED, SCAN_ADDED, SCAN_RENAMED)):
+            self.select_items_from_lists(results)
         else:
-            return False
+            messagebox.showinfo("Nothing to Verify", "There is no file change to verify.")
         
     def show_hashes(self):
         self.result_text.delete(1.0, tk.END)
@@ -340,7 +474,8 @@ class FileIntegrityCheckerApp:
         self.result_text.insert(tk.END, f"{'Files':^{76}} {'Hashes':^{60}}\n")
         self.result_text.insert(tk.END, "-"*154 + "\n")
         row_alternator=0
-        for file_path, file_hash in self.baseline_hashes.items():
+        for file_path, record in self.baseline_hashes.items():
+            file_hash = record_hash(record)
             if row_alternator == 0:
                 self.result_text.insert(tk.END, "{:<76} {:<60}\n".format(file_path, file_hash), "evenRow")
                 row_alternator = 1
@@ -350,153 +485,21 @@ class FileIntegrityCheckerApp:
         self.result_text.insert(tk.END, "\n\n")
     
         
-    def add_folder_to_added_folders(self, folder):
-        self.added_folders.add(folder)
-
-    def add_file_to_added_files(self, file):
-        self.added_files.add(file)
-        
-    def normalise_file_path(self, file_path):
-        return os.path.normpath(file_path)
-         
-    def create_baseline_file(self):
-        """
-        Checks if 'baseline_hashes.txt' exists in the specified directory.
-        Creates the file if it doesn't exist.
-        """
-
-        #file_path = "C:\Program Files\FIC\baseline\baseline_hashes.txt"
-        os.makedirs(os.path.dirname(self.baseline_file_path), exist_ok=True)
-
-        if not os.path.exists(self.baseline_file_path):
-            try:
-                with open(self.baseline_file_path, 'w') as f:
-                    json.dump({}, f)
-                print(f"Created empty baseline_hashes.json file at {self.baseline_file_path}")
-            except OSError as e:
-                print(f"Error creating baseline_hashes.json file: {e}")
-        else:
-            print(f"baseline_hashes.json file already exists at {self.baseline_file_path}")
-            
-    
-    #update data in baseline_hashes file
-    def append_to_baseline_hashes(self, data):
-        """Updates the baseline_hashes file with the given data.
-
-      Args:
-          data (dict): The data to update or add to the baseline hashes.
-    """
-        try:
-            with open(self.baseline_file_path, 'r+') as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = {}
-
-                existing_data.update(data)
-                f.seek(0)
-                json.dump(existing_data, f, indent=4)
-        except FileNotFoundError:
-            print(f"Baseline file not found: {self.baseline_file_path}")
-        except OSError as e:
-            print(f"Error updating baseline hashes: {e}")
-
-
-    #function to retrieve data from baseline_hashesh
-    def retrieve_data_from_baseline_hashes(self):
-        """Retrieves data from the baseline_hashes.json file.
-
-      Args:
-          None
-
-      Returns:
-          dict: The data from the baseline_hashes.json file.
-          """
-
-        try:
-            with open(self.baseline_file_path , 'r') as f:
-                data = json.load(f)
-                return data
-        except FileNotFoundError:
-            print(f"Baseline file not found: {self.baseline_file_path}")
-            return {}
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON data in {self.baseline_file_path}")
-            return {}
+    def run(self):
+            self.root.mainloop()
 
-    def update_baseline_hashes(self, operation, file_name, new_name=None, new_hash=None):
-        """
-        Update the baseline_hashes.json file.
-    
-        Args:
-            operation (str): The operation to perform ('remove', 'rename', 'change').
-            file_name (str): The name of the file to update.
-            new_name (str, optional): The new name for the file if renaming.
-            new_hash (str, optional): The new hash value for the file if changing the hash.
-    
-        Raises:
-            ValueError: If an invalid operation is provided.
-        """
-        try:
-            with open(self.baseline_file_path, 'r+') as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = {}
-    
-                if operation == 'remove':
-                    if file_name in existing_data:
-                        del existing_data[file_name]
-                        
-                        #remove file name from files_to_check list
-                        self.files_to_check.remove(file_name)
-                        print(f"Deleted {file_name} from baseline hashes.")
-                    else:
-                        print(f"{file_name} not found in baseline hashes.")
-                
-                elif operation == 'rename':
-                    if file_name in existing_data:
-                        if new_name is not None:
-                            existing_data[new_name] = existing_data.pop(file_name)
-                            print(f"Renamed {file_name} to {new_name}.")
-                        else:
-                            print("New name must be provided for renaming.")
-                    else:
-                        print(f"{file_name} not found in baseline hashes.")
-                
-                elif operation == 'change':
-                    if file_name in existing_data:
-                        if new_hash is not None:
-                            existing_data[file_name] = new_hash
-                            
-                            #update baseline_hash list too
-                            self.baseline_hashes[file_name] = new_hash
-                            print(f"Changed hash for {file_name}.")
-                        else:
-                            print("New hash value must be provided for changing hash.")
-                    else:
-                        print(f"{file_name} not found in baseline hashes.")
-                
-                else:
-                    raise ValueError("Invalid operation. Use 'delete', 'rename', or 'change'.")
-    
-                f.seek(0)
-                json.dump(existing_data, f, indent=4)
-                f.truncate()  # Ensure the file size is updated
-    
-        except FileNotFoundError:
-            print(f"Baseline file not found: {self.baseline_file_path}")
-        except OSError as e:
-            print(f"Error updating baseline hashes: {e}")
 
+#only start the GUI when run as a script, so importing FIC (rt_file_monitoring, process pool workers) does not open a window
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IntegriSecure file integrity checker")
+    parser.add_argument('--data-dir', help="folder holding the baseline (default: $FIC_DATA_DIR or the platform's data folder)")
+    args = parser.parse_args()
 
-    def run(self):
-            self.root.mainloop()
-# Create the main window
-root = tk.Tk()
+    # Create the main window
+    root = tk.Tk()
 
-# Create the application instance
-app = FileIntegrityCheckerApp(root)
+    # Create the application instance
+    app = FileIntegrityCheckerApp(root, data_dir=args.data_dir)
 
-# Run the application
-app.run()
+    # Run the application
+    app.run()
@@ -0,0 +1,119 @@
+import os
+import stat
+from collections import namedtuple
+
+#algorithm of records written before the algorithm was stored per entry
+LEGACY_ALGORITHM = 'sha256'
+
+
+#stat fields stored next to the hash, a file whose fields all match is treated as unchanged in quick checks
+STAT_FIELDS = ('size', 'mtime_ns', 'inode', 'ctime_ns')
+
+#the parts of an os.stat result a scan keeps for files waiting to be hashed, st_dev groups hardlinks
+FileStat = namedtuple('FileStat', ('st_size', 'st_mtime_ns', 'st_ino', 'st_ctime_ns', 'st_dev'))
+
+
+def make_record(file_hash, stat_result, algorithm=LEGACY_ALGORITHM, fast_hash=None, fast_algorithm=None):
+    """Build a baseline record from a hash and the os.stat result taken before hashing.
+
+    fast_hash is an optional non-cryptographic prefilter hash checked before the main hash.
+    """
+    record = {'hash': file_hash, 'algorithm': algorithm}
+    record.update(stat_fields(stat_result))
+    if fast_algorithm is not None:
+        record['fast_hash'] = fast_hash
+        record['fast_algorithm'] = fast_algorithm
+    return record
+
+
+def stat_fields(stat_result):
+    """Return the STAT_FIELDS of an os.stat result as a dict."""
+    return {
+        'size': stat_result.st_size,
+        'mtime_ns': stat_result.st_mtime_ns,
+        'inode': stat_result.st_ino,
+        'ctime_ns': stat_result.st_ctime_ns,
+    }
+
+
+def file_stat(stat_result):
+    """Return the FileStat of an os.stat result, a fraction of its memory and usable wherever the fields are read."""
+    return FileStat(stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_ctime_ns,
+                    stat_result.st_dev)
+
+
+def refresh_record(record, stat_result, fast_hash=None, fast_algorithm=None):
+    """Copy of a record with new stat fields and, if given, a new prefilter hash. The main hash is kept."""
+    if isinstance(record, dict):
+        refreshed = dict(record)
+    else:
+        refreshed = {'hash': record, 'algorithm': LEGACY_ALGORITHM}
+    refreshed.update(stat_fields(stat_result))
+    if fast_algorithm is not None:
+        refreshed['fast_hash'] = fast_hash
+        refreshed['fast_algorithm'] = fast_algorithm
+    return refreshed
+
+
+def record_hash(record):
+    """Return the hash of a baseline record.
+
+    Older baselines store the bare hex digest instead of a record dict.
+    """
+    if isinstance(record, dict):
+        return record.get('hash')
+    return record
+
+
+def record_algorithm(record):
+    """Return the hash algorithm of a baseline record."""
+    if isinstance(record, dict):
+        return record.get('algorithm', LEGACY_ALGORITHM)
+    return LEGACY_ALGORITHM
+
+
+def record_size(record):
+    """Return the file size saved in a record, None for legacy records without stat data."""
+    if isinstance(record, dict):
+        return record.get('size')
+    return None
+
+
+def record_fast_hash(record, fast_algorithm):
+    """Return the prefilter hash of a record if it was made with fast_algorithm, else None."""
+    if isinstance(record, dict) and record.get('fast_algorithm') == fast_algorithm:
+        return record.get('fast_hash')
+    return None
+
+
+def record_chunks(record):
+    """Return (chunk_size, chunk leaves) of a chunked (Merkle) record, or None for a whole-file record."""
+    if isinstance(record, dict) and 'chunk_size' in record:
+        return record['chunk_size'], record.get('chunks', [])
+    return None
+
+
+def record_merkle_version(record):
+    """Return the Merkle tree version of a chunked record, records from before versions were stored are version 1."""
+    if isinstance(record, dict):
+        return record.get('merkle_version', 1)
+    return 1
+
+
+def stat_unchanged(record, stat_result):
+    """Check if a file's current stat matches the one saved in its baseline record."""
+    if not isinstance(record, dict):
+        return False
+    current = stat_fields(stat_result)
+    return all(field in record and record[field] == current[field] for field in STAT_FIELDS)
+
+
+def stat_regular_file(file_path):
+    """Return the os.stat result of file_path, or None if it is missing or not a regular file."""
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    return stat_result
@@ -0,0 +1,555 @@
+import hashlib
+import hmac
+import json
+import os
+import time
+
+#optional, only needed for Ed25519 keys
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+except ImportError:
+    serialization = None
+
+
+#the tree is built with about this many entries per leaf, its depth (levels below the root) follows
+#from the baseline size at that time and stays until the next rebuild
+ENTRIES_PER_LEAF = 8
+MIN_DEPTH = 4
+MAX_DEPTH = 24
+#builds and full verifications work through the tree one subtree of this level at a time,
+#so their memory is bounded by a 2 ** -CHUNK_LEVEL share of the baseline
+CHUNK_LEVEL = 6
+#a full verification rebuilds the leaves of about this many records at a time, one pass over the baseline each
+VERIFY_PASS_ENTRIES = 1000000
+SEAL_SCHEMES = ('hmac-sha256', 'ed25519')
+#version 2 seals also cover SEALED_META
+SEAL_VERSION = 2
+#store meta sealed along with the records, with the value of an unset key: a changed folder list
+#or exclude glob would quietly stop files from being monitored
+SEALED_META = {'added_folders': [], 'folder_filters': {}}
+#tree entries of SEALED_META are named with this prefix, no file path starts with a NUL character
+META_ENTRY_PREFIX = "\x00meta:"
+#stored entries of a leaf: path digest followed by entry digest
+ENTRY_SIZE = 64
+
+#canonical JSON of an entry, one encoder for every entry instead of json.dumps setting one up per call
+_encode_entry = json.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
+
+
+class SealError(Exception):
+    """The baseline does not match its signature, or it can not be signed with the key at hand."""
+
+
+class HmacSigner:
+    """Shared secret key. Anyone who can verify can also sign, so the key file must be kept away from the baseline."""
+
+    scheme = 'hmac-sha256'
+
+    def __init__(self, key):
+        self.key = key
+        #identifies the key without revealing it
+        self.key_id = hashlib.sha256(b"integrisecure-key-id" + key).hexdigest()[:16]
+
+    def can_sign(self):
+        return True
+
+    def sign(self, message):
+        return hmac.new(self.key, message, hashlib.sha256).hexdigest()
+
+    def cache_key(self):
+        return hmac.new(self.key, b"integrisecure-cache-key", hashlib.sha256).digest()
+
+    def verify(self, message, signature):
+        return hmac.compare_digest(self.sign(message), signature)
+
+
+class Ed25519Signer:
+    """Ed25519 key pair. With only the public key the baseline can be verified but not changed."""
+
+    scheme = 'ed25519'
+    read_only = "Only the public key was given, the baseline can be verified but not changed."
+
+    def __init__(self, private_key=None, public_key=None):
+        self.private_key = private_key
+        self.public_key = public_key or private_key.public_key()
+        raw = self.public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        self.key_id = hashlib.sha256(raw).hexdigest()[:16]
+
+    def can_sign(self):
+        return self.private_key is not None
+
+    def sign(self, message):
+        if self.private_key is None:
+            raise SealError(self.read_only)
+        return self.private_key.sign(message).hex()
+
+    def cache_key(self):
+        #only the holder of the private key writes scan caches, with the public key they are not trusted
+        if self.private_key is None:
+            return None
+        raw = self.private_key.private_bytes(serialization.Encoding.Raw, serialization.PrivateFormat.Raw,
+                                             serialization.NoEncryption())
+        return hashlib.sha256(b"integrisecure-cache-key" + raw).digest()
+
+    def verify(self, message, signature):
+        try:
+            self.public_key.verify(bytes.fromhex(signature), message)
+        except (InvalidSignature, ValueError):
+            return False
+        return True
+
+
+class MissingKeySigner:
+    """Key of a sealed baseline opened without one. Nothing verifies and nothing can be signed, so every write is refused."""
+
+    read_only = "The baseline is sealed and no seal key was given, it can not be changed without the key."
+
+    def __init__(self, state):
+        self.scheme = state.get('scheme')
+        self.key_id = state.get('key_id')
+
+    def can_sign(self):
+        return False
+
+    def sign(self, message):
+        raise SealError(self.read_only)
+
+    def cache_key(self):
+        return None
+
+    def verify(self, message, signature):
+        return False
+
+
+def load_signer(key_path):
+    """Signer for a key file: a PEM Ed25519 private or public key, anything else is an HMAC key."""
+    with open(key_path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(b"-----BEGIN"):
+        return HmacSigner(data.strip())
+    if serialization is None:
+        raise ValueError("Ed25519 keys need the cryptography package.")
+    if b"PUBLIC KEY" in data.split(b"\n", 1)[0]:
+        public_key = serialization.load_pem_public_key(data)
+        if not isinstance(public_key, Ed25519PublicKey):
+            raise ValueError(f"{key_path} is not an Ed25519 key.")
+        return Ed25519Signer(public_key=public_key)
+    private_key = serialization.load_pem_private_key(data, password=None)
+    if not isinstance(private_key, Ed25519PrivateKey):
+        raise ValueError(f"{key_path} is not an Ed25519 key.")
+    return Ed25519Signer(private_key)
+
+
+def generate_key(key_path, scheme='hmac-sha256'):
+    """Write a new key to key_path, readable by its owner only. Ed25519 also writes the public key to key_path.pub."""
+    if scheme not in SEAL_SCHEMES:
+        raise ValueError(f"Invalid seal scheme '{scheme}'. Use one of {', '.join(SEAL_SCHEMES)}.")
+    if scheme == 'hmac-sha256':
+        keys = {key_path: os.urandom(32).hex().encode('ascii') + b"\n"}
+    else:
+        if serialization is None:
+            raise ValueError("Ed25519 keys need the cryptography package.")
+        private_key = Ed25519PrivateKey.generate()
+        keys = {
+            key_path: private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                                serialization.NoEncryption()),
+            key_path + ".pub": private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                                     serialization.PublicFormat.SubjectPublicKeyInfo),
+        }
+    for path, data in keys.items():
+        #O_EXCL, an existing key is never overwritten. The public key may be handed out
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644 if path.endswith(".pub") else 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+    return key_path
+
+
+def meta_entry(key, value):
+    """(entry path, record) of a SEALED_META key in the tree."""
+    return META_ENTRY_PREFIX + key, {'value': value}
+
+
+def meta_entries(get_meta):
+    """Tree entries (entry path -> record) of every SEALED_META key, values are read with get_meta(key, default)."""
+    return dict(meta_entry(key, get_meta(key, default)) for key, default in SEALED_META.items())
+
+
+def _node_hash(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _leaf_hash(entries):
+    return hashlib.sha256(b"\x00" + entries).digest()
+
+
+class MerkleSeal:
+    """Signed Merkle tree over the baseline entries.
+
+    Every entry goes to one of 2 ** depth buckets by the digest of its path. A leaf holds the
+    (path digest, entry digest) pairs of its bucket, an inner node the hash of its two children,
+    and only the root is signed. Nodes of empty subtrees are not stored at all.
+
+    Nodes are numbered like a binary heap (root 1, children 2n and 2n + 1, leaves from 2 ** depth)
+    and read and written through the load(kind, keys) and put(kind, items) callbacks of the store,
+    kind is 'leaf' (bucket -> packed pairs) or 'node' (node id -> hash), a None item deletes.
+
+    Changing k entries rehashes k leaves and their k * depth ancestors, checking k entries reads
+    the same path of nodes, and opening a sealed baseline only checks the signature of the root.
+    """
+
+    def __init__(self, signer, depth=MIN_DEPTH):
+        self.signer = signer
+        #authenticates the scan caches (checkpoint, folder states, partial chunk hashes), None trusts none of them
+        self.cache_key = signer.cache_key()
+        #set once the signed root did not verify, from then on only build() may sign again,
+        #signing an update on top of a tampered tree would make the tampering look legitimate
+        self.problem = None
+        self.set_depth(depth)
+
+    def set_depth(self, depth):
+        if not 1 <= depth <= 32:
+            raise ValueError("The Merkle depth must be between 1 and 32.")
+        self.depth = depth
+        self.chunk_level = min(CHUNK_LEVEL, depth)
+        #hash of an empty subtree per level
+        self.empty = [b""] * (depth + 1)
+        self.empty[depth] = _leaf_hash(b"")
+        for level in range(depth - 1, -1, -1):
+            self.empty[level] = _node_hash(self.empty[level + 1], self.empty[level + 1])
+
+    @staticmethod
+    def depth_for(count):
+        """Depth giving about ENTRIES_PER_LEAF entries per leaf for a baseline of count entries."""
+        return min(MAX_DEPTH, max(MIN_DEPTH, (count // ENTRIES_PER_LEAF).bit_length()))
+
+    @staticmethod
+    def path_digest(file_path):
+        return hashlib.sha256(file_path.encode('utf-8', 'surrogateescape')).digest()
+
+    @staticmethod
+    def entry_digest(file_path, record):
+        #the same record reads back from every store and from CompactBaseline: bare legacy hashes
+        #become records and fields without a value are left out
+        if not isinstance(record, dict):
+            record = {'hash': record}
+        record = {key: value for key, value in record.items() if value is not None}
+        data = _encode_entry([file_path, record])
+        return hashlib.sha256(data.encode('utf-8', 'surrogateescape')).digest()
+
+    def cache_mac(self, kind, name, value):
+        """MAC of the scan cache entry value of name, the 'mac' field itself left out. None without a key that can write."""
+        if self.cache_key is None:
+            return None
+        data = _encode_entry([kind, name, {key: item for key, item in value.items() if key != 'mac'}])
+        return hmac.new(self.cache_key, data.encode('utf-8', 'surrogateescape'), hashlib.sha256).hexdigest()
+
+    def seal_cache(self, kind, name, value):
+        """value with its MAC in 'mac', ready to be stored."""
+        return {**value, 'mac': self.cache_mac(kind, name, value)}
+
+    def cache_trusted(self, kind, name, value):
+        """Check that a scan cache entry was written with the seal key, a forged one could hide a change."""
+        mac = self.cache_mac(kind, name, value)
+        return mac is not None and isinstance(value.get('mac'), str) and hmac.compare_digest(mac, value['mac'])
+
+    def bucket(self, path_digest):
+        return int.from_bytes(path_digest[:4], 'big') >> (32 - self.depth)
+
+    def leaf_id(self, bucket):
+        return (1 << self.depth) + bucket
+
+    def level(self, node_id):
+        return node_id.bit_length() - 1
+
+    @staticmethod
+    def unpack(entries):
+        return {entries[i:i + 32]: entries[i + 32:i + ENTRY_SIZE] for i in range(0, len(entries or b""), ENTRY_SIZE)}
+
+    @staticmethod
+    def pack(entries):
+        return b"".join(path_digest + entries[path_digest] for path_digest in sorted(entries))
+
+    def message(self, root, version=SEAL_VERSION):
+        return f"integrisecure-baseline-seal:v{version}:{self.depth}:{root.hex()}".encode('ascii')
+
+    def sign(self, root):
+        """The seal state kept in the store's meta: the signed root and what it was signed with."""
+        return {'version': SEAL_VERSION, 'scheme': self.signer.scheme, 'key_id': self.signer.key_id, 'depth': self.depth,
+                'root': root.hex(), 'signature': self.signer.sign(self.message(root)), 'signed': time.time()}
+
+    def _child(self, node_id, hashes, stored):
+        node = hashes.get(node_id)
+        if node is None:
+            node = stored.get(node_id, self.empty[self.level(node_id)])
+        return node
+
+    def _propagate(self, hashes, load, top_level=0):
+        """Recompute the ancestors of the nodes in hashes up to top_level, reading untouched siblings with load."""
+        level_ids = set(hashes)
+        for level in range(self.depth, top_level, -1):
+            siblings = [node_id ^ 1 for node_id in level_ids if node_id ^ 1 not in hashes]
+            stored = load('node', siblings) if siblings else {}
+            parents = {node_id >> 1 for node_id in level_ids}
+            for parent in parents:
+                hashes[parent] = _node_hash(self._child(2 * parent, hashes, stored), self._child(2 * parent + 1, hashes, stored))
+            level_ids = parents
+        return hashes
+
+    def _storable(self, hashes):
+        #empty subtrees are implied, their nodes are deleted rather than stored
+        return {node_id: (None if node == self.empty[self.level(node_id)] else node) for node_id, node in hashes.items()}
+
+    def apply(self, changes, load, put):
+        """Update the tree for changes (file path -> new record, or None for a removed entry). Returns the new seal state."""
+        if not self.signer.can_sign():
+            raise SealError(self.signer.read_only)
+        if self.problem is not None:
+            raise SealError(f"{self.problem} Check the baseline and rebuild the seal before changing it.")
+        by_bucket = dict()
+        for file_path, record in changes.items():
+            path_digest = self.path_digest(file_path)
+            by_bucket.setdefault(self.bucket(path_digest), {})[path_digest] = \
+                None if record is None else self.entry_digest(file_path, record)
+
+        stored = load('leaf', list(by_bucket))
+        leaves = dict()
+        hashes = dict()
+        for bucket, updates in by_bucket.items():
+            entries = self.unpack(stored.get(bucket))
+            for path_digest, entry_digest in updates.items():
+                if entry_digest is None:
+                    entries.pop(path_digest, None)
+                else:
+                    entries[path_digest] = entry_digest
+            packed = self.pack(entries)
+            leaves[bucket] = packed or None
+            hashes[self.leaf_id(bucket)] = _leaf_hash(packed)
+
+        self._propagate(hashes, load)
+        #signed before anything is written, so a failed signature leaves the stored tree untouched
+        state = self.sign(hashes[1])
+        put('leaf', leaves)
+        put('node', self._storable(hashes))
+        return state
+
+    def _chunks(self, file_paths):
+        #file paths grouped by the subtree of level chunk_level they fall into
+        shift = self.depth - self.chunk_level
+        chunks = dict()
+        for file_path in file_paths:
+            chunks.setdefault(self.bucket(self.path_digest(file_path)) >> shift, []).append(file_path)
+        return chunks
+
+    def build(self, file_paths, records, put, extra=None):
+        """Build the whole tree for records (file path -> record) and extra entries into an empty store. Returns the seal state."""
+        if not self.signer.can_sign():
+            raise SealError(self.signer.read_only)
+        extra = extra or {}
+        file_paths = list(file_paths) + list(extra)
+        records = _Overlay(records, extra)
+        self.set_depth(self.depth_for(len(file_paths)))
+        no_nodes = lambda kind, keys: {}
+        chunk_roots = dict()
+        for chunk, chunk_paths in sorted(self._chunks(file_paths).items()):
+            leaves = dict()
+            for file_path in chunk_paths:
+                path_digest = self.path_digest(file_path)
+                leaves.setdefault(self.bucket(path_digest), {})[path_digest] = self.entry_digest(file_path, records[file_path])
+            packed = {bucket: self.pack(entries) for bucket, entries in leaves.items()}
+            hashes = {self.leaf_id(bucket): _leaf_hash(entries) for bucket, entries in packed.items()}
+            self._propagate(hashes, no_nodes, self.chunk_level)
+            put('leaf', packed)
+            put('node', {node_id: node for node_id, node in self._storable(hashes).items() if node is not None
+                         and self.level(node_id) > self.chunk_level})
+            chunk_root = (1 << self.chunk_level) + chunk
+            chunk_roots[chunk_root] = hashes[chunk_root]
+
+        hashes = self._nodes_above_chunks(chunk_roots)
+        put('node', {node_id: node for node_id, node in self._storable(hashes).items() if node is not None})
+        self.problem = None
+        return self.sign(hashes[1])
+
+    def verify_root(self, state, load):
+        """Check the signature of the root. Returns a description of the problem, or None if the seal is valid."""
+        if state is None:
+            return "The baseline is not sealed."
+        if state.get('scheme') != self.signer.scheme or state.get('key_id') != self.signer.key_id:
+            return f"The baseline was sealed with another key ({state.get('scheme')} key {state.get('key_id')})."
+        if state.get('version', 1) > SEAL_VERSION:
+            return f"The baseline was sealed by a newer version of IntegriSecure (seal version {state['version']})."
+        root = bytes.fromhex(state['root'])
+        if not self.signer.verify(self.message(root, state.get('version', 1)), state['signature']):
+            return "The signature of the baseline does not match, the baseline was changed outside IntegriSecure."
+        if load('node', [1]).get(1, self.empty[0]) != root:
+            return "The Merkle tree of the baseline does not match its signed root."
+        return None
+
+    def verify(self, file_paths, records, load, state):
+        """Check the records of file_paths against the signed tree.
+
+        Every record must be in its leaf, every leaf and inner node on the way up must match the
+        hash of its children and the root must carry a valid signature.
+
+      Returns:
+          list: the file paths whose record does not match the sealed baseline.
+
+      Raises:
+          SealError: if the root itself is not validly signed, then no entry can be trusted.
+          """
+        problem = self.verify_root(state, load)
+        if problem is not None:
+            self.problem = problem
+            raise SealError(problem)
+
+        tampered = list()
+        #node id -> whether it matches its children (a leaf: its entries), ancestors shared by many buckets are checked once
+        checked = dict()
+        for chunk_paths in self._chunks(file_paths).values():
+            by_bucket = dict()
+            for file_path in chunk_paths:
+                by_bucket.setdefault(self.bucket(self.path_digest(file_path)), []).append(file_path)
+            stored_leaves = load('leaf', list(by_bucket))
+
+            needed = set()
+            for bucket in by_bucket:
+                node_id = self.leaf_id(bucket)
+                while node_id > 1:
+                    needed.update((node_id, node_id ^ 1))
+                    node_id >>= 1
+            needed.add(1)
+            stored = load('node', needed)
+
+            for bucket, bucket_paths in by_bucket.items():
+                leaf_id = self.leaf_id(bucket)
+                entries = stored_leaves.get(bucket, b"")
+                checked[leaf_id] = _leaf_hash(entries) == self._child(leaf_id, {}, stored)
+                trusted = checked[leaf_id]
+                node_id = leaf_id >> 1
+                while node_id >= 1:
+                    if node_id not in checked:
+                        expected = _node_hash(self._child(2 * node_id, {}, stored), self._child(2 * node_id + 1, {}, stored))
+                        checked[node_id] = expected == self._child(node_id, {}, stored)
+                    trusted = trusted and checked[node_id]
+                    node_id >>= 1
+
+                unpacked = self.unpack(entries)
+                for file_path in bucket_paths:
+                    if not trusted or unpacked.get(self.path_digest(file_path)) != self.entry_digest(file_path, records[file_path]):
+                        tampered.append(file_path)
+            #nodes below the chunk level belong to this chunk only
+            checked = {node_id: matches for node_id, matches in checked.items() if self.level(node_id) <= self.chunk_level}
+        return tampered
+
+    def _nodes_above_chunks(self, chunk_roots):
+        #the levels above the chunks, their children are all in chunk_roots or empty
+        hashes = dict(chunk_roots)
+        for level in range(self.chunk_level, 0, -1):
+            parents = {node_id >> 1 for node_id in hashes if self.level(node_id) == level}
+            for parent in parents:
+                hashes[parent] = _node_hash(self._child(2 * parent, hashes, {}), self._child(2 * parent + 1, hashes, {}))
+        hashes.setdefault(1, self.empty[0])
+        return hashes
+
+    def _root_above_chunks(self, chunk_roots):
+        return self._nodes_above_chunks(chunk_roots)[1]
+
+    def verify_all(self, records, load, load_range, state, extra=None):
+        """Check the whole baseline against the signed tree, also for records that were deleted.
+
+        The leaves are rebuilt from records (file path -> record) and the entries of extra (see
+        meta_entries) and compared with the stored leaves,
+        whose hashes must lead up to the signed root. Records that differ from their stored entry or
+        have none are tampered; stored entries without a record were deleted from the baseline, only
+        the digest of their path is known. The records are read in passes over VERIFY_PASS_ENTRIES of
+        them, load_range(kind, first, last) returns the stored entries with first <= key < last.
+
+      Returns:
+          tuple: (tampered file paths, set of the path digests of deleted records)
+
+      Raises:
+          SealError: if the root itself is not validly signed, or the stored tree does not lead to it.
+          """
+        problem = self.verify_root(state, load)
+        if problem is not None:
+            self.problem = problem
+            raise SealError(problem)
+
+        records = _Overlay(records, extra or {})
+        shift = self.depth - self.chunk_level
+        chunks = 1 << self.chunk_level
+        per_pass = -(-chunks // max(1, min(chunks, -(-len(records) // VERIFY_PASS_ENTRIES))))
+        #chunk root id -> hash of the stored leaves below it
+        chunk_roots = dict()
+        #bucket -> stored entries, only for buckets whose records do not rebuild their stored leaf
+        suspects = dict()
+        deleted = set()
+        for first in range(0, chunks, per_pass):
+            last = min(chunks, first + per_pass)
+            rebuilt = dict()
+            for file_path in records:
+                path_digest = self.path_digest(file_path)
+                bucket = self.bucket(path_digest)
+                if first <= bucket >> shift < last:
+                    record = records.get(file_path)
+                    if record is not None:
+                        rebuilt.setdefault(bucket, bytearray()).extend(path_digest + self.entry_digest(file_path, record))
+            stored = load_range('leaf', first << shift, last << shift)
+            for bucket in set(stored) | set(rebuilt):
+                stored_entries = self.unpack(stored.get(bucket))
+                rebuilt_entries = self.unpack(bytes(rebuilt.get(bucket, b"")))
+                if stored_entries != rebuilt_entries:
+                    suspects[bucket] = stored_entries
+                    deleted.update(path_digest for path_digest in stored_entries if path_digest not in rebuilt_entries)
+            hashes = {self.leaf_id(bucket): _leaf_hash(entries) for bucket, entries in stored.items() if entries}
+            self._propagate(hashes, lambda kind, keys: {}, self.chunk_level)
+            chunk_roots.update((node_id, node) for node_id, node in hashes.items() if self.level(node_id) == self.chunk_level)
+
+        #stored leaves that hash up to the signed root are authentic, a chunk whose leaves do not is trusted in nothing
+        untrusted = set()
+        root = bytes.fromhex(state['root'])
+        if self._root_above_chunks(chunk_roots) != root:
+            chunk_ids = [(1 << self.chunk_level) + chunk for chunk in range(chunks)]
+            stored_nodes = load('node', chunk_ids)
+            if self._root_above_chunks(stored_nodes) != root:
+                self.problem = "The Merkle tree of the baseline does not match its signed root."
+                raise SealError(self.problem)
+            untrusted = {node_id - (1 << self.chunk_level) for node_id in chunk_ids
+                         if chunk_roots.get(node_id, self.empty[self.chunk_level])
+                         != stored_nodes.get(node_id, self.empty[self.chunk_level])}
+            deleted = {path_digest for path_digest in deleted if self.bucket(path_digest) >> shift not in untrusted}
+
+        tampered = list()
+        if suspects or untrusted:
+            for file_path in records:
+                path_digest = self.path_digest(file_path)
+                bucket = self.bucket(path_digest)
+                if bucket >> shift in untrusted:
+                    tampered.append(file_path)
+                elif bucket in suspects:
+                    record = records.get(file_path)
+                    if record is not None and suspects[bucket].get(path_digest) != self.entry_digest(file_path, record):
+                        tampered.append(file_path)
+        return tampered, deleted
+
+
+class _Overlay:
+    """records with the entries of extra on top, read the way the tree reads them without copying records."""
+
+    def __init__(self, records, extra):
+        self.records = records
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.records) + len(self.extra)
+
+    def __iter__(self):
+        yield from self.records
+        yield from self.extra
+
+    def __getitem__(self, file_path):
+        return self.extra[file_path] if file_path in self.extra else self.records[file_path]
+
+    def get(self, file_path):
+        return self.extra[file_path] if file_path in self.extra else self.records.get(file_path)
@@ -0,0 +1,355 @@
+import gzip
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from operator import itemgetter
+
+
+#entries sorted in memory before they are written out as one run, this bounds the memory of
+#taking a snapshot and of the rename pass of a diff, whatever the number of files
+RUN_ENTRIES = 200000
+#gzip level of the run files, higher levels cost a lot of time for a few percent
+COMPRESS_LEVEL = 5
+SNAPSHOT_VERSION = 1
+META_NAME = "snapshot.json"
+#a snapshot is written under this suffix and renamed once complete, a crash leaves no half snapshot behind
+PARTIAL_SUFFIX = ".partial"
+
+#statuses yielded by diff_snapshots, the same names as the statuses of a scan
+DIFF_CHANGED = 'changed'
+DIFF_REMOVED = 'removed'
+DIFF_ADDED = 'added'
+DIFF_RENAMED = 'renamed'
+
+#one encoder for every entry instead of json.dumps setting one up per call
+_encode_entry = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+_decode_entry = json.JSONDecoder().decode
+_by_path = itemgetter(0)
+
+
+def _by_content(entry):
+    #removed and added files of one content end up next to each other, the path keeps the order stable.
+    #legacy records have no size, they are grouped by digest alone
+    return entry[1], -1 if entry[2] is None else entry[2], entry[0]
+
+
+class SnapshotError(Exception):
+    """A snapshot does not exist, its name is ambiguous or its files can not be read."""
+
+
+def write_run(file_path, entries):
+    """Write already sorted entries as one gzip compressed JSON lines run. Returns the number of entries."""
+    count = 0
+    #file names that are not valid UTF-8 are kept as their bytes, the way the store keeps them
+    with gzip.open(file_path, 'wt', encoding='utf-8', errors='surrogateescape', compresslevel=COMPRESS_LEVEL) as run:
+        for entry in entries:
+            run.write(_encode_entry(entry))
+            run.write("\n")
+            count += 1
+    return count
+
+
+def read_run(file_path):
+    """Yield the entries of a run as (path, hash, size, mtime_ns) tuples, in the order they were written."""
+    with gzip.open(file_path, 'rt', encoding='utf-8', errors='surrogateescape') as run:
+        for line in run:
+            yield tuple(_decode_entry(line))
+
+
+class RunSorter:
+    """External sort: entries are sorted RUN_ENTRIES at a time into run files and merged when read back.
+
+    Memory stays at one run of entries while adding and one entry per run while merging.
+    """
+
+    def __init__(self, directory, key=_by_path, run_entries=RUN_ENTRIES, prefix="run"):
+        self.directory = directory
+        self.key = key
+        self.run_entries = run_entries
+        self.prefix = prefix
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+
+    def add(self, entry):
+        self.buffer.append(entry)
+        self.count += 1
+        if len(self.buffer) >= self.run_entries:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.sort(key=self.key)
+            run_path = os.path.join(self.directory, f"{self.prefix}-{len(self.runs):05d}.gz")
+            write_run(run_path, self.buffer)
+            self.runs.append(run_path)
+            self.buffer = []
+
+    def merged(self):
+        """Yield every added entry in key order."""
+        self.flush()
+        return heapq.merge(*(read_run(run_path) for run_path in self.runs), key=self.key)
+
+
+def entry_changed(old_entry, new_entry):
+    """Check if two entries of one path differ, by digest or by size and mtime where a digest is not known."""
+    if old_entry[1] is not None and new_entry[1] is not None:
+        return old_entry[1] != new_entry[1]
+    return old_entry[2:4] != new_entry[2:4]
+
+
+def diff_snapshots(old_entries, new_entries, spill_dir):
+    """Stream the differences between two path sorted entry streams.
+
+    A single merge pass over both streams yields the changed files in path order. Removed and added
+    files are spilled to runs sorted by digest and size, a second merge pass pairs files of the same
+    content as renames and yields them and the remaining removals and additions, in digest order.
+    Time is linear in the number of entries (plus the sort of the removed and added ones) and memory
+    is bounded by RUN_ENTRIES and the largest group of identical files that were removed or added.
+
+  Args:
+      old_entries (iterable): (path, hash, size, mtime_ns) of the older snapshot, sorted by path.
+      new_entries (iterable): The same for the newer snapshot.
+      spill_dir (str): Folder for the temporary runs of removed and added files.
+
+  Yields:
+      tuple: (status, path, old path) with status one of DIFF_CHANGED, DIFF_REMOVED, DIFF_ADDED and
+             DIFF_RENAMED, old path is only set for renames.
+      """
+    removed = RunSorter(spill_dir, _by_content, prefix="removed")
+    added = RunSorter(spill_dir, _by_content, prefix="added")
+    old_iter, new_iter = iter(old_entries), iter(new_entries)
+    old_entry, new_entry = next(old_iter, None), next(new_iter, None)
+    while old_entry is not None or new_entry is not None:
+        if new_entry is None or (old_entry is not None and old_entry[0] < new_entry[0]):
+            #files without a digest can not be matched as renames
+            if old_entry[1] is None:
+                yield DIFF_REMOVED, old_entry[0], None
+            else:
+                removed.add(old_entry)
+            old_entry = next(old_iter, None)
+        elif old_entry is None or new_entry[0] < old_entry[0]:
+            if new_entry[1] is None:
+                yield DIFF_ADDED, new_entry[0], None
+            else:
+                added.add(new_entry)
+            new_entry = next(new_iter, None)
+        else:
+            if entry_changed(old_entry, new_entry):
+                yield DIFF_CHANGED, new_entry[0], None
+            old_entry, new_entry = next(old_iter, None), next(new_iter, None)
+
+    yield from _pair_renames(removed.merged(), added.merged())
+
+
+def _content_groups(entries):
+    #consecutive entries of one (hash, size) as (key, paths)
+    key, paths = None, []
+    for entry in entries:
+        entry_key = _by_content(entry)[:2]
+        if paths and entry_key != key:
+            yield key, paths
+            paths = []
+        key = entry_key
+        paths.append(entry[0])
+    if paths:
+        yield key, paths
+
+
+def _pair_group(old_paths, new_paths):
+    #identical copies: a file that kept its name is paired first, the rest in path order
+    by_name = dict()
+    for old_path in old_paths:
+        by_name.setdefault(os.path.basename(old_path), list()).append(old_path)
+    pairs = dict()
+    for new_path in new_paths:
+        same_name = by_name.get(os.path.basename(new_path))
+        if same_name:
+            pairs[new_path] = same_name.pop(0)
+    paired = set(pairs.values())
+    unpaired_old = [old_path for old_path in old_paths if old_path not in paired]
+    unpaired_new = [new_path for new_path in new_paths if new_path not in pairs]
+    pairs.update(zip(unpaired_new, unpaired_old))
+    for new_path, old_path in pairs.items():
+        yield DIFF_RENAMED, new_path, old_path
+    for old_path in unpaired_old[len(unpaired_new):]:
+        yield DIFF_REMOVED, old_path, None
+    for new_path in unpaired_new[len(unpaired_old):]:
+        yield DIFF_ADDED, new_path, None
+
+
+def _pair_renames(removed, added):
+    #merge join of the two content sorted streams
+    removed_groups, added_groups = _content_groups(removed), _content_groups(added)
+    removed_group, added_group = next(removed_groups, None), next(added_groups, None)
+    while removed_group is not None or added_group is not None:
+        if removed_group is not None and added_group is not None and removed_group[0] == added_group[0]:
+            yield from _pair_group(removed_group[1], added_group[1])
+            removed_group, added_group = next(removed_groups, None), next(added_groups, None)
+        elif added_group is None or (removed_group is not None and removed_group[0] < added_group[0]):
+            for old_path in removed_group[1]:
+                yield DIFF_REMOVED, old_path, None
+            removed_group = next(removed_groups, None)
+        else:
+            for new_path in added_group[1]:
+                yield DIFF_ADDED, new_path, None
+            added_group = next(added_groups, None)
+
+
+class SnapshotStore:
+    """Versioned snapshots of scan results, one folder per snapshot under directory.
+
+    A snapshot holds a (path, hash, size, mtime_ns) entry for every file a scan saw, written as
+    path sorted, gzip compressed runs of RUN_ENTRIES entries plus a snapshot.json with its metadata.
+    Reading a snapshot merges its runs, compact() rewrites them as a single run.
+    Snapshot ids are the UTC time they were taken at (e.g. 20261018T120000Z), so they sort by age.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, snapshot_id):
+        return os.path.join(self.directory, snapshot_id)
+
+    def take(self, entries, label=None, **details):
+        """Write a snapshot of entries (in any order) and return its metadata.
+
+        details (scan counts, pending files) are stored in the metadata as they are.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        created = time.time()
+        snapshot_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(created))
+        suffix = 1
+        while os.path.exists(self.path(snapshot_id)) or os.path.exists(self.path(snapshot_id) + PARTIAL_SUFFIX):
+            suffix += 1
+            snapshot_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(created)) + f"-{suffix}"
+
+        partial_path = self.path(snapshot_id) + PARTIAL_SUFFIX
+        os.makedirs(partial_path)
+        try:
+            sorter = RunSorter(partial_path)
+            for entry in entries:
+                sorter.add(entry)
+            sorter.flush()
+            meta = {'version': SNAPSHOT_VERSION, 'id': snapshot_id, 'created': created, 'label': label,
+                    'entries': sorter.count, 'runs': [os.path.basename(run_path) for run_path in sorter.runs], **details}
+            self._write_meta(partial_path, meta)
+            os.replace(partial_path, self.path(snapshot_id))
+        except BaseException:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            raise
+        return meta
+
+    @staticmethod
+    def _write_meta(snapshot_path, meta):
+        temp_path = os.path.join(snapshot_path, META_NAME + ".tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, os.path.join(snapshot_path, META_NAME))
+
+    def list(self):
+        """Metadata of every complete snapshot, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        snapshots = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(PARTIAL_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, name, META_NAME)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(snapshots, key=itemgetter('created'))
+
+    def resolve(self, name):
+        """Find a snapshot by id, unique id prefix, label, 'latest', 'previous' or a local date/time.
+
+        A date or time (2026-10-13, 2026-10-13T18:00) picks the newest snapshot taken at or before it,
+        a date alone counts up to the end of that day. Returns the snapshot's metadata.
+        """
+        snapshots = self.list()
+        if not snapshots:
+            raise SnapshotError("There are no snapshots yet, take one with `check --snapshot`.")
+        if name == 'latest':
+            return snapshots[-1]
+        if name == 'previous':
+            if len(snapshots) < 2:
+                raise SnapshotError("There is only one snapshot.")
+            return snapshots[-2]
+
+        exact = [meta for meta in snapshots if meta['id'] == name]
+        if exact:
+            return exact[0]
+        matches = [meta for meta in snapshots if meta['id'].startswith(name) or meta.get('label') == name]
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            raise SnapshotError(f"'{name}' matches {len(matches)} snapshots: {', '.join(meta['id'] for meta in matches)}")
+
+        try:
+            moment = datetime.fromisoformat(name)
+        except ValueError:
+            raise SnapshotError(f"No snapshot '{name}'.") from None
+        limit = moment.timestamp() + (24 * 3600 if len(name) == 10 else 0)
+        before = [meta for meta in snapshots if meta['created'] <= limit]
+        if not before:
+            raise SnapshotError(f"No snapshot was taken before {name}.")
+        return before[-1]
+
+    def entries(self, snapshot_id):
+        """Yield the entries of a snapshot in path order, merged from its runs."""
+        snapshot_path = self.path(snapshot_id)
+        try:
+            with open(os.path.join(snapshot_path, META_NAME)) as f:
+                runs = json.load(f)['runs']
+        except (OSError, ValueError, KeyError) as e:
+            raise SnapshotError(f"Can not read snapshot {snapshot_id}: {e}") from None
+        return heapq.merge(*(read_run(os.path.join(snapshot_path, run)) for run in runs), key=_by_path)
+
+    def diff(self, old_id, new_id):
+        """Yield diff_snapshots results from the snapshot old_id to new_id."""
+        with tempfile.TemporaryDirectory(dir=self.directory, prefix="diff-") as spill_dir:
+            yield from diff_snapshots(self.entries(old_id), self.entries(new_id), spill_dir)
+
+    def compact(self, snapshot_id):
+        """Merge the runs of a snapshot into one run. Returns False if it already was a single run."""
+        snapshot_path = self.path(snapshot_id)
+        with open(os.path.join(snapshot_path, META_NAME)) as f:
+            meta = json.load(f)
+        if len(meta['runs']) <= 1:
+            return False
+        merged_name = f"compact-{int(time.time())}.gz"
+        write_run(os.path.join(snapshot_path, merged_name), self.entries(snapshot_id))
+        old_runs = meta['runs']
+        meta['runs'] = [merged_name]
+        #the metadata switches to the merged run before the old runs go, an interruption loses nothing
+        self._write_meta(snapshot_path, meta)
+        for run in old_runs:
+            os.remove(os.path.join(snapshot_path, run))
+        return True
+
+    def delete(self, snapshot_id):
+        shutil.rmtree(self.path(snapshot_id))
+
+    def prune(self, keep=None, max_age_days=None):
+        """Delete snapshots beyond the newest keep and those older than max_age_days, then compact the rest.
+
+        The newest snapshot is never deleted. Returns (ids deleted, number of snapshots compacted).
+        """
+        snapshots = self.list()
+        doomed = set()
+        if keep is not None:
+            doomed.update(meta['id'] for meta in snapshots[:max(len(snapshots) - max(keep, 1), 0)])
+        if max_age_days is not None:
+            oldest = time.time() - max_age_days * 24 * 3600
+            doomed.update(meta['id'] for meta in snapshots[:-1] if meta['created'] < oldest)
+        deleted = [meta['id'] for meta in snapshots if meta['id'] in doomed]
+        for snapshot_id in deleted:
+            self.delete(snapshot_id)
+        compacted = sum(1 for meta in snapshots if meta['id'] not in doomed and self.compact(meta['id']))
+        return deleted, compacted
@@ -0,0 +1,552 @@
+import json
+import os
+import sqlite3
+import threading
+from baseline_seal import SEALED_META, META_ENTRY_PREFIX, meta_entry, meta_entries
+
+
+#record fields that get their own column in the sqlite store, anything else goes into the extra JSON column
+RECORD_COLUMNS = ('hash', 'size', 'mtime_ns', 'inode', 'ctime_ns')
+#kind of Merkle tree entry -> (table, key column, value column) in the sqlite store
+MERKLE_TABLES = {'leaf': ('merkle_leaf', 'bucket', 'entries'), 'node': ('merkle_node', 'id', 'hash')}
+#sqlite limits the number of ? parameters of one statement
+MAX_QUERY_PARAMETERS = 900
+
+
+def _path_key(file_path):
+    """Column value of a path. File names that are not valid UTF-8 hold surrogates (PEP 383), SQLite text
+    can not take them, so those paths are stored as a BLOB of their raw bytes."""
+    if file_path.isascii():
+        return file_path
+    try:
+        file_path.encode('utf-8')
+    except UnicodeEncodeError:
+        return file_path.encode('utf-8', 'surrogateescape')
+    return file_path
+
+
+def _path_value(value):
+    """Path of a column value written by _path_key."""
+    return value.decode('utf-8', 'surrogateescape') if isinstance(value, bytes) else value
+
+
+class BaselineStore:
+    """Storage backend for baseline records (file path -> record dict).
+
+    Writes are batched: upsert_many, delete_many and apply_changes apply all of their changes at once.
+    Once a seal (baseline_seal.MerkleSeal) is set, every write also updates its signed Merkle tree,
+    and so does setting one of the meta keys in baseline_seal.SEALED_META.
+    """
+
+    seal = None
+
+    def load_all(self):
+        """Return every baseline record as a dict of file path -> record."""
+        raise NotImplementedError
+
+    def get(self, file_path):
+        """Return the record of file_path, or None if it is not in the baseline."""
+        raise NotImplementedError
+
+    def iter_all(self):
+        """Yield every (file path, record) pair without building one dict of the whole baseline first."""
+        yield from self.load_all().items()
+
+    def upsert_many(self, records):
+        """Add or replace the given records (dict of file path -> record)."""
+        raise NotImplementedError
+
+    def delete_many(self, file_paths):
+        """Remove the given file paths from the baseline."""
+        raise NotImplementedError
+
+    def apply_changes(self, records, file_paths):
+        """Add or replace records and remove file_paths in one write, either all of it is stored or nothing."""
+        raise NotImplementedError
+
+    def rename(self, old_path, new_path):
+        """Move the record of old_path to new_path. Returns False if old_path is not in the baseline."""
+        raise NotImplementedError
+
+    def paths_with_hash(self, file_hash):
+        """Return the file paths whose record has file_hash, the reverse digest -> paths index."""
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def get_meta(self, key, default=None):
+        raise NotImplementedError
+
+    def set_meta(self, key, value):
+        raise NotImplementedError
+
+    def load_dir_states(self, folder):
+        """Return the saved directory states (see file_scanner.FolderScanner) for directories under folder."""
+        raise NotImplementedError
+
+    def save_dir_states(self, folder, dir_states):
+        """Replace the directory states under folder with dir_states."""
+        raise NotImplementedError
+
+    def load_scan_checkpoint(self):
+        """Return the results (file path -> checkpoint entry) saved by an unfinished scan."""
+        raise NotImplementedError
+
+    def save_scan_checkpoint(self, results):
+        """Add results (file path -> checkpoint entry) to the scan checkpoint."""
+        raise NotImplementedError
+
+    def clear_scan_checkpoint(self, file_paths=None):
+        """Drop the given file paths from the scan checkpoint, or the whole checkpoint."""
+        raise NotImplementedError
+
+    def set_seal(self, seal):
+        """Keep the Merkle tree and signature of seal up to date on every write from now on."""
+        self.seal = seal
+
+    def load_merkle(self, kind, keys):
+        """Return the stored Merkle tree entries of kind ('leaf' or 'node') for keys, missing keys are left out."""
+        raise NotImplementedError
+
+    def load_merkle_range(self, kind, first, last):
+        """Return the stored Merkle tree entries of kind with first <= key < last."""
+        raise NotImplementedError
+
+    def reseal(self, records):
+        """Replace the Merkle tree with one built for records (file path -> record) and sign it."""
+        raise NotImplementedError
+
+    def seal_meta(self):
+        """Add the SEALED_META keys to the tree of a seal made before they were sealed, and sign it."""
+        raise NotImplementedError
+
+    def verify_seal_meta(self):
+        """Return the SEALED_META keys whose value does not match the sealed baseline."""
+        entries = meta_entries(self.get_meta)
+        return [entry[len(META_ENTRY_PREFIX):] for entry in self.verify_seal(list(entries), entries)]
+
+    def verify_seal(self, file_paths, records):
+        """Return the file paths whose record (from records) does not match the sealed baseline.
+
+        Raises baseline_seal.SealError when the signature of the root does not match.
+        """
+        return self.seal.verify(file_paths, records, self.load_merkle, self.get_meta('baseline_seal'))
+
+    def verify_seal_all(self, records):
+        """Check every record against the sealed baseline, see baseline_seal.MerkleSeal.verify_all.
+
+        Returns (tampered file paths, path digests of signed records missing from records).
+        """
+        return self.seal.verify_all(records, self.load_merkle, self.load_merkle_range, self.get_meta('baseline_seal'),
+                                    meta_entries(self.get_meta))
+
+    def close(self):
+        pass
+
+    def import_json(self, json_path):
+        """Add every record of a baseline_hashes.json file to this store. Returns the number of records."""
+        with open(json_path, 'r') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                print(f"Error decoding JSON data in {json_path}")
+                return 0
+        self.upsert_many(data)
+        return len(data)
+
+    def export_json(self, json_path):
+        """Write the store to a file in the baseline_hashes.json format. Returns the number of records."""
+        data = self.load_all()
+        temp_path = json_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, json_path)
+        return len(data)
+
+
+class JsonBaselineStore(BaselineStore):
+    """The original baseline_hashes.json file, rewritten once per batch instead of once per file."""
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.meta_path = json_path + ".meta"
+        self.checkpoint_path = json_path + ".checkpoint"
+        self.merkle_path = json_path + ".merkle"
+        self.data = self._read(self.json_path)
+        self.meta = self._read(self.meta_path)
+        self.checkpoint = self._read(self.checkpoint_path)
+        #kind -> {key: hex value}, JSON objects only have string keys
+        self.merkle = self._read(self.merkle_path) or {'leaf': {}, 'node': {}}
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            print(f"Error decoding JSON data in {path}")
+            return {}
+
+    @staticmethod
+    def _write(path, data):
+        #write to a temp file and swap it in so a crash never leaves a half written baseline
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, path)
+
+    def load_all(self):
+        return dict(self.data)
+
+    def iter_all(self):
+        #the JSON file is in memory already
+        yield from list(self.data.items())
+
+    def get(self, file_path):
+        return self.data.get(file_path)
+
+    def upsert_many(self, records):
+        if records:
+            #sealed first, a baseline that can not be signed is not changed
+            self._seal(records)
+            self.data.update(records)
+            self._write(self.json_path, self.data)
+
+    def delete_many(self, file_paths):
+        file_paths = [file_path for file_path in file_paths if file_path in self.data]
+        if file_paths:
+            self._seal(dict.fromkeys(file_paths))
+            for file_path in file_paths:
+                del self.data[file_path]
+            self._write(self.json_path, self.data)
+
+    def apply_changes(self, records, file_paths):
+        file_paths = [file_path for file_path in file_paths if file_path in self.data and file_path not in records]
+        if records or file_paths:
+            self._seal({**records, **dict.fromkeys(file_paths)})
+            self.data.update(records)
+            for file_path in file_paths:
+                del self.data[file_path]
+            self._write(self.json_path, self.data)
+
+    def rename(self, old_path, new_path):
+        if old_path not in self.data:
+            return False
+        self._seal({old_path: None, new_path: self.data[old_path]})
+        self.data[new_path] = self.data.pop(old_path)
+        self._write(self.json_path, self.data)
+        return True
+
+    def _seal(self, changes):
+        if self.seal is not None:
+            self.meta['baseline_seal'] = self.seal.apply(changes, self._load_merkle, self._put_merkle)
+            self._write(self.merkle_path, self.merkle)
+            self._write(self.meta_path, self.meta)
+
+    def _load_merkle(self, kind, keys):
+        stored = self.merkle[kind]
+        return {key: bytes.fromhex(stored[str(key)]) for key in keys if str(key) in stored}
+
+    def _put_merkle(self, kind, items):
+        stored = self.merkle[kind]
+        for key, value in items.items():
+            if value is None:
+                stored.pop(str(key), None)
+            else:
+                stored[str(key)] = value.hex()
+
+    def load_merkle(self, kind, keys):
+        return self._load_merkle(kind, keys)
+
+    def load_merkle_range(self, kind, first, last):
+        return {int(key): bytes.fromhex(value) for key, value in self.merkle[kind].items() if first <= int(key) < last}
+
+    def reseal(self, records):
+        self.merkle = {'leaf': {}, 'node': {}}
+        self.meta['baseline_seal'] = self.seal.build(list(records), records, self._put_merkle, meta_entries(self.get_meta))
+        self._write(self.merkle_path, self.merkle)
+        self._write(self.meta_path, self.meta)
+
+    def seal_meta(self):
+        self._seal(meta_entries(self.get_meta))
+
+    def paths_with_hash(self, file_hash):
+        #no index in the JSON format, a linear scan over the records
+        return [file_path for file_path, record in self.data.items()
+                if (record.get('hash') if isinstance(record, dict) else record) == file_hash]
+
+    def count(self):
+        return len(self.data)
+
+    def get_meta(self, key, default=None):
+        return self.meta.get(key, default)
+
+    def set_meta(self, key, value):
+        if key in SEALED_META:
+            self._seal(dict((meta_entry(key, value),)))
+        self.meta[key] = value
+        self._write(self.meta_path, self.meta)
+
+    def load_dir_states(self, folder):
+        return dict(self.meta.get('dir_states', {}).get(folder, {}))
+
+    def save_dir_states(self, folder, dir_states):
+        self.meta.setdefault('dir_states', {})[folder] = dir_states
+        self._write(self.meta_path, self.meta)
+
+    def load_scan_checkpoint(self):
+        return dict(self.checkpoint)
+
+    def save_scan_checkpoint(self, results):
+        if results:
+            self.checkpoint.update(results)
+            self._write(self.checkpoint_path, self.checkpoint)
+
+    def clear_scan_checkpoint(self, file_paths=None):
+        if file_paths is None:
+            self.checkpoint = {}
+        else:
+            for file_path in file_paths:
+                self.checkpoint.pop(file_path, None)
+        self._write(self.checkpoint_path, self.checkpoint)
+
+
+class SqliteBaselineStore(BaselineStore):
+    """Baseline kept in an indexed SQLite database in WAL mode.
+
+    Every upsert_many/delete_many call is a single transaction, so adding N files
+    costs N row writes instead of N rewrites of the whole baseline.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        #scans may write from a worker thread, the lock serialises access to the shared connection
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS baseline ("
+                "path TEXT PRIMARY KEY, hash TEXT, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, ctime_ns INTEGER, extra TEXT)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS baseline_hash ON baseline (hash)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS dir_state (folder TEXT, path TEXT, state TEXT, PRIMARY KEY (folder, path))"
+            )
+            self.connection.execute("CREATE TABLE IF NOT EXISTS scan_checkpoint (path TEXT PRIMARY KEY, result TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS merkle_leaf (bucket INTEGER PRIMARY KEY, entries BLOB)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS merkle_node (id INTEGER PRIMARY KEY, hash BLOB)")
+
+    @staticmethod
+    def _to_row(file_path, record):
+        #older baselines store the bare hash instead of a record
+        if not isinstance(record, dict):
+            record = {'hash': record}
+        extra = {key: value for key, value in record.items() if key not in RECORD_COLUMNS}
+        return (_path_key(file_path), *(record.get(column) for column in RECORD_COLUMNS), json.dumps(extra) if extra else None)
+
+    @staticmethod
+    def _from_row(row):
+        record = {column: value for column, value in zip(RECORD_COLUMNS, row[1:]) if value is not None}
+        if row[-1]:
+            record.update(json.loads(row[-1]))
+        return record
+
+    def load_all(self):
+        with self.lock:
+            rows = self.connection.execute(f"SELECT path, {', '.join(RECORD_COLUMNS)}, extra FROM baseline").fetchall()
+        return {_path_value(row[0]): self._from_row(row) for row in rows}
+
+    def iter_all(self, batch_size=10000):
+        with self.lock:
+            cursor = self.connection.execute(f"SELECT path, {', '.join(RECORD_COLUMNS)}, extra FROM baseline")
+        while True:
+            #the lock is only held per batch so other threads can use the connection in between
+            with self.lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield _path_value(row[0]), self._from_row(row)
+
+    def get(self, file_path):
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT path, {', '.join(RECORD_COLUMNS)}, extra FROM baseline WHERE path = ?", (_path_key(file_path),)
+            ).fetchone()
+        return self._from_row(row) if row else None
+
+    def upsert_many(self, records):
+        rows = [self._to_row(file_path, record) for file_path, record in records.items()]
+        if not rows:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO baseline (path, {', '.join(RECORD_COLUMNS)}, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            #same transaction, a failed seal update rolls the records back
+            self._seal(records)
+
+    def delete_many(self, file_paths):
+        file_paths = list(file_paths)
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM baseline WHERE path = ?",
+                                        ((_path_key(file_path),) for file_path in file_paths))
+            self._seal(dict.fromkeys(file_paths))
+
+    def apply_changes(self, records, file_paths):
+        file_paths = [file_path for file_path in file_paths if file_path not in records]
+        rows = [self._to_row(file_path, record) for file_path, record in records.items()]
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM baseline WHERE path = ?",
+                                        ((_path_key(file_path),) for file_path in file_paths))
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO baseline (path, {', '.join(RECORD_COLUMNS)}, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._seal({**records, **dict.fromkeys(file_paths)})
+
+    def rename(self, old_path, new_path):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                f"SELECT path, {', '.join(RECORD_COLUMNS)}, extra FROM baseline WHERE path = ?", (_path_key(old_path),)
+            ).fetchone()
+            if row is None:
+                return False
+            self.connection.execute("DELETE FROM baseline WHERE path = ?", (_path_key(new_path),))
+            self.connection.execute("UPDATE baseline SET path = ? WHERE path = ?", (_path_key(new_path), _path_key(old_path)))
+            self._seal({old_path: None, new_path: self._from_row(row)})
+        return True
+
+    def _seal(self, changes):
+        #called with the lock held, inside the transaction of the write
+        if self.seal is not None and changes:
+            self._set_meta('baseline_seal', self.seal.apply(changes, self._load_merkle, self._put_merkle))
+
+    def _load_merkle(self, kind, keys):
+        table, key_column, value_column = MERKLE_TABLES[kind]
+        keys = list(keys)
+        stored = dict()
+        for start in range(0, len(keys), MAX_QUERY_PARAMETERS):
+            batch = keys[start:start + MAX_QUERY_PARAMETERS]
+            stored.update(self.connection.execute(
+                f"SELECT {key_column}, {value_column} FROM {table} WHERE {key_column} IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall())
+        return stored
+
+    def _put_merkle(self, kind, items):
+        table, key_column, value_column = MERKLE_TABLES[kind]
+        self.connection.executemany(f"DELETE FROM {table} WHERE {key_column} = ?",
+                                    ((key,) for key, value in items.items() if value is None))
+        self.connection.executemany(f"INSERT OR REPLACE INTO {table} ({key_column}, {value_column}) VALUES (?, ?)",
+                                    ((key, value) for key, value in items.items() if value is not None))
+
+    def load_merkle(self, kind, keys):
+        with self.lock:
+            return self._load_merkle(kind, keys)
+
+    def load_merkle_range(self, kind, first, last):
+        table, key_column, value_column = MERKLE_TABLES[kind]
+        with self.lock:
+            return dict(self.connection.execute(
+                f"SELECT {key_column}, {value_column} FROM {table} WHERE {key_column} >= ? AND {key_column} < ?", (first, last)
+            ).fetchall())
+
+    def reseal(self, records):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM merkle_leaf")
+            self.connection.execute("DELETE FROM merkle_node")
+            self._set_meta('baseline_seal', self.seal.build(list(records), records, self._put_merkle,
+                                                            meta_entries(self._get_meta)))
+
+    def seal_meta(self):
+        with self.lock, self.connection:
+            self._seal(meta_entries(self._get_meta))
+
+    def paths_with_hash(self, file_hash):
+        with self.lock:
+            rows = self.connection.execute("SELECT path FROM baseline WHERE hash = ?", (file_hash,)).fetchall()
+        return [_path_value(row[0]) for row in rows]
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM baseline").fetchone()[0]
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            return self._get_meta(key, default)
+
+    def _get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.connection:
+            if key in SEALED_META:
+                #same transaction, a value that can not be sealed is not stored
+                self._seal(dict((meta_entry(key, value),)))
+            self._set_meta(key, value)
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def load_dir_states(self, folder):
+        with self.lock:
+            rows = self.connection.execute("SELECT path, state FROM dir_state WHERE folder = ?", (_path_key(folder),)).fetchall()
+        return {_path_value(path): json.loads(state) for path, state in rows}
+
+    def save_dir_states(self, folder, dir_states):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM dir_state WHERE folder = ?", (_path_key(folder),))
+            self.connection.executemany(
+                "INSERT INTO dir_state (folder, path, state) VALUES (?, ?, ?)",
+                ((_path_key(folder), _path_key(path), json.dumps(state)) for path, state in dir_states.items()),
+            )
+
+    def load_scan_checkpoint(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT path, result FROM scan_checkpoint").fetchall()
+        return {_path_value(path): json.loads(result) for path, result in rows}
+
+    def save_scan_checkpoint(self, results):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scan_checkpoint (path, result) VALUES (?, ?)",
+                ((_path_key(file_path), json.dumps(result)) for file_path, result in results.items()),
+            )
+
+    def clear_scan_checkpoint(self, file_paths=None):
+        with self.lock, self.connection:
+            if file_paths is None:
+                self.connection.execute("DELETE FROM scan_checkpoint")
+            else:
+                self.connection.executemany("DELETE FROM scan_checkpoint WHERE path = ?",
+                                            ((_path_key(file_path),) for file_path in file_paths))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def open_baseline_store(store_path, legacy_json_path=None):
+    """Open the baseline store at store_path, picking the backend from the file extension.
+
+    If a new SQLite store is created and legacy_json_path exists, the old
+    baseline_hashes.json is imported into it once.
+    """
+    if store_path.endswith('.json'):
+        return JsonBaselineStore(store_path)
+
+    is_new = not os.path.exists(store_path)
+    store = SqliteBaselineStore(store_path)
+    if is_new and legacy_json_path and os.path.exists(legacy_json_path):
+        imported = store.import_json(legacy_json_path)
+        print(f"Imported {imported} record(s) from {legacy_json_path}")
+    return store
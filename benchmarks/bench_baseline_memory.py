@@ -0,0 +1,76 @@
+"""Memory and lookup cost of the in-memory baseline: dict of record dicts vs CompactBaseline.
+
+Usage:
+    python benchmarks/bench_baseline_memory.py [--files N] [--lookups N]
+
+The dict layout is the one the checker used before CompactBaseline: every record a dict,
+every path a full string, plus a set of the paths as files_to_check. Memory is the
+tracemalloc total of each structure once it is built, loading goes through a SQLite store
+(load_all for the dict, the streaming iter_all for CompactBaseline).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from baseline_store import SqliteBaselineStore
+from compact_baseline import CompactBaseline
+from bench_baseline_store import make_records
+
+
+def measure_build(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, current, peak
+
+
+def measure_lookups(baseline, file_paths):
+    start = time.perf_counter()
+    for file_path in file_paths:
+        baseline[file_path]['hash']
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqliteBaselineStore(os.path.join(directory, "store.db"))
+        store.upsert_many(dict(make_records(args.files)))
+
+        def build_dict():
+            records = store.load_all()
+            return records, set(records)
+
+        (records, _), dict_time, dict_memory, dict_peak = measure_build(build_dict)
+        file_paths = random.Random(1).sample(list(records), min(args.lookups, args.files))
+        dict_lookup = measure_lookups(records, file_paths)
+        del records
+
+        compact, compact_time, compact_memory, compact_peak = measure_build(lambda: CompactBaseline(store.iter_all()))
+        compact_lookup = measure_lookups(compact, file_paths)
+        store.close()
+
+    mib = 1024 * 1024
+    print(f"{'layout':<16} {'files':>9} {'load s':>8} {'MiB':>9} {'peak MiB':>9} {'bytes/file':>11} {'lookups/s':>11}")
+    for name, elapsed, memory, peak, lookup in (('dict + set', dict_time, dict_memory, dict_peak, dict_lookup),
+                                                ('CompactBaseline', compact_time, compact_memory, compact_peak, compact_lookup)):
+        print(f"{name:<16} {args.files:>9} {elapsed:>8.2f} {memory / mib:>9.1f} {peak / mib:>9.1f} "
+              f"{memory / args.files:>11.0f} {len(file_paths) / lookup:>11.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
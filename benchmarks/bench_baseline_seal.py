@@ -0,0 +1,88 @@
+"""Cost of the signed Merkle tree of a sealed baseline (see baseline_seal.py).
+
+Usage:
+    python benchmarks/bench_baseline_seal.py [--files N] [--samples N] [--scheme hmac-sha256|ed25519]
+
+Times, on a SQLite store of --files records:
+    seal        - building and signing the tree of the whole baseline (first use of a key)
+    open        - checking the signed root, what every start of a sealed baseline costs
+    update      - one record changed, as accept_changes or update_baseline_hashes write it
+    verify_one  - one record checked against the tree, as the real time monitor does
+    verify_all  - every record checked, as a full scan does
+and compares update and verify_one with rebuilding the tree, the cost of signing the whole document.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from baseline_store import SqliteBaselineStore
+from baseline_seal import MerkleSeal, generate_key, load_signer, SEAL_SCHEMES
+from compact_baseline import CompactBaseline
+from bench_baseline_store import make_records
+
+
+def timed_call(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--samples', type=int, default=1000, help="single record updates and verifications timed")
+    parser.add_argument('--scheme', choices=SEAL_SCHEMES, default=SEAL_SCHEMES[0])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SqliteBaselineStore(os.path.join(directory, "store.db"))
+        records = CompactBaseline()
+        batch = dict()
+        for file_path, record in make_records(args.files):
+            batch[file_path] = record
+            if len(batch) >= 10000:
+                store.upsert_many(batch)
+                records.update(batch)
+                batch = dict()
+        store.upsert_many(batch)
+        records.update(batch)
+
+        seal = MerkleSeal(load_signer(generate_key(os.path.join(directory, "seal.key"), args.scheme)))
+        store.set_seal(seal)
+        seal_time, _ = timed_call(lambda: store.reseal(records))
+        open_time, problem = timed_call(lambda: seal.verify_root(store.get_meta('baseline_seal'), store.load_merkle))
+        assert problem is None, problem
+
+        sample = random.Random(1).sample(list(records), min(args.samples, args.files))
+        start = time.perf_counter()
+        for file_path in sample:
+            record = dict(records[file_path], mtime_ns=records[file_path]['mtime_ns'] + 1)
+            store.upsert_many({file_path: record})
+            records[file_path] = record
+        update_time = (time.perf_counter() - start) / len(sample)
+
+        start = time.perf_counter()
+        for file_path in sample:
+            assert not store.verify_seal([file_path], records)
+        verify_one_time = (time.perf_counter() - start) / len(sample)
+
+        verify_all_time, tampered = timed_call(lambda: store.verify_seal(list(records), records))
+        assert not tampered
+        size = os.path.getsize(os.path.join(directory, "store.db"))
+        store.close()
+
+    print(f"{'operation':<12} {'files':>9} {'seconds':>12} {'vs full rebuild':>16}")
+    for name, seconds in (('seal', seal_time), ('open', open_time), ('update', update_time),
+                          ('verify_one', verify_one_time), ('verify_all', verify_all_time)):
+        print(f"{name:<12} {args.files:>9} {seconds:>12.6f} {seal_time / seconds:>15.0f}x")
+    print(f"store size with the tree: {size / (1024 * 1024):.1f} MiB, {args.scheme}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Cost of adding files to the baseline: legacy JSON rewrite per file vs batched stores.
+
+Usage:
+    python benchmarks/bench_baseline_store.py [--files N] [--legacy-files N]
+
+The legacy path re-reads and rewrites the whole baseline_hashes.json for every
+added file, exactly like the old append_to_baseline_hashes, so it is quadratic
+and only run on --legacy-files records; its time for --files records is
+extrapolated from that run.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from baseline_store import JsonBaselineStore, SqliteBaselineStore
+
+
+def make_records(count):
+    for i in range(count):
+        file_path = os.path.join("/data", f"dir_{i // 1000:04d}", f"file_{i:07d}.bin")
+        record = {
+            'hash': f"{i:064x}",
+            'size': i * 17,
+            'mtime_ns': 1700000000000000000 + i,
+            'inode': 100000 + i,
+            'ctime_ns': 1700000000000000000 + i,
+        }
+        yield file_path, record
+
+
+def legacy_append(json_path, data):
+    #the pre-store implementation: read, update and rewrite the whole file for every added file
+    with open(json_path, 'r+') as f:
+        try:
+            existing_data = json.load(f)
+        except json.JSONDecodeError:
+            existing_data = {}
+        existing_data.update(data)
+        f.seek(0)
+        json.dump(existing_data, f, indent=4)
+        f.truncate()
+
+
+def bench_legacy(directory, count):
+    json_path = os.path.join(directory, "legacy.json")
+    with open(json_path, 'w') as f:
+        json.dump({}, f)
+    start = time.perf_counter()
+    for file_path, record in make_records(count):
+        legacy_append(json_path, {file_path: record})
+    return time.perf_counter() - start
+
+
+def bench_store(store, count, batch_size):
+    start = time.perf_counter()
+    batch = {}
+    for file_path, record in make_records(count):
+        batch[file_path] = record
+        if len(batch) >= batch_size:
+            store.upsert_many(batch)
+            batch = {}
+    store.upsert_many(batch)
+    elapsed = time.perf_counter() - start
+    assert store.count() == count
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--legacy-files', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_time = bench_legacy(directory, args.legacy_files)
+        #each add rewrites every record added so far, so time grows with the square of the count
+        legacy_estimate = legacy_time * (args.files / args.legacy_files) ** 2
+
+        json_time = bench_store(JsonBaselineStore(os.path.join(directory, "store.json")), args.files, args.batch_size)
+
+        sqlite_store = SqliteBaselineStore(os.path.join(directory, "store.db"))
+        sqlite_time = bench_store(sqlite_store, args.files, args.batch_size)
+        sqlite_store.close()
+
+        sqlite_single = SqliteBaselineStore(os.path.join(directory, "single.db"))
+        sqlite_single_time = bench_store(sqlite_single, args.files, 1)
+        sqlite_single.close()
+
+    print(f"{'backend':<32} {'files':>8} {'seconds':>10} {'files/s':>10}")
+    print(f"{'legacy json, per file (measured)':<32} {args.legacy_files:>8} {legacy_time:>10.2f} {args.legacy_files / legacy_time:>10.0f}")
+    print(f"{'legacy json, per file (estimate)':<32} {args.files:>8} {legacy_estimate:>10.0f} {args.files / legacy_estimate:>10.1f}")
+    print(f"{'json store, batched':<32} {args.files:>8} {json_time:>10.2f} {args.files / json_time:>10.0f}")
+    print(f"{'sqlite store, batched':<32} {args.files:>8} {sqlite_time:>10.2f} {args.files / sqlite_time:>10.0f}")
+    print(f"{'sqlite store, one per txn':<32} {args.files:>8} {sqlite_single_time:>10.2f} {args.files / sqlite_single_time:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
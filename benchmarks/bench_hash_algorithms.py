@@ -0,0 +1,68 @@
+"""Hashing speed in GB/s of every available algorithm, in memory and from files.
+
+Usage:
+    python benchmarks/bench_hash_algorithms.py [--megabytes N] [--files N]
+
+The in-memory run feeds one buffer through update() and shows the raw speed of
+each algorithm; the file run hashes real files through compute_file_hash so the
+read loop is included. blake3 and xxh3 show up when their packages are installed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hash_engine import available_algorithms, compute_file_hash, new_hasher, CRYPTOGRAPHIC_ALGORITHMS
+
+
+def bench_memory(algorithm, buffer, repeat):
+    hash_func = new_hasher(algorithm)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        hash_func.update(buffer)
+    hash_func.hexdigest()
+    return time.perf_counter() - start
+
+
+def bench_files(algorithm, file_paths):
+    start = time.perf_counter()
+    for file_path in file_paths:
+        compute_file_hash(file_path, algorithm)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megabytes', type=int, default=1024, help="data hashed in memory per algorithm")
+    parser.add_argument('--files', type=int, default=64, help="number of 4 MiB files hashed per algorithm")
+    args = parser.parse_args()
+
+    buffer = os.urandom(1024 * 1024)
+    gigabytes = args.megabytes / 1024
+    file_size = 4 * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = []
+        for i in range(args.files):
+            file_path = os.path.join(directory, f"file_{i:04d}.bin")
+            with open(file_path, 'wb') as f:
+                f.write(os.urandom(file_size))
+            file_paths.append(file_path)
+        #warm the page cache so the file run measures hashing and the read loop, not the disk
+        bench_files('md5', file_paths)
+        file_gigabytes = args.files * file_size / (1024 ** 3)
+
+        print(f"{'algorithm':<10} {'crypto':>6} {'memory GB/s':>12} {'files GB/s':>11}")
+        for algorithm in available_algorithms():
+            memory_speed = gigabytes / bench_memory(algorithm, buffer, args.megabytes)
+            file_speed = file_gigabytes / bench_files(algorithm, file_paths)
+            crypto = 'yes' if algorithm in CRYPTOGRAPHIC_ALGORITHMS else 'no'
+            print(f"{algorithm:<10} {crypto:>6} {memory_speed:>12.2f} {file_speed:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
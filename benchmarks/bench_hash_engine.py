@@ -0,0 +1,71 @@
+"""Throughput of HashEngine modes and worker counts.
+
+Usage:
+    python benchmarks/bench_hash_engine.py [--files N] [--size BYTES]
+
+Creates N files of BYTES random bytes in a temp directory, hashes them with the
+serial path and with thread/process pools at increasing worker counts and checks
+that every pool produces exactly the same hashes as the serial path.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hash_engine import HashEngine
+
+
+def create_files(directory, count, size):
+    file_paths = []
+    for i in range(count):
+        file_path = os.path.join(directory, f"file_{i:06d}.bin")
+        with open(file_path, 'wb') as f:
+            f.write(os.urandom(size))
+        file_paths.append(file_path)
+    return file_paths
+
+
+def run(engine, file_paths):
+    start = time.perf_counter()
+    hashes = dict(engine.hash_files(file_paths))
+    return time.perf_counter() - start, hashes
+
+
+def worker_counts(max_workers):
+    count = 1
+    while count < max_workers:
+        yield count
+        count *= 2
+    yield max_workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=256 * 1024)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = create_files(directory, args.files, args.size)
+        total_mb = args.files * args.size / (1024 * 1024)
+
+        serial_time, expected = run(HashEngine(mode='serial'), file_paths)
+        print(f"{'mode':<8} {'workers':>7} {'seconds':>8} {'files/s':>10} {'MB/s':>8} {'speedup':>7}")
+        print(f"{'serial':<8} {1:>7} {serial_time:>8.2f} {args.files / serial_time:>10.0f} {total_mb / serial_time:>8.1f} {1.0:>7.2f}")
+
+        for mode in ('thread', 'process'):
+            for workers in worker_counts(args.max_workers):
+                elapsed, hashes = run(HashEngine(mode=mode, workers=workers), file_paths)
+                if hashes != expected:
+                    print(f"{mode} with {workers} workers returned different hashes than the serial path")
+                    return 1
+                print(f"{mode:<8} {workers:>7} {elapsed:>8.2f} {args.files / elapsed:>10.0f} {total_mb / elapsed:>8.1f} {serial_time / elapsed:>7.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Read strategies of compute_file_hashes across file sizes.
+
+Usage:
+    python benchmarks/bench_read_strategies.py [--sizes 4K,1M,64M,512M] [--total 1G]
+
+Compares the old 8 KiB read() loop with the automatic choice, readinto into a
+reused 1 MiB buffer and mmap, for each file size, and prints MB/s. Every size is hashed up to
+--total bytes (at least one file) so small and big sizes take similar time.
+The files are in the page cache, so this measures per-call overhead, not the disk.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hash_engine import compute_file_hashes, MMAP_THRESHOLD
+
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def legacy_hash(file_path):
+    #the original compute_file_hash loop
+    hash_func = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(8192):
+            hash_func.update(chunk)
+    return hash_func.hexdigest()
+
+
+def timed(function, file_paths):
+    start = time.perf_counter()
+    results = [function(file_path) for file_path in file_paths]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default="4K,256K,1M,16M,64M,512M")
+    parser.add_argument('--total', default="1G", help="bytes hashed per size and strategy")
+    args = parser.parse_args()
+    total = parse_size(args.total)
+
+    strategies = {
+        'legacy 8K read': legacy_hash,
+        'auto': lambda file_path: compute_file_hashes(file_path, ('sha256',))[0],
+        'readinto 1M': lambda file_path: compute_file_hashes(file_path, ('sha256',), 'read')[0],
+        'mmap': lambda file_path: compute_file_hashes(file_path, ('sha256',), 'mmap')[0],
+    }
+
+    print(f"auto strategy switches to mmap at {MMAP_THRESHOLD // (1024 * 1024)} MiB")
+    print(f"{'size':>8} {'files':>6} " + " ".join(f"{name:>15}" for name in strategies) + "   (MB/s)")
+    with tempfile.TemporaryDirectory() as directory:
+        for size_text in args.sizes.split(','):
+            size = parse_size(size_text)
+            count = max(1, total // max(size, 1))
+            file_paths = []
+            for i in range(count):
+                file_path = os.path.join(directory, f"{size}_{i:06d}.bin")
+                with open(file_path, 'wb') as f:
+                    f.write(os.urandom(size))
+                file_paths.append(file_path)
+
+            speeds = []
+            expected = None
+            for name, function in strategies.items():
+                elapsed, results = timed(function, file_paths)
+                if expected is None:
+                    expected = results
+                elif results != expected:
+                    print(f"{name} returned different hashes for {size_text} files")
+                    return 1
+                speeds.append(count * size / (1024 * 1024) / elapsed)
+            print(f"{size_text:>8} {count:>6} " + " ".join(f"{speed:>15.1f}" for speed in speeds))
+
+            for file_path in file_paths:
+                os.remove(file_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
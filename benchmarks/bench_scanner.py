@@ -0,0 +1,203 @@
+"""End to end scanner benchmark on a synthetic corpus, with JSON results for regression tracking.
+
+Usage:
+    python benchmarks/bench_scanner.py [corpus options] [--output results.json] [--compare old.json]
+
+Generates a corpus (see corpus.py) in a temp directory, or uses --corpus DIRECTORY, and times
+with a fresh data directory:
+    baseline    - add_folder_to_baseline over the whole corpus
+    full_check  - full rehash of every file
+    quick_check - stat only recheck
+    update      - full check after --modify-percent of the tiny files were rewritten
+                  (a generated corpus only, --corpus folders are not modified)
+    accept      - accept_changes for those files
+    export      - writing baseline_hashes.json
+and reports files/s, MB/s and the peak RSS of each phase.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import add_spec_arguments, spec_from_args, generate_corpus, corpus_size
+from fic_core import IntegrityChecker, SCAN_CHANGED
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def reset_peak_rss():
+    #Linux only: writing 5 to clear_refs resets the peak (VmHWM), elsewhere the peak covers the whole run
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macOS, KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(name, files, total_bytes, func):
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+    phase = {
+        'name': name,
+        'seconds': round(elapsed, 4),
+        'files': files,
+        'bytes': total_bytes,
+        'files_per_second': round(files / elapsed, 1) if elapsed else None,
+        'mb_per_second': round(total_bytes / (1024 * 1024) / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+    }
+    return phase, result
+
+
+def version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rewrite_files(file_paths, percent):
+    """Rewrite percent of the files with new content of the same size. Returns the rewritten paths."""
+    step = max(1, int(100 / percent)) if percent else 0
+    rewritten = file_paths[::step] if step else []
+    for file_path in rewritten:
+        size = os.path.getsize(file_path)
+        with open(file_path, 'wb') as f:
+            f.write(os.urandom(max(size, 1)))
+    return rewritten
+
+
+def run_benchmark(corpus_dir, data_dir, args, created=None):
+    checker = IntegrityChecker(data_dir=data_dir, hash_mode=args.hash_mode, hash_workers=args.workers,
+                               chunk_threshold=args.chunk_threshold_mb * 1024 * 1024 if args.chunk_threshold_mb else None)
+    phases = []
+    try:
+        if created is not None:
+            files, total_bytes = corpus_size(created)
+        else:
+            files, total_bytes = 0, 0
+
+        phase, added = measure('baseline', files, total_bytes, lambda: checker.add_folder_to_baseline(corpus_dir))
+        if created is None:
+            #an existing corpus, count what was added
+            files = added
+            total_bytes = sum(record.get('size', 0) for record in checker.baseline_hashes.values())
+            elapsed = phase['seconds']
+            phase.update(files=files, bytes=total_bytes,
+                         files_per_second=round(files / elapsed, 1) if elapsed else None,
+                         mb_per_second=round(total_bytes / (1024 * 1024) / elapsed, 1) if elapsed else None)
+        phases.append(phase)
+
+        phase, _ = measure('full_check', files, total_bytes, lambda: checker.scan_results(quick=False, resume=False))
+        phases.append(phase)
+        phase, _ = measure('quick_check', files, 0, lambda: checker.scan_results(quick=True, resume=False))
+        phases.append(phase)
+
+        #files of an existing --corpus are never modified, there the update phase is a second full check
+        rewritten = rewrite_files(sorted(created['tiny']), args.modify_percent) if created is not None else []
+        phase, results = measure('update', files, total_bytes, lambda: checker.scan_results(quick=False, resume=False))
+        phases.append(phase)
+        changed = results[SCAN_CHANGED]
+        if len(changed) < len(rewritten):
+            print(f"Warning: {len(rewritten)} file(s) were rewritten but only {len(changed)} reported as changed")
+
+        changed_bytes = sum(os.path.getsize(file_path) for file_path in changed)
+        phase, _ = measure('accept', len(changed), changed_bytes, lambda: checker.accept_changes(changed))
+        phases.append(phase)
+
+        export_path = os.path.join(data_dir, "export.json")
+        phase, _ = measure('export', files, 0, lambda: checker.export_baseline_hashes(export_path))
+        phases.append(phase)
+    finally:
+        checker.close()
+    return phases
+
+
+def print_phases(phases, previous=None):
+    previous = {phase['name']: phase for phase in (previous or {}).get('phases', [])}
+    print(f"{'phase':<12} {'files':>9} {'seconds':>9} {'files/s':>10} {'MB/s':>9} {'peak RSS MB':>12} {'vs previous':>12}")
+    for phase in phases:
+        before = previous.get(phase['name'])
+        ratio = f"{before['seconds'] / phase['seconds']:.2f}x" if before and phase['seconds'] else ""
+        print(f"{phase['name']:<12} {phase['files']:>9} {phase['seconds']:>9.3f} {phase['files_per_second'] or 0:>10.0f} "
+              f"{phase['mb_per_second'] or 0:>9.1f} {phase['peak_rss_mb'] or 0:>12.1f} {ratio:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_spec_arguments(parser)
+    parser.add_argument('--corpus', help="benchmark an existing folder instead of generating a corpus")
+    parser.add_argument('--hash-mode', choices=('serial', 'thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-threshold-mb', type=int)
+    parser.add_argument('--modify-percent', type=float, default=1.0, help="share of tiny files rewritten for the update phase")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+
+    spec = spec_from_args(args)
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as corpus_dir:
+        if args.corpus:
+            corpus_dir = os.path.abspath(args.corpus)
+            created = None
+        else:
+            start = time.perf_counter()
+            created = generate_corpus(corpus_dir, spec)
+            print(f"Generated corpus in {time.perf_counter() - start:.1f}s")
+        phases = run_benchmark(corpus_dir, data_dir, args, created)
+
+    results = {
+        'version': version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'hash_mode': args.hash_mode,
+        'workers': args.workers,
+        'corpus': args.corpus or spec.to_dict(),
+        'phases': phases,
+    }
+    print_phases(phases, previous)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Cost of snapshots of scan results and of diffing two of them (see baseline_snapshots.py).
+
+Usage:
+    python benchmarks/bench_snapshots.py [--files N] [--changes N] [--memory]
+
+Two snapshots of --files entries are taken, the second with --changes files each changed, removed,
+added and renamed. The entries are handed over in shuffled order, the way a baseline is iterated.
+Times (with --memory also the peak traced memory, tracemalloc slows every step down a lot):
+    take    - sorting and writing a snapshot as compressed runs
+    diff    - the streaming merge diff of the two snapshots, renames included
+    compact - merging the runs of a snapshot into one run
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from baseline_snapshots import SnapshotStore
+from bench_baseline_store import make_records
+
+
+def make_entries(count, order):
+    records = list(make_records(count))
+    entries = list()
+    for i in order:
+        file_path, record = records[i]
+        entries.append((file_path, record['hash'], record['size'], record['mtime_ns']))
+    return entries
+
+
+def changed_entries(entries, changes):
+    #every changes-th file is changed, removed or renamed in turn, plus changes added files
+    changed = removed = renamed = 0
+    for i, (file_path, file_hash, size, mtime_ns) in enumerate(entries):
+        kind = i % 50
+        if kind == 0 and changed < changes:
+            changed += 1
+            yield file_path, f"{i + 1:064x}", size, mtime_ns + 1
+        elif kind == 1 and removed < changes:
+            removed += 1
+        elif kind == 2 and renamed < changes:
+            renamed += 1
+            yield file_path + ".moved", file_hash, size, mtime_ns
+        else:
+            yield file_path, file_hash, size, mtime_ns
+    for i in range(changes):
+        yield f"/data/new/file_{i:07d}.bin", f"{i:063x}f", i, 0
+
+
+def measure(func, memory):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--changes', type=int, default=1000, help="files changed, removed, added and renamed each")
+    parser.add_argument('--memory', action='store_true', help="also trace the peak memory of each step")
+    args = parser.parse_args()
+
+    order = list(range(args.files))
+    random.Random(1).shuffle(order)
+    #built up front, so only the snapshot's own memory is traced
+    old_entries = make_entries(args.files, order)
+    new_entries = list(changed_entries(old_entries, args.changes))
+    with tempfile.TemporaryDirectory() as directory:
+        snapshots = SnapshotStore(directory)
+        take_time, take_peak, old = measure(lambda: snapshots.take(old_entries), args.memory)
+        new = snapshots.take(new_entries)
+        del old_entries, new_entries
+
+        def diff():
+            counts = {}
+            for status, _, _ in snapshots.diff(old['id'], new['id']):
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+        diff_time, diff_peak, counts = measure(diff, args.memory)
+        runs = len(old['runs'])
+        compact_time, compact_peak, _ = measure(lambda: snapshots.compact(old['id']), args.memory)
+        size = sum(os.path.getsize(os.path.join(snapshots.path(old['id']), name))
+                   for name in os.listdir(snapshots.path(old['id'])))
+
+    mib = 1024 * 1024
+    print(f"{'step':<8} {'files':>9} {'seconds':>9} {'peak MiB':>9}")
+    for name, seconds, peak in (('take', take_time, take_peak), ('diff', diff_time, diff_peak),
+                                ('compact', compact_time, compact_peak)):
+        peak_text = f"{peak / mib:.1f}" if peak is not None else "n/a"
+        print(f"{name:<8} {args.files:>9} {seconds:>9.2f} {peak_text:>9}")
+    print(f"snapshot: {runs} run(s) before compaction, {size / mib:.1f} MiB compacted ({size / args.files:.0f} bytes/file)")
+    print("diff: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
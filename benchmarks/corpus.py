@@ -0,0 +1,144 @@
+"""Synthetic file trees for the scanner benchmarks.
+
+Usage:
+    python benchmarks/corpus.py DIRECTORY [--tiny N] [--huge N] [--huge-mb MB] [--depth N] [--seed N]
+
+The same arguments and seed always produce the same tree (names, sizes and contents),
+so results of different versions are measured on identical input.
+
+Shapes:
+    tiny      - many files of 0 to 4 KiB spread over folders of 1000 files
+    huge      - a few files of --huge-mb MiB
+    deep      - one file per level of a chain of nested folders
+    hardlinks - extra links to some of the tiny files
+    sparse    - files with a large logical size but only a few written blocks
+"""
+import argparse
+import os
+import random
+import sys
+
+
+#block written into huge files over and over, generating random data for every byte would dominate the run
+HUGE_BLOCK_SIZE = 1024 * 1024
+FILES_PER_FOLDER = 1000
+
+
+class CorpusSpec:
+    """Size of each shape of a synthetic corpus, in files (huge_mb and sparse_mb in MiB per file)."""
+
+    def __init__(self, tiny=10000, huge=2, huge_mb=256, depth=64, hardlinks=1000, sparse=4, sparse_mb=1024, seed=1):
+        self.tiny = tiny
+        self.huge = huge
+        self.huge_mb = huge_mb
+        self.depth = depth
+        self.hardlinks = hardlinks
+        self.sparse = sparse
+        self.sparse_mb = sparse_mb
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def generate_corpus(directory, spec):
+    """Write the corpus described by spec under directory.
+
+    Returns:
+        dict: shape -> list of the file paths created for it.
+    """
+    rng = random.Random(spec.seed)
+    created = {'tiny': [], 'huge': [], 'deep': [], 'hardlinks': [], 'sparse': []}
+
+    for i in range(spec.tiny):
+        folder = os.path.join(directory, "tiny", f"dir_{i // FILES_PER_FOLDER:04d}")
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.join(folder, f"file_{i:07d}.txt")
+        with open(file_path, 'wb') as f:
+            f.write(rng.randbytes(rng.randint(0, 4096)))
+        created['tiny'].append(file_path)
+
+    huge_folder = os.path.join(directory, "huge")
+    os.makedirs(huge_folder, exist_ok=True)
+    for i in range(spec.huge):
+        file_path = os.path.join(huge_folder, f"huge_{i:03d}.bin")
+        block = rng.randbytes(HUGE_BLOCK_SIZE)
+        with open(file_path, 'wb') as f:
+            for block_index in range(spec.huge_mb):
+                #the block index keeps every block (and so every Merkle chunk) different
+                f.write(block_index.to_bytes(8, 'little') + block[8:])
+        created['huge'].append(file_path)
+
+    folder = os.path.join(directory, "deep")
+    for level in range(spec.depth):
+        folder = os.path.join(folder, f"level_{level:03d}")
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.join(folder, "file.txt")
+        with open(file_path, 'wb') as f:
+            f.write(rng.randbytes(rng.randint(0, 4096)))
+        created['deep'].append(file_path)
+
+    link_folder = os.path.join(directory, "hardlinks")
+    os.makedirs(link_folder, exist_ok=True)
+    for i, target in enumerate(created['tiny'][:spec.hardlinks]):
+        file_path = os.path.join(link_folder, f"link_{i:07d}.txt")
+        try:
+            os.link(target, file_path)
+        except OSError as e:
+            print(f"Could not create hardlinks, skipping them: {e}")
+            break
+        created['hardlinks'].append(file_path)
+
+    sparse_folder = os.path.join(directory, "sparse")
+    os.makedirs(sparse_folder, exist_ok=True)
+    for i in range(spec.sparse):
+        file_path = os.path.join(sparse_folder, f"sparse_{i:03d}.img")
+        size = spec.sparse_mb * 1024 * 1024
+        with open(file_path, 'wb') as f:
+            #a few written blocks, the rest is a hole that reads back as zeros
+            for offset in (0, size // 2, size - 4096):
+                f.seek(offset)
+                f.write(rng.randbytes(4096))
+            f.truncate(size)
+        created['sparse'].append(file_path)
+
+    return created
+
+
+def corpus_size(created):
+    """(file count, logical bytes) of a generated corpus, hardlinks count as files but not as bytes."""
+    files = sum(len(file_paths) for file_paths in created.values())
+    total = sum(os.path.getsize(file_path) for shape, file_paths in created.items() if shape != 'hardlinks' for file_path in file_paths)
+    return files, total
+
+
+def add_spec_arguments(parser):
+    defaults = CorpusSpec()
+    parser.add_argument('--tiny', type=int, default=defaults.tiny, help="number of tiny files")
+    parser.add_argument('--huge', type=int, default=defaults.huge, help="number of huge files")
+    parser.add_argument('--huge-mb', type=int, default=defaults.huge_mb, help="size of each huge file in MiB")
+    parser.add_argument('--depth', type=int, default=defaults.depth, help="nesting depth of the deep tree")
+    parser.add_argument('--hardlinks', type=int, default=defaults.hardlinks, help="extra links to tiny files")
+    parser.add_argument('--sparse', type=int, default=defaults.sparse, help="number of sparse files")
+    parser.add_argument('--sparse-mb', type=int, default=defaults.sparse_mb, help="logical size of each sparse file in MiB")
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def spec_from_args(args):
+    return CorpusSpec(args.tiny, args.huge, args.huge_mb, args.depth, args.hardlinks, args.sparse, args.sparse_mb, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    created = generate_corpus(args.directory, spec_from_args(args))
+    files, total = corpus_size(created)
+    print(f"Created {files} file(s), {total / (1024 * 1024):.1f} MiB in {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import threading
+from array import array
+from collections.abc import MutableMapping
+
+
+#digests of this many bytes (sha256, blake2s, blake3, sha3_256) are packed into the digest column,
+#other hashes are rare and kept in the record's extras
+DIGEST_SIZE = 32
+#value of a stat column for a record without that field (legacy records)
+MISSING = -(2 ** 63)
+STAT_COLUMNS = ('size', 'mtime_ns', 'inode', 'ctime_ns')
+#record fields that have a column of their own
+_PACKED_FIELDS = frozenset(STAT_COLUMNS + ('hash', 'algorithm'))
+
+
+class CompactBaseline(MutableMapping):
+    """Baseline records (file path -> record dict) packed for multi-million file baselines.
+
+    - paths are split at the last separator: every directory is stored once in a prefix table
+      and each directory holds a dict of file name -> slot,
+    - the 32 byte digests of all records sit in one bytearray, the stat fields in array('q') columns,
+    - the algorithm is a one byte index into a table of algorithm names,
+    - only fields without a column (fast hash, Merkle chunks, other digest sizes) are kept as a dict per record.
+
+    Reading a record builds a new dict from the columns, writing one packs it again, so callers
+    keep using plain record dicts. Freed slots are reused by later records.
+    """
+
+    def __init__(self, records=None):
+        self.lock = threading.Lock()
+        self.dirs = []
+        self.dir_ids = {}
+        #dir id -> {file name: slot}
+        self.names = []
+        self.digests = bytearray()
+        self.columns = {column: array('q') for column in STAT_COLUMNS}
+        self._column_items = tuple(self.columns.items())
+        self.algorithm_codes = bytearray()
+        #code 0 means the record has no algorithm field (legacy sha256 records)
+        self.algorithm_names = [None]
+        self.extras = {}
+        #slots holding a legacy record that is only a hash string
+        self.bare = set()
+        self.free = []
+        self.count = 0
+        if records is not None:
+            self.update(records)
+
+    @staticmethod
+    def split(file_path):
+        #the directory keeps its trailing separator so joining is a plain concatenation and round trips exactly
+        if os.altsep is None:
+            directory, separator, name = file_path.rpartition(os.sep)
+            return directory + separator, name
+        index = max(file_path.rfind(os.sep), file_path.rfind(os.altsep))
+        return file_path[:index + 1], file_path[index + 1:]
+
+    def _slot(self, file_path):
+        directory, name = self.split(file_path)
+        dir_id = self.dir_ids.get(directory)
+        if dir_id is None:
+            return None
+        return self.names[dir_id].get(name)
+
+    def update(self, records=(), **kwargs):
+        """Add many records under a single lock, records is a mapping or an iterable of (path, record) pairs."""
+        if hasattr(records, 'items'):
+            records = records.items()
+        with self.lock:
+            for file_path, record in records:
+                self._set(file_path, record)
+        for file_path, record in kwargs.items():
+            self[file_path] = record
+
+    def __contains__(self, file_path):
+        return isinstance(file_path, str) and self._slot(file_path) is not None
+
+    def __len__(self):
+        return self.count
+
+    def count_in_dir(self, directory):
+        """Number of records directly in directory (not in its sub directories)."""
+        dir_id = self.dir_ids.get(os.path.join(directory, ''))
+        return len(self.names[dir_id]) if dir_id is not None else 0
+
+    def __iter__(self):
+        for dir_id, names in enumerate(self.names):
+            directory = self.dirs[dir_id]
+            #copy, a scan iterating the baseline must not break when the GUI thread adds files
+            for name in list(names):
+                yield directory + name
+
+    def __getitem__(self, file_path):
+        with self.lock:
+            slot = self._slot(file_path)
+            if slot is None:
+                raise KeyError(file_path)
+            return self._record(slot)
+
+    def _record(self, slot):
+        extras = self.extras.get(slot)
+        if slot in self.bare:
+            return extras['hash']
+
+        record = {}
+        if extras is None or 'hash' not in extras:
+            record['hash'] = self.digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE].hex()
+        for column, values in self._column_items:
+            value = values[slot]
+            if value != MISSING:
+                record[column] = value
+        algorithm = self.algorithm_names[self.algorithm_codes[slot]]
+        if algorithm is not None:
+            record['algorithm'] = algorithm
+        if extras:
+            record.update(extras)
+        return record
+
+    def __setitem__(self, file_path, record):
+        with self.lock:
+            self._set(file_path, record)
+
+    def _set(self, file_path, record):
+        directory, name = self.split(file_path)
+        dir_id = self.dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = self.dir_ids[directory] = len(self.dirs)
+            self.dirs.append(directory)
+            self.names.append({})
+        names = self.names[dir_id]
+        slot = names.get(name)
+        if slot is None:
+            slot = names[name] = self._new_slot()
+        self._pack(slot, record)
+
+    def _new_slot(self):
+        self.count += 1
+        if self.free:
+            return self.free.pop()
+        slot = len(self.algorithm_codes)
+        self.digests.extend(bytes(DIGEST_SIZE))
+        for _, values in self._column_items:
+            values.append(MISSING)
+        self.algorithm_codes.append(0)
+        return slot
+
+    def _pack(self, slot, record):
+        self.extras.pop(slot, None)
+        self.bare.discard(slot)
+        if not isinstance(record, dict):
+            #legacy baselines store the bare hex digest instead of a record
+            self.bare.add(slot)
+            self.extras[slot] = {'hash': record}
+            return
+
+        extras = {} if record.keys() <= _PACKED_FIELDS else {key: value for key, value in record.items() if key not in _PACKED_FIELDS}
+        file_hash = record.get('hash')
+        packed = None
+        if isinstance(file_hash, str) and len(file_hash) == DIGEST_SIZE * 2:
+            try:
+                packed = bytes.fromhex(file_hash)
+            except ValueError:
+                pass
+            #upper case digests would come back lower case, those keep their string
+            if packed is not None and packed.hex() != file_hash:
+                packed = None
+        if packed is None:
+            extras['hash'] = file_hash
+            packed = bytes(DIGEST_SIZE)
+        self.digests[slot * DIGEST_SIZE:(slot + 1) * DIGEST_SIZE] = packed
+
+        for column, values in self._column_items:
+            value = record.get(column)
+            try:
+                values[slot] = value if value is not None else MISSING
+            except (OverflowError, TypeError):
+                #64 bit unsigned file ids (some Windows volumes) do not fit a signed column
+                values[slot] = MISSING
+                extras[column] = value
+
+        algorithm = record.get('algorithm')
+        try:
+            self.algorithm_codes[slot] = self.algorithm_names.index(algorithm)
+        except ValueError:
+            self.algorithm_codes[slot] = len(self.algorithm_names)
+            self.algorithm_names.append(algorithm)
+
+        if extras:
+            self.extras[slot] = extras
+
+    def __delitem__(self, file_path):
+        with self.lock:
+            directory, name = self.split(file_path)
+            dir_id = self.dir_ids.get(directory)
+            slot = self.names[dir_id].pop(name, None) if dir_id is not None else None
+            if slot is None:
+                raise KeyError(file_path)
+            self.extras.pop(slot, None)
+            self.bare.discard(slot)
+            self.free.append(slot)
+            self.count -= 1
@@ -0,0 +1,433 @@
+"""Command line interface for IntegriSecure, usable without Tk (servers, cron, containers).
+
+Examples:
+    python fic_cli.py baseline add /etc /usr/local/bin/tool
+    python fic_cli.py check --quick
+    python fic_cli.py check --max-mb 20480    # e.g. hourly from cron, each run continues the last one
+    python fic_cli.py --low-priority --max-read-mbps 50 --per-device 1 --max-load 1.5 check
+    python fic_cli.py accept --all
+    python fic_cli.py accept --dir /var/www --pattern '*.log'
+    python fic_cli.py export baseline_hashes.json
+    python fic_cli.py daemon --scan-interval 60    # monitor, scan hourly and serve the control API
+    python fic_cli.py seal keygen /root/fic.key && python fic_cli.py --seal-key /root/fic.key check
+    python fic_cli.py check --snapshot && python fic_cli.py snapshot diff 2026-10-13 latest
+    python fic_cli.py agent --collector http://collector:8765 --interval 60    # see fic_fleet.py
+
+`check` exits with status 1 when changed, removed, added or renamed files are found,
+or when the signature of a sealed baseline does not match.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from fic_core import (IntegrityChecker, snapshot_store, SCAN_CHANGED, SCAN_REMOVED, SCAN_NOT_CHANGED, SCAN_ADDED,
+                      SCAN_RENAMED)
+from file_scanner import ScanFilter
+from fic_paths import default_data_dir
+from hash_engine import available_algorithms, DEFAULT_ALGORITHM, CRYPTOGRAPHIC_ALGORITHMS
+from merkle import DEFAULT_CHUNK_SIZE
+from throttle import ScanThrottle, lower_priority
+from baseline_seal import generate_key, SEAL_SCHEMES
+from baseline_snapshots import SnapshotError, DIFF_RENAMED
+from fic_fleet import (FleetAgent, FleetCollector, HttpTransport, LocalTransport, read_token, DEFAULT_PORT,
+                       DEFAULT_STALE_SECONDS)
+from metrics import METRICS, profile_capture
+
+
+def positive_int(value):
+    """argparse type of the options that only make sense above 0."""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="fic", description="IntegriSecure file integrity checker")
+    parser.add_argument('--data-dir', help="folder holding the baseline (default: $FIC_DATA_DIR, else %%APPDATA%%\\FIC on Windows, "
+                                           "~/Library/Application Support/FIC on macOS, $XDG_DATA_HOME/FIC elsewhere)")
+    parser.add_argument('--config-dir', help="folder of settings such as fleet.token (default: $FIC_CONFIG_DIR, else "
+                                             "$XDG_CONFIG_HOME/FIC on Linux and the data folder's location elsewhere)")
+    parser.add_argument('--hash-mode', choices=('serial', 'thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, help="number of hashing workers")
+    parser.add_argument('--algorithm', default=DEFAULT_ALGORITHM, choices=[a for a in CRYPTOGRAPHIC_ALGORITHMS if a in available_algorithms()],
+                        help="hash algorithm for new baseline records")
+    parser.add_argument('--prefilter', choices=available_algorithms(),
+                        help="fast hash checked first, only mismatches are confirmed with the main algorithm")
+    parser.add_argument('--chunk-threshold-mb', type=int,
+                        help="store files of at least this many MiB as Merkle chunks so changed byte ranges are reported")
+    parser.add_argument('--chunk-size-mb', type=positive_int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024), help="Merkle chunk size in MiB")
+    parser.add_argument('--seal-key', help="sign the baseline with this HMAC or Ed25519 key file, kept outside the data folder "
+                                           "(default: $FIC_SEAL_KEY)")
+    throttling = parser.add_argument_group("throttling", "keep scans from saturating a busy host")
+    throttling.add_argument('--max-read-mbps', type=float, help="read at most this many MiB per second")
+    throttling.add_argument('--max-files-per-second', type=float, help="open at most this many files per second")
+    throttling.add_argument('--per-device', type=int, help="batches reading from one device at the same time")
+    throttling.add_argument('--max-load', type=float, help="pause while the 1 minute load average per CPU is above this")
+    throttling.add_argument('--max-iowait', type=float, help="pause while the I/O wait is above this percentage (Linux)")
+    throttling.add_argument('--low-priority', action='store_true', help="run with nice 10 and the idle I/O class (Linux)")
+    instrumentation = parser.add_argument_group("instrumentation", "find out where the time of a command goes")
+    instrumentation.add_argument('--metrics', action='store_true', help="print counters and phase timers at the end")
+    instrumentation.add_argument('--metrics-file', help="write Prometheus metrics to this file at the end")
+    instrumentation.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics while running")
+    instrumentation.add_argument('--profile', metavar='PATH', help="run under cProfile and dump the stats to PATH")
+    instrumentation.add_argument('--tracemalloc', type=int, metavar='N', help="trace allocations and print the N biggest sites")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    baseline = commands.add_parser('baseline', help="manage the baseline")
+    baseline_commands = baseline.add_subparsers(dest='baseline_command', required=True)
+    baseline_add = baseline_commands.add_parser('add', help="add files or folders to the baseline")
+    baseline_add.add_argument('paths', nargs='+')
+    baseline_add.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                              help="skip files and folders matching the glob, e.g. node_modules or '*.log' (repeatable)")
+    baseline_add.add_argument('--include', action='append', default=[], metavar='GLOB',
+                              help="only add files matching one of these globs (repeatable)")
+    baseline_add.add_argument('--min-size', type=int, help="skip files smaller than this many bytes")
+    baseline_add.add_argument('--max-size', type=int, help="skip files larger than this many bytes")
+
+    check = commands.add_parser('check', help="check files against the baseline")
+    check.add_argument('--quick', action='store_true', help="only rehash files whose size/mtime/inode/ctime changed")
+    check.add_argument('--json', action='store_true', help="print the result as JSON")
+    check.add_argument('--show-unchanged', action='store_true', help="also list files without changes")
+    check.add_argument('--fresh', action='store_true', help="ignore the checkpoint of an unfinished check and start over")
+    check.add_argument('--max-mb', type=int, help="hash at most this many MiB, the next check continues with the rest")
+    check.add_argument('--max-minutes', type=float, help="stop hashing after this many minutes, the next check continues")
+    check.add_argument('--snapshot', action='store_true', help="save the results as a snapshot for `snapshot diff`")
+    check.add_argument('--label', help="name of the snapshot, usable instead of its id")
+    check.add_argument('--keep-snapshots', type=int, metavar='N', help="after the snapshot, delete all but the newest N")
+
+    accept = commands.add_parser('accept', help="accept changed/removed/added files into the baseline")
+    accept.add_argument('paths', nargs='*', help="files to accept, all changes if --all is given")
+    accept.add_argument('--all', action='store_true', help="accept every change, removal and addition")
+    accept.add_argument('--dir', action='append', default=[], dest='directories', metavar='FOLDER',
+                        help="accept every result inside this folder (repeatable)")
+    accept.add_argument('--pattern', action='append', default=[], dest='patterns', metavar='GLOB',
+                        help="accept every result whose path matches the glob, e.g. '*.log' (repeatable)")
+
+    export = commands.add_parser('export', help="export the baseline in the baseline_hashes.json format")
+    export.add_argument('json_path', nargs='?')
+
+    seal = commands.add_parser('seal', help="sign the baseline so changes made outside IntegriSecure are detected")
+    seal_commands = seal.add_subparsers(dest='seal_command', required=True)
+    seal_keygen = seal_commands.add_parser('keygen', help="write a new seal key")
+    seal_keygen.add_argument('key_path')
+    seal_keygen.add_argument('--scheme', choices=SEAL_SCHEMES, default=SEAL_SCHEMES[0],
+                             help="ed25519 also writes KEY_PATH.pub, which can verify but not change the baseline")
+    seal_commands.add_parser('verify', help="check every baseline record against the signed Merkle tree")
+    seal_commands.add_parser('rebuild', help="rebuild the tree and sign it with --seal-key, e.g. after changing keys")
+
+    snapshot = commands.add_parser('snapshot', help="history of scan results saved with `check --snapshot`")
+    snapshot_commands = snapshot.add_subparsers(dest='snapshot_command', required=True)
+    snapshot_commands.add_parser('list', help="list the snapshots, oldest first")
+    snapshot_diff = snapshot_commands.add_parser('diff', help="what changed between two snapshots, without a rescan")
+    snapshot_diff.add_argument('old', help="id, id prefix, label, 'previous' or a date/time such as 2026-10-13 or 2026-10-13T18:00")
+    snapshot_diff.add_argument('new', nargs='?', default='latest', help="the same, default: latest")
+    snapshot_diff.add_argument('--json', action='store_true', help="print one JSON object per difference")
+    snapshot_prune = snapshot_commands.add_parser('prune', help="delete old snapshots and compact the others into one run each")
+    snapshot_prune.add_argument('--keep', type=int, metavar='N', help="keep only the newest N snapshots")
+    snapshot_prune.add_argument('--max-age-days', type=float, help="delete snapshots older than this, the newest is always kept")
+
+    agent = commands.add_parser('agent', help="scan this host and send delta reports to a fleet collector (see fic_fleet.py)")
+    agent_target = agent.add_mutually_exclusive_group(required=True)
+    agent_target.add_argument('--collector', metavar='URL', help="collector to send the reports to, e.g. http://collector:8765")
+    agent_target.add_argument('--local-collector', metavar='STATE_FILE',
+                              help="merge the reports into a fleet view file on this host instead")
+    agent.add_argument('--token-file', help="shared secret of the fleet (default: $FIC_FLEET_TOKEN or fleet.token in the config folder)")
+    agent.add_argument('--host', help="name the reports are filed under (default: the host name)")
+    agent.add_argument('--interval', type=float, metavar='MINUTES', help="scan every this many minutes instead of once")
+    agent.add_argument('--full', action='store_true', help="rehash every file instead of a quick check")
+    agent.add_argument('--max-mb', type=int, help="hash at most this many MiB per scan")
+
+    collector = commands.add_parser('collector', help="receive agent reports and serve the fleet view (see fic_fleet.py)")
+    collector.add_argument('--port', type=int, default=DEFAULT_PORT)
+    collector.add_argument('--bind', default='127.0.0.1', help="address to listen on, e.g. 0.0.0.0 for every interface")
+    collector.add_argument('--state', help="file the fleet view is kept in (default: fleet.json in the data folder)")
+    collector.add_argument('--token-file', help="shared secret of the fleet (default: $FIC_FLEET_TOKEN or fleet.token in the config folder)")
+    collector.add_argument('--stale-hours', type=float, default=DEFAULT_STALE_SECONDS / 3600,
+                           help="flag hosts without a report for this long")
+
+    daemon = commands.add_parser('daemon', help="monitor, scan periodically and serve a local control API (see fic_daemon.py)")
+    daemon.add_argument('--socket', help="Unix socket of the API (default: fic.sock in the data folder)")
+    daemon.add_argument('--port', type=int, help="serve the API on http://127.0.0.1:PORT instead of a Unix socket")
+    daemon.add_argument('--token-file', help="token the API on --port requires (default: $FIC_FLEET_TOKEN or fleet.token in the config folder)")
+    daemon.add_argument('--scan-interval', type=float, metavar='MINUTES', help="scan every this many minutes")
+    daemon.add_argument('--full', action='store_true', help="periodic scans rehash every file instead of a quick check")
+    daemon.add_argument('--notify', action='store_true', help="also show desktop notifications for monitor alerts")
+    daemon.add_argument('--snapshots', type=int, metavar='N', help="save every complete scan as a snapshot, keeping the newest N")
+
+    return parser
+
+
+def run_baseline_add(checker, args):
+    scan_filter = ScanFilter(args.include, args.exclude, args.min_size, args.max_size)
+    file_count = 0
+    for path in args.paths:
+        #the baseline keys are absolute paths, as returned by the GUI file dialogs
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            file_count += checker.add_folder_to_baseline(path, scan_filter)
+        elif os.path.isfile(path):
+            file_count += checker.add_files_to_baseline([path])
+        else:
+            print(f"Skipping {path}: not a file or folder", file=sys.stderr)
+    print(f"Added {file_count} file(s).")
+    return 0
+
+
+def run_check(checker, args):
+    results = checker.scan_results(quick=checker.use_quick_check(args.quick), resume=not args.fresh,
+                                   max_bytes=args.max_mb * 1024 * 1024 if args.max_mb is not None else None,
+                                   max_seconds=args.max_minutes * 60 if args.max_minutes is not None else None)
+    changed, removed, added = results[SCAN_CHANGED], results[SCAN_REMOVED], results[SCAN_ADDED]
+    renamed, not_changed = results[SCAN_RENAMED], results[SCAN_NOT_CHANGED]
+
+    if args.json:
+        print(json.dumps(checker.report_results(results, args.show_unchanged), indent=4))
+    else:
+        if renamed:
+            print("RENAMED")
+            for new_path in sorted(renamed):
+                print(f"{checker.renamed_files[new_path]} -> {new_path}")
+            print()
+        sections = [("CHANGED", changed), ("REMOVED", removed), ("ADDED", added)]
+        if args.show_unchanged:
+            sections.append(("NO CHANGES", not_changed))
+        for title, file_paths in sections:
+            if file_paths:
+                print(title)
+                for file_path in sorted(file_paths):
+                    print(file_path)
+                    for start, end in checker.changed_ranges.get(file_path, ()):
+                        print(f"    bytes {start}-{end}")
+                print()
+        print(f"{len(changed)} changed, {len(removed)} removed, {len(added)} added, {len(renamed)} renamed, "
+              f"{len(not_changed)} unchanged")
+        if checker.pending_files:
+            print(f"Budget reached, {checker.pending_files} file(s) are left for the next check.")
+        if checker.tampered_records:
+            print(f"{len(checker.tampered_records)} changed file(s) have a baseline record that does not match the signed baseline.")
+        if checker.deleted_records:
+            print(f"{len(checker.deleted_records)} record(s) were deleted from the signed baseline and their files were not found.")
+        for problem in checker.seal_problems:
+            print(f"WARNING: {problem}")
+
+    if args.snapshot:
+        meta = checker.take_snapshot(results, args.label)
+        if meta is not None and not args.json:
+            print(f"Saved snapshot {meta['id']} of {meta['entries']} file(s).")
+        if meta is not None and args.keep_snapshots is not None:
+            checker.snapshots.prune(keep=args.keep_snapshots)
+
+    return 1 if changed or removed or added or renamed or checker.seal_problems else 0
+
+
+def run_accept(checker, args):
+    if not args.all and not args.paths and not args.directories and not args.patterns:
+        print("Give the files to accept, --dir, --pattern or --all.", file=sys.stderr)
+        return 2
+
+    results = checker.scan_results()
+    if args.all:
+        selection = checker.select_changes(results)
+    else:
+        selection = checker.select_changes(results, args.paths, args.directories, args.patterns)
+    accepted = checker.accept_changes(*selection)
+    print("Accepted {} change(s), {} removal(s), {} addition(s) and {} rename(s).".format(*accepted))
+    return 0
+
+
+def run_export(checker, args):
+    checker.export_baseline_hashes(args.json_path)
+    return 0
+
+
+def run_seal(checker, args):
+    if checker.seal is None:
+        print("No seal key given, use --seal-key or FIC_SEAL_KEY.", file=sys.stderr)
+        return 2
+    if args.seal_command == 'rebuild':
+        return 0 if checker.reseal_baseline() else 1
+
+    tampered = checker.verify_seal_all()
+    if checker.seal_problems:
+        for problem in checker.seal_problems:
+            print(f"WARNING: {problem}")
+        print("No baseline record can be trusted, check them and run `seal rebuild`.")
+        return 1
+    if tampered or checker.deleted_records:
+        print(f"{len(tampered)} of {len(checker.files_to_check)} baseline record(s) do not match the signed baseline, "
+              f"{len(checker.deleted_records)} signed record(s) were deleted from it.")
+        return 1
+    print(f"All {len(checker.files_to_check)} baseline record(s) match the signed baseline.")
+    return 0
+
+
+def run_snapshot(args):
+    snapshots = snapshot_store(args.data_dir)
+    try:
+        if args.snapshot_command == 'list':
+            for meta in snapshots.list():
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta['created']))
+                pending = f", {meta['pending']} file(s) were not hashed" if meta.get('pending') else ""
+                print(f"{meta['id']}  {created}  {meta['entries']} file(s){pending}  {meta.get('label') or ''}".rstrip())
+            return 0
+        if args.snapshot_command == 'prune':
+            deleted, compacted = snapshots.prune(args.keep, args.max_age_days)
+            print(f"Deleted {len(deleted)} snapshot(s), compacted {compacted}.")
+            return 0
+
+        old, new = snapshots.resolve(args.old), snapshots.resolve(args.new)
+        #differences are printed as they are found, a diff of millions of files is never held in memory
+        counts = {}
+        for status, file_path, old_path in snapshots.diff(old['id'], new['id']):
+            counts[status] = counts.get(status, 0) + 1
+            if args.json:
+                print(json.dumps({'status': status, 'path': file_path, 'old_path': old_path}))
+            elif status == DIFF_RENAMED:
+                print(f"{status:<8} {old_path} -> {file_path}")
+            else:
+                print(f"{status:<8} {file_path}")
+    except (SnapshotError, OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not args.json:
+        print(f"{old['id']} -> {new['id']}: " + ", ".join(f"{counts.get(status, 0)} {status}"
+                                                            for status in (SCAN_CHANGED, SCAN_REMOVED, SCAN_ADDED, SCAN_RENAMED)))
+    return 1 if counts else 0
+
+
+def run_seal_keygen(args):
+    try:
+        key_path = generate_key(args.key_path, args.scheme)
+    except (ValueError, OSError) as e:
+        print(f"Could not write the key: {e}", file=sys.stderr)
+        return 2
+    print(f"Wrote a new {args.scheme} key to {key_path}. Keep it outside the data folder and pass it with --seal-key.")
+    return 0
+
+
+def run_agent(checker, args):
+    try:
+        token = read_token(args.token_file, args.config_dir)
+    except OSError as e:
+        print(f"Could not read the token: {e}", file=sys.stderr)
+        return 2
+    if args.collector:
+        transport = HttpTransport(args.collector, token)
+    else:
+        transport = LocalTransport(FleetCollector(args.local_collector))
+    agent = FleetAgent(checker, transport, args.host)
+    max_bytes = args.max_mb * 1024 * 1024 if args.max_mb is not None else None
+    if args.interval:
+        try:
+            agent.run(args.interval * 60, quick=not args.full, max_bytes=max_bytes)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    report = agent.run_once(quick=not args.full, max_bytes=max_bytes)
+    print(f"Report {report['seq']} of {agent.host}: " + ", ".join(f"{count} {status}" for status, count in report['counts'].items()))
+    #still spooled means the collector did not get it
+    return 1 if agent.outbox() else 0
+
+
+def run_collector(args):
+    try:
+        token = read_token(args.token_file, args.config_dir)
+    except OSError as e:
+        print(f"Could not read the token: {e}", file=sys.stderr)
+        return 2
+    data_dir = args.data_dir or default_data_dir()
+    os.makedirs(data_dir, exist_ok=True)
+    collector = FleetCollector(args.state or os.path.join(data_dir, "fleet.json"), token, args.stale_hours * 3600)
+    if token is None and args.bind not in ('127.0.0.1', 'localhost', '::1'):
+        print("WARNING: no token set, anyone who can reach the collector can file reports.")
+    try:
+        server = collector.serve(args.port, args.bind)
+    except OSError as e:
+        print(f"Could not listen on {args.bind}:{args.port}: {e}", file=sys.stderr)
+        return 2
+    print(f"Collector listening on http://{args.bind}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+def run_daemon_command(checker, args):
+    #imported here, the daemon needs watchdog and plyer which the other commands do not
+    from fic_daemon import run_daemon
+    try:
+        token = read_token(args.token_file, args.config_dir) if args.port is not None else None
+    except OSError as e:
+        print(f"Could not read the token: {e}", file=sys.stderr)
+        return 2
+    try:
+        run_daemon(checker, args.socket, args.port, args.scan_interval * 60 if args.scan_interval else None,
+                   quick=not args.full, desktop_notifications=args.notify, metrics_file=args.metrics_file,
+                   snapshot_keep=args.snapshots, token=token)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    except OSError as e:
+        print(f"Could not start the daemon: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+COMMANDS = {
+    'baseline': run_baseline_add,
+    'check': run_check,
+    'accept': run_accept,
+    'export': run_export,
+    'seal': run_seal,
+    'daemon': run_daemon_command,
+    'agent': run_agent,
+}
+
+
+def build_throttle(args):
+    """ScanThrottle for the throttling arguments, None when none of them is given."""
+    if not any((args.max_read_mbps, args.max_files_per_second, args.per_device, args.max_load, args.max_iowait)):
+        return None
+    return ScanThrottle(bytes_per_second=args.max_read_mbps * 1024 * 1024 if args.max_read_mbps else None,
+                        files_per_second=args.max_files_per_second, per_device=args.per_device,
+                        max_load=args.max_load, max_iowait=args.max_iowait)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'seal' and args.seal_command == 'keygen':
+        #no baseline needed, and a --seal-key pointing at the key about to be written could not be loaded
+        return run_seal_keygen(args)
+    if args.command == 'snapshot':
+        #snapshots are read from their own files, loading the baseline would only cost time
+        return run_snapshot(args)
+    if args.command == 'collector':
+        #the collector only merges reports, it has no baseline of its own
+        return run_collector(args)
+    if args.low_priority:
+        #before the checker starts any hashing workers, they inherit the priority
+        lower_priority()
+    checker = IntegrityChecker(data_dir=args.data_dir, hash_mode=args.hash_mode, hash_workers=args.workers,
+                               hash_algorithm=args.algorithm, prefilter_algorithm=args.prefilter,
+                               chunk_threshold=args.chunk_threshold_mb * 1024 * 1024 if args.chunk_threshold_mb else None,
+                               chunk_size=args.chunk_size_mb * 1024 * 1024, throttle=build_throttle(args),
+                               seal_key=args.seal_key)
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+    try:
+        with profile_capture(args.profile, args.tracemalloc):
+            return COMMANDS[args.command](checker, args)
+    finally:
+        checker.close()
+        if args.metrics:
+            print(METRICS.summary(), file=sys.stderr)
+        if args.metrics_file:
+            METRICS.write_prometheus(args.metrics_file)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1158 @@
+import fnmatch
+import os
+import sqlite3
+import time
+from contextlib import closing
+from hash_engine import HashEngine, compute_file_hash, available_algorithms, DEFAULT_ALGORITHM, CRYPTOGRAPHIC_ALGORITHMS
+from baseline_record import (make_record, refresh_record, record_hash, record_algorithm, record_fast_hash, record_chunks,
+                             record_merkle_version, record_size, file_stat, stat_fields, stat_unchanged, stat_regular_file)
+from merkle import compute_chunk_hashes, merkle_root, changed_ranges, DEFAULT_CHUNK_SIZE, MERKLE_VERSION
+from baseline_store import open_baseline_store
+from compact_baseline import CompactBaseline
+from baseline_seal import MerkleSeal, MissingKeySigner, SealError, load_signer, SEAL_VERSION, META_ENTRY_PREFIX
+from baseline_snapshots import SnapshotStore
+from file_scanner import FolderScanner, ScanFilter
+from fic_paths import PathCanonicalizer, default_data_dir
+from metrics import METRICS, timed
+
+
+#statuses yielded by IntegrityChecker.iter_scan
+SCAN_CHANGED = 'changed'
+SCAN_REMOVED = 'removed'
+SCAN_NOT_CHANGED = 'not_changed'
+#a file that is not in the baseline showed up in a monitored folder
+SCAN_ADDED = 'added'
+#a removed baseline file found again under a new path with the same content
+SCAN_RENAMED = 'renamed'
+SCAN_STATUSES = (SCAN_CHANGED, SCAN_REMOVED, SCAN_NOT_CHANGED, SCAN_ADDED, SCAN_RENAMED)
+
+#baselined files that have to be hashed are stat'ed and hashed in batches of this many
+SCAN_BATCH = 10000
+#hashed scan results are written to the checkpoint in batches of this many files
+CHECKPOINT_EVERY = 1000
+#an unfinished scan older than this is started over instead of resumed
+CHECKPOINT_MAX_AGE_SECONDS = 7 * 24 * 3600
+#seal problem of added folders or folder filters that do not match the sealed baseline
+META_CHANGED = "The added folders or their filters were changed outside IntegriSecure."
+
+
+def snapshot_store(data_dir=None):
+    """SnapshotStore of the snapshots kept in data_dir, for commands that do not need the baseline loaded."""
+    return SnapshotStore(os.path.join(data_dir or default_data_dir(), "snapshots"))
+
+
+class IntegrityChecker:
+    """Baseline store, scanner and diff without any UI.
+
+    Used by the Tk app (FIC.py), the command line (fic_cli.py) and the real time monitor.
+    """
+
+    def __init__(self, data_dir=None, hash_mode='thread', hash_workers=None, paranoid_every=10,
+                 hash_algorithm=DEFAULT_ALGORITHM, prefilter_algorithm=None, chunk_threshold=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, throttle=None, seal_key=None):
+        #new records are hashed with hash_algorithm, existing records keep the algorithm they were made with.
+        #with a prefilter_algorithm a matching fast hash means unchanged, a mismatch is confirmed with the main hash
+        usable = [algorithm for algorithm in CRYPTOGRAPHIC_ALGORITHMS if algorithm in available_algorithms()]
+        if hash_algorithm not in usable:
+            raise ValueError(f"Invalid hash algorithm '{hash_algorithm}'. Use one of {', '.join(usable)}.")
+        if prefilter_algorithm is not None and prefilter_algorithm not in available_algorithms():
+            raise ValueError(f"Invalid prefilter algorithm '{prefilter_algorithm}'. Use one of {', '.join(available_algorithms())}.")
+        if chunk_size <= 0:
+            raise ValueError(f"Invalid chunk size {chunk_size}, it has to be a positive number of bytes.")
+        self.hash_algorithm = hash_algorithm
+        self.prefilter_algorithm = prefilter_algorithm
+
+        #files of chunk_threshold bytes or more get a Merkle record of chunk_size leaves (None disables it),
+        #so a change can be narrowed down to byte ranges and one big file is hashed on several threads
+        self.chunk_threshold = chunk_threshold
+        self.chunk_size = chunk_size
+
+        # Initialize variables
+        #data_dir (--data-dir) wins over FIC_DATA_DIR and the platform's default, see fic_paths
+        self.data_dir = data_dir or default_data_dir()
+        #baseline keys are canonical paths, resolved once per directory and remembered
+        self.paths = PathCanonicalizer()
+        self.baseline_file_path = os.path.join(self.data_dir, "baseline_hashes.json")
+        #indexed baseline store, baseline_hashes.json is only imported from once and kept as the export format
+        self.baseline_store_path = os.path.join(self.data_dir, "baseline.db")
+        #leaves of interrupted chunked hashes, so huge files do not restart from the first byte
+        self.chunk_state_dir = os.path.join(self.data_dir, "partial")
+        #versioned snapshots of scan results, so two points in time can be diffed without a rescan
+        self.snapshots = snapshot_store(self.data_dir)
+
+        #hashing engine shared by the scans and add_folder_to_baseline,
+        #an optional throttle.ScanThrottle limits its read rate and backs off on a busy host
+        self.throttle = throttle
+        self.hash_engine = HashEngine(mode=hash_mode, workers=hash_workers, hash_algorithm=hash_algorithm, throttle=throttle)
+
+        #create baseline_file
+        self.create_baseline_file()
+
+        #intializing variables depending on baseline_file
+        self.baseline_hashes = self.retrieve_data_from_baseline_hashes()
+        #a live view of the baseline paths, not a second copy of every path
+        self.files_to_check = self.baseline_hashes.keys()
+        #key file signing the baseline's Merkle tree (see baseline_seal), also taken from FIC_SEAL_KEY.
+        #the key must live outside the data folder, whoever can read an HMAC key can also forge the seal
+        self.seal_key = seal_key or os.environ.get('FIC_SEAL_KEY')
+        self.seal = None
+        #problems with the seal as a whole (bad signature, other key), files can not be trusted individually then
+        self.seal_problems = []
+        #files whose baseline record did not match the sealed tree in the last scan
+        self.tampered_records = []
+        #path digests of signed records that were deleted from the baseline, and the files found for some of them
+        self.deleted_records = set()
+        self.deleted_record_paths = []
+        self.open_seal()
+        #folders added with add_folder_to_baseline, kept in the store so the monitor can watch them recursively
+        self.added_folders = set(self.baseline_store.get_meta('added_folders', []))
+        #folder -> ScanFilter.to_dict() of the include/exclude globs and size limits it was added with
+        self.folder_filters = self.baseline_store.get_meta('folder_filters', {})
+        self.added_files = set()
+        #results of an unfinished scan (file path -> status, hash and the stat they were computed for),
+        #mirrored in the store so a killed or budget limited scan continues where it stopped
+        self.current_hashes = self.load_scan_checkpoint()
+        #baselined files the last scan left unhashed because its byte or time budget ran out
+        self.pending_files = 0
+        #file path -> changed (start, end) byte ranges of chunked files found by the last scan
+        self.changed_ranges = {}
+        #new path -> old path of the files the last scan found renamed or moved
+        self.renamed_files = {}
+        #file path -> new record of the changed files of the last scan, accept_changes reuses them
+        #instead of hashing again as long as the file's stat did not move on
+        self.scan_records = {}
+        #file path -> digest the last scan found for each changed file, what a snapshot records for it
+        self.scan_hashes = {}
+        #files of the last scan or folder add that shared an inode with an already hashed file
+        self.hardlinks_skipped = 0
+
+        #quick checks only rehash files whose size/mtime/inode/ctime changed,
+        #every paranoid_every-th quick check is promoted to a full rehash of every file
+        self.paranoid_every = paranoid_every
+        self.quick_checks_since_full = self.baseline_store.get_meta('quick_checks_since_full', 0)
+
+    def get_files_to_check(self):
+        return self.files_to_check
+
+    def add_files_to_baseline(self, file_paths):
+        """Hash the given files and add them to the baseline. Returns the number of files added."""
+        added = 0
+        for file_path in file_paths:
+            #normalising file_path
+            file_path = self.normalise_file_path(file_path)
+
+            #adding file to files_to_check to keep track of what files to check
+            self.add_file_to_added_files(file_path)
+
+            #creating hash and addding to baseline store & dict and files_to_check to keep real time tracking
+            self.save_baseline(file_path)
+            added += 1
+        return added
+
+    def add_folder_to_baseline(self, folder_path, scan_filter=None):
+        """Hash every file under folder_path that is not in the baseline yet. Returns the number of files added.
+
+        scan_filter (file_scanner.ScanFilter) is kept with the folder and also applied when later
+        checks look for files added to it.
+        """
+        #normalised once, the scanner builds every file path from it
+        folder_path = self.normalise_folder_path(folder_path)
+
+        #add to folders set to keep real time tracking of selected folders
+        if not self.add_folder_to_added_folders(folder_path, scan_filter):
+            return 0
+
+        #new file paths mapped to the stat of their directory entry, taken before hashing
+        scanner = FolderScanner(self.folder_scan_filter(folder_path))
+        new_files = {file_path: stat_result for file_path, stat_result in scanner.iter_files(folder_path)
+                     if file_path not in self.files_to_check}
+
+        #hash the new files on the engine and add them to baseline_hashes and files_to_check in one batch
+        self.hardlinks_skipped = 0
+        records = dict(self.hash_records(new_files))
+        self.save_baseline_records(records)
+        #every file of the folder is in the baseline now, so the first check can already skip unchanged directories
+        self.save_dir_states(folder_path, scanner.new_dir_states)
+        print(f"{len(records)} file(s) added from {folder_path} ({scanner.listed_dirs} folder(s) listed, "
+              f"{self.hardlinks_skipped} hardlink(s) hashed once)")
+        return len(records)
+
+    def compute_file_hash(self, file_path, hash_algorithm=None):
+        """Compute the hash of a file."""
+        return compute_file_hash(file_path, hash_algorithm or self.hash_algorithm)
+
+    def record_algorithms(self):
+        """Algorithm(s) new records are hashed with, a (main, prefilter) tuple in dual mode."""
+        if self.prefilter_algorithm:
+            return (self.hash_algorithm, self.prefilter_algorithm)
+        return self.hash_algorithm
+
+    def build_record(self, hashes, stat_result):
+        """Turn the result of hashing with record_algorithms() into a baseline record."""
+        if self.prefilter_algorithm:
+            file_hash, fast_hash = hashes or (None, None)
+            return make_record(file_hash, stat_result, self.hash_algorithm, fast_hash, self.prefilter_algorithm)
+        return make_record(hashes, stat_result, self.hash_algorithm)
+
+    def use_chunks(self, stat_result):
+        return self.chunk_threshold is not None and stat_result.st_size >= self.chunk_threshold
+
+    def build_chunked_record(self, file_path, stat_result, chunk_size=None, hash_algorithm=None):
+        """Hash a file as Merkle chunks and return its record, the record hash is the Merkle root."""
+        chunk_size = chunk_size or self.chunk_size
+        hash_algorithm = hash_algorithm or self.hash_algorithm
+        if self.throttle is not None:
+            #the hash engine admits the bytes chunk by chunk
+            self.throttle.admit(file_path, read_bytes=False)
+        leaves = compute_chunk_hashes(file_path, chunk_size, hash_algorithm, engine=self.hash_engine,
+                                      state_dir=self.chunk_state_dir, stat_result=stat_result, seal=self.seal)
+        root = merkle_root(leaves, stat_result.st_size, hash_algorithm) if leaves is not None else None
+        record = make_record(root, stat_result, hash_algorithm)
+        record['chunk_size'] = chunk_size
+        record['chunks'] = leaves or []
+        record['merkle_version'] = MERKLE_VERSION
+        return record
+
+    def comparable_root(self, saved_record, current):
+        """Root of a freshly built chunked record in the Merkle version of saved_record, to compare with its hash.
+
+        Old version roots do not cover the file size, a file whose size differs from the record keeps
+        the current version root, which can not match them.
+        """
+        version = record_merkle_version(saved_record)
+        if current['hash'] is None or version == MERKLE_VERSION or current['size'] != record_size(saved_record):
+            return current['hash']
+        return merkle_root(current['chunks'], current['size'], current['algorithm'], version)
+
+    def hash_records(self, stats):
+        """Hash files (dict of file path -> stat taken before hashing) and yield (file_path, record)."""
+        chunked = [file_path for file_path, stat_result in stats.items() if self.use_chunks(stat_result)]
+        whole_files = [file_path for file_path in stats if not self.use_chunks(stats[file_path])]
+        for file_path, hashes in self.hash_linked_files(whole_files, self.record_algorithms(), stats):
+            METRICS.inc('files_hashed')
+            METRICS.inc('bytes_hashed', stats[file_path].st_size)
+            yield file_path, self.build_record(hashes, stats[file_path])
+        #each big file is split over the threads on its own
+        for file_path in chunked:
+            METRICS.inc('files_hashed')
+            METRICS.inc('bytes_hashed', stats[file_path].st_size)
+            yield file_path, self.build_chunked_record(file_path, stats[file_path])
+
+    def hash_linked_files(self, file_paths, hash_algorithms, stats):
+        """Like HashEngine.hash_files, but hardlinks of one inode are read once and share the digest.
+
+        stats maps every file path to the stat taken before hashing, its (st_dev, st_ino) is the cache key.
+        """
+        links = dict()
+        for file_path in file_paths:
+            stat_result = stats[file_path]
+            #filesystems without inode numbers report 0, those files are never grouped
+            key = (stat_result.st_dev, stat_result.st_ino) if stat_result.st_ino else file_path
+            links.setdefault(key, list()).append(file_path)
+        aliases = {linked[0]: linked[1:] for linked in links.values() if len(linked) > 1}
+        self.hardlinks_skipped += len(file_paths) - len(links)
+        METRICS.inc('hardlink_hits', len(file_paths) - len(links))
+
+        with closing(self.hash_engine.hash_files([linked[0] for linked in links.values()], hash_algorithms)) as results:
+            for file_path, hashes in results:
+                yield file_path, hashes
+                for alias in aliases.get(file_path, ()):
+                    yield alias, hashes
+
+    def iter_scan(self, quick=False, cancel_event=None, resume=True, max_bytes=None, max_seconds=None):
+        """Check files_to_check against the baseline, yielding each result as soon as it is known.
+
+        Baselined files are reported as they come back from the hash engine. Missing files and files
+        added to the added folders are reported at the end, after missing files found again under a
+        new path with the same size and digest were paired up as renames.
+        In quick mode files whose stat still matches their baseline record are not rehashed.
+
+        Hashed results go to a checkpoint in the store. A scan that is cancelled, killed or runs out of
+        budget leaves it behind and the next scan reports those files from it as long as their stat and
+        baseline record did not change, so repeated budget limited scans cover the whole baseline.
+        The checkpoint is cleared once every file was hashed.
+
+      Args:
+          quick (bool): Skip rehashing files with an unchanged size/mtime/inode/ctime.
+          cancel_event (threading.Event, optional): Stop the scan early once it is set.
+          resume (bool): Reuse the checkpoint of an unfinished scan, False starts over.
+          max_bytes (int, optional): Hash at most this many bytes, the rest is left for the next scan.
+          max_seconds (float, optional): Stop hashing after this many seconds.
+
+      Yields:
+          tuple: (status, file_path, current_hash) with status one of SCAN_STATUSES,
+                 current_hash is None for removed and added files and for files passed by the quick check or the prefilter.
+          """
+        def cancelled():
+            return cancel_event is not None and cancel_event.is_set()
+
+        self.changed_ranges = dict()
+        self.renamed_files = dict()
+        #symlinks may have moved since the last scan, folders are resolved again
+        self.paths.clear()
+        self.scan_records = dict()
+        self.scan_hashes = dict()
+        self.hardlinks_skipped = 0
+        self.pending_files = 0
+        removed = list()
+
+        #a record that does not match the signed baseline can not vouch for its file, it is reported as changed
+        tampered = self.verify_seal_all()
+        self.tampered_records = sorted(tampered)
+        self.deleted_record_paths = []
+        for file_path in self.tampered_records:
+            yield SCAN_CHANGED, file_path, None
+
+        started = self.baseline_store.get_meta('scan_checkpoint_started')
+        if not resume or started is None or time.time() - started > CHECKPOINT_MAX_AGE_SECONDS:
+            self.clear_scan_checkpoint()
+            self.baseline_store.set_meta('scan_checkpoint_started', time.time())
+
+        deadline = time.monotonic() + max_seconds if max_seconds is not None else None
+        #records whose hash still matches but whose stat moved on (touch, copy back, legacy records)
+        refreshed = dict()
+        checkpoint = dict()
+        #counted locally and added to METRICS once, the stat loop runs once per baselined file
+        stat_seconds = 0.0
+        stat_count = quick_hits = checkpoint_hits = hashed_total = 0
+
+        def hash_batch(stats):
+            """Hash one batch (file path -> FileStat) and yield its results, the batch is left pending once out of time."""
+            nonlocal checkpoint, hashed_total
+            #like the byte budget, the time limit lets every scan hash at least one file
+            if deadline is not None and hashed_total and time.monotonic() > deadline:
+                self.pending_files += len(stats)
+                return
+            hashed = 0
+            with closing(timed(self._hash_and_compare(stats, refreshed, self.scan_records), 'scan_hash')) as results:
+                for status, file_path, current_hash in results:
+                    if cancelled():
+                        return
+                    hashed += 1
+                    hashed_total += 1
+                    METRICS.inc('files_hashed')
+                    METRICS.inc('bytes_hashed', stats[file_path].st_size)
+                    checkpoint[file_path] = {
+                        'status': status,
+                        'hash': current_hash,
+                        #a later resume only trusts the result for the same file version and baseline record
+                        'baseline': record_hash(self.baseline_hashes[file_path]),
+                        'ranges': self.changed_ranges.get(file_path),
+                        **stat_fields(stats[file_path]),
+                    }
+                    if len(checkpoint) >= CHECKPOINT_EVERY:
+                        self.save_scan_checkpoint(checkpoint)
+                        checkpoint = dict()
+                    if status == SCAN_CHANGED and current_hash is not None:
+                        self.scan_hashes[file_path] = current_hash
+                    yield status, file_path, current_hash
+                    if deadline is not None and time.monotonic() > deadline:
+                        self.pending_files += len(stats) - hashed
+                        return
+
+        #the baseline is streamed, only the files that have to be hashed are kept, as FileStat tuples and
+        #SCAN_BATCH at a time; a byte budget needs all of them to pick the smallest files first
+        stats = dict()
+        try:
+            for file_path in self.files_to_check:
+                if cancelled():
+                    return
+                if file_path in tampered:
+                    continue
+                saved_record = self.baseline_hashes.get(file_path)
+                if saved_record is None:
+                    #removed from the baseline while the scan ran
+                    continue
+                start = time.perf_counter()
+                stat_result = stat_regular_file(file_path)
+                stat_seconds += time.perf_counter() - start
+                stat_count += 1
+                #checking if file_path in files_to_check is not in os.path, which means file is moved or deleted
+                if stat_result is None:
+                    removed.append(file_path)
+                elif quick and stat_unchanged(saved_record, stat_result):
+                    quick_hits += 1
+                    yield SCAN_NOT_CHANGED, file_path, None
+                elif self.checkpointed(file_path, stat_result):
+                    checkpoint_hits += 1
+                    entry = self.current_hashes[file_path]
+                    if entry.get('ranges'):
+                        self.changed_ranges[file_path] = [tuple(byte_range) for byte_range in entry['ranges']]
+                    if entry['status'] == SCAN_CHANGED and entry['hash'] is not None:
+                        self.scan_hashes[file_path] = entry['hash']
+                        self.remember_scan_record(file_path, entry['hash'], stat_result)
+                    yield entry['status'], file_path, entry['hash']
+                else:
+                    stats[file_path] = file_stat(stat_result)
+                    if max_bytes is None and len(stats) >= SCAN_BATCH:
+                        yield from hash_batch(stats)
+                        if cancelled():
+                            return
+                        stats = dict()
+
+            if max_bytes is not None:
+                #smallest files first so a budget covers as many files as possible, at least one file per scan
+                budgeted = dict()
+                total = 0
+                for file_path in sorted(stats, key=lambda file_path: stats[file_path].st_size):
+                    total += stats[file_path].st_size
+                    if budgeted and total > max_bytes:
+                        break
+                    budgeted[file_path] = stats[file_path]
+                self.pending_files += len(stats) - len(budgeted)
+                stats = budgeted
+            yield from hash_batch(stats)
+            if cancelled():
+                return
+        finally:
+            METRICS.add_time('scan_stat', stat_seconds)
+            METRICS.inc('files_stat', stat_count)
+            METRICS.inc('quick_check_hits', quick_hits)
+            METRICS.inc('checkpoint_hits', checkpoint_hits)
+            #refreshing stat data in one write so the next quick check can skip these files, also on cancel
+            if refreshed:
+                self.append_to_baseline_hashes(refreshed)
+                self.baseline_hashes.update(refreshed)
+            self.save_scan_checkpoint(checkpoint)
+
+        if self.pending_files == 0:
+            #every file was hashed, the next scan starts a new round
+            self.clear_scan_checkpoint()
+
+        added = dict(timed(self.iter_added_files(cancel_event), 'scan_enumerate'))
+        if cancelled():
+            return
+        #a file whose signed record was deleted looks added, it is reported as changed with the tampered records
+        for file_path in [file_path for file_path in added if MerkleSeal.path_digest(file_path) in self.deleted_records]:
+            del added[file_path]
+            self.deleted_records.discard(MerkleSeal.path_digest(file_path))
+            self.deleted_record_paths.append(file_path)
+            self.tampered_records.append(file_path)
+            print(f"Baseline record of {file_path} was deleted from the signed baseline")
+            yield SCAN_CHANGED, file_path, None
+
+        with METRICS.timer('rename_detection'):
+            self.renamed_files = self.detect_renames(removed, added)
+        for new_path, old_path in self.renamed_files.items():
+            yield SCAN_RENAMED, new_path, record_hash(self.baseline_hashes[old_path])
+        moved_away = set(self.renamed_files.values())
+        for file_path in removed:
+            if file_path not in moved_away:
+                yield SCAN_REMOVED, file_path, None
+        for file_path in added:
+            if file_path not in self.renamed_files:
+                yield SCAN_ADDED, file_path, None
+
+    def remember_scan_record(self, file_path, file_hash, stat_result):
+        """Keep the new record of a changed file reported from the checkpoint, if it is made the way accept would make it.
+
+        The checkpoint only holds the main hash, so prefiltered and chunked records are hashed again on accept.
+        """
+        saved_record = self.baseline_hashes[file_path]
+        if (self.prefilter_algorithm is None and record_chunks(saved_record) is None and not self.use_chunks(stat_result)
+                and record_algorithm(saved_record) == self.hash_algorithm):
+            self.scan_records[file_path] = self.build_record(file_hash, stat_result)
+
+    def checkpointed(self, file_path, stat_result):
+        """Check if the checkpoint holds a result for this version of the file and its current baseline record."""
+        entry = self.current_hashes.get(file_path)
+        if entry is None or entry['baseline'] != record_hash(self.baseline_hashes[file_path]):
+            return False
+        if not all(entry.get(field) == value for field, value in stat_fields(stat_result).items()):
+            return False
+        #the checkpoint is outside the seal, a forged entry would report a changed file as not changed
+        return self.seal is None or self.seal.cache_trusted('checkpoint', file_path, entry)
+
+    def load_scan_checkpoint(self):
+        try:
+            return self.baseline_store.load_scan_checkpoint()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error reading the scan checkpoint: {e}")
+            return {}
+
+    def save_scan_checkpoint(self, results):
+        if not results:
+            return
+        if self.seal is not None:
+            results = {file_path: self.seal.seal_cache('checkpoint', file_path, entry) for file_path, entry in results.items()}
+        try:
+            with METRICS.timer('checkpoint_write'):
+                self.baseline_store.save_scan_checkpoint(results)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error saving the scan checkpoint: {e}")
+        self.current_hashes.update(results)
+
+    def clear_scan_checkpoint(self):
+        try:
+            self.baseline_store.clear_scan_checkpoint()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error clearing the scan checkpoint: {e}")
+        self.current_hashes = dict()
+        self.baseline_store.set_meta('scan_checkpoint_started', None)
+
+    def detect_renames(self, removed, added):
+        """Pair removed baseline files with added files of the same content.
+
+        Only added files with the size of some removed record are hashed, with the algorithm of
+        those records, and the digest is looked up in the store's digest -> paths index.
+
+      Args:
+          removed (list): Baselined file paths that are missing.
+          added (dict): Unbaselined file path -> stat, found in the added folders.
+
+      Returns:
+          dict: new path -> old path.
+          """
+        by_size = dict()
+        for file_path in removed:
+            size = record_size(self.baseline_hashes[file_path])
+            if size is not None:
+                by_size.setdefault(size, list()).append(file_path)
+
+        renamed = dict()
+        for new_path, stat_result in added.items():
+            candidates = [old_path for old_path in by_size.get(stat_result.st_size, ())
+                          if old_path not in renamed.values()]
+            digests = dict()
+            for old_path in candidates:
+                saved_record = self.baseline_hashes[old_path]
+                chunks = record_chunks(saved_record)
+                key = (record_algorithm(saved_record), chunks[0] if chunks else None,
+                       record_merkle_version(saved_record) if chunks else None)
+                if key not in digests:
+                    digests[key] = self.current_hash(new_path, saved_record, stat_result)
+            matches = set()
+            for digest in digests.values():
+                if digest is not None:
+                    matches.update(self.baseline_store.paths_with_hash(digest))
+            matches = [old_path for old_path in candidates if old_path in matches]
+            if matches:
+                #among identical copies prefer the one that kept its file name
+                same_name = [old_path for old_path in matches if os.path.basename(old_path) == os.path.basename(new_path)]
+                renamed[new_path] = (same_name or matches)[0]
+        return renamed
+
+    def _hash_and_compare(self, stats, refreshed, new_records):
+        """Hash the files in stats and compare them with their records, yielding iter_scan results.
+
+        With a prefilter, files whose record has a fast hash of that algorithm are checked with it first.
+        Only the mismatches and records without a fast hash are hashed with their record's own algorithm.
+        Changed files hashed the way a new record is made get that record in new_records, for accept_changes.
+        """
+        prefilter = self.prefilter_algorithm
+        confirm = dict()
+        prefiltered = list()
+        chunked = list()
+        for file_path in stats:
+            if record_chunks(self.baseline_hashes[file_path]) is not None:
+                chunked.append(file_path)
+            elif prefilter and record_fast_hash(self.baseline_hashes[file_path], prefilter) is not None:
+                prefiltered.append(file_path)
+            else:
+                confirm.setdefault(record_algorithm(self.baseline_hashes[file_path]), list()).append(file_path)
+
+        if prefiltered:
+            with closing(self.hash_linked_files(prefiltered, prefilter, stats)) as results:
+                for file_path, fast_hash in results:
+                    saved_record = self.baseline_hashes[file_path]
+                    if fast_hash is not None and fast_hash == record_fast_hash(saved_record, prefilter):
+                        if not stat_unchanged(saved_record, stats[file_path]):
+                            refreshed[file_path] = refresh_record(saved_record, stats[file_path])
+                        yield SCAN_NOT_CHANGED, file_path, None
+                    else:
+                        confirm.setdefault(record_algorithm(saved_record), list()).append(file_path)
+
+        for algorithm, file_paths in confirm.items():
+            #in dual mode the prefilter hash is computed in the same read so the record can be upgraded
+            algorithms = (algorithm, prefilter) if prefilter else algorithm
+            with closing(self.hash_linked_files(file_paths, algorithms, stats)) as results:
+                #if file path is present in OS then checking if hash is same
+                for file_path, hashes in results:
+                    current_hash, fast_hash = (hashes or (None, None)) if prefilter else (hashes, None)
+                    saved_record = self.baseline_hashes[file_path]
+                    if current_hash is not None and current_hash == record_hash(saved_record):
+                        if not stat_unchanged(saved_record, stats[file_path]) or record_fast_hash(saved_record, prefilter) != fast_hash:
+                            refreshed[file_path] = refresh_record(saved_record, stats[file_path], fast_hash, prefilter)
+                        yield SCAN_NOT_CHANGED, file_path, current_hash
+                    else:
+                        if current_hash is not None and algorithm == self.hash_algorithm and not self.use_chunks(stats[file_path]):
+                            new_records[file_path] = self.build_record(hashes, stats[file_path])
+                        yield SCAN_CHANGED, file_path, current_hash
+
+        for file_path in chunked:
+            saved_record = self.baseline_hashes[file_path]
+            chunk_size, saved_leaves = record_chunks(saved_record)
+            current = self.build_chunked_record(file_path, stats[file_path], chunk_size, record_algorithm(saved_record))
+            #a file of another size is changed whatever its root is
+            if (current['hash'] is not None and current['size'] == record_size(saved_record)
+                    and self.comparable_root(saved_record, current) == record_hash(saved_record)):
+                if record_merkle_version(saved_record) != MERKLE_VERSION:
+                    #old version records are upgraded to the current root once their content is confirmed
+                    refreshed[file_path] = current
+                elif not stat_unchanged(saved_record, stats[file_path]):
+                    refreshed[file_path] = refresh_record(saved_record, stats[file_path])
+                yield SCAN_NOT_CHANGED, file_path, current['hash']
+            else:
+                self.changed_ranges[file_path] = changed_ranges(saved_leaves, current['chunks'], chunk_size,
+                                                                stats[file_path].st_size, saved_record.get('size'))
+                if (current['hash'] is not None and chunk_size == self.chunk_size and self.use_chunks(stats[file_path])
+                        and current['algorithm'] == self.hash_algorithm):
+                    new_records[file_path] = current
+                yield SCAN_CHANGED, file_path, current['hash']
+
+    def iter_added_files(self, cancel_event=None):
+        """Yield (file_path, stat_result) for files in the added folders that are not in the baseline.
+
+        Directories that were unchanged since the last complete listing are not listed again,
+        only their sub directories are visited. The directory states are saved once every folder
+        was enumerated, a cancelled enumeration keeps the previous states.
+        """
+        seen = set()
+        for folder in sorted(self.added_folders):
+            scanner = FolderScanner(self.folder_scan_filter(folder), self.load_dir_states(folder),
+                                    is_known=lambda file_path: file_path in self.baseline_hashes,
+                                    known_count=self.baseline_hashes.count_in_dir)
+            for file_path, stat_result in scanner.iter_files(folder):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                #nested added folders list the same files twice
+                if file_path not in self.baseline_hashes and file_path not in seen:
+                    seen.add(file_path)
+                    yield file_path, stat_result
+            METRICS.inc('dirs_listed', scanner.listed_dirs)
+            METRICS.inc('dirs_skipped', scanner.skipped_dirs)
+            self.save_dir_states(folder, scanner.new_dir_states)
+
+    def scan_results(self, quick=False, resume=True, max_bytes=None, max_seconds=None):
+        """Run iter_scan to the end and return a dict of status -> list of file paths for every SCAN_STATUSES entry."""
+        results = {status: list() for status in SCAN_STATUSES}
+        for status, file_path, _ in self.iter_scan(quick=quick, resume=resume, max_bytes=max_bytes, max_seconds=max_seconds):
+            results[status].append(file_path)
+        return results
+
+    def select_changes(self, results, paths=None, directories=(), patterns=()):
+        """Pick the scan results to accept.
+
+      Args:
+          results (dict): status -> file paths, as returned by scan_results.
+          paths (iterable, optional): Files to accept. Without paths, directories and patterns every result is selected.
+                A rename is selected by its new or its old path.
+          directories (iterable): Accept every result inside these folders, at any depth.
+          patterns (iterable): Accept every result whose full path matches one of these globs, e.g. '*.log'.
+
+      Returns:
+          tuple: (changed, removed, added, renamed) lists for accept_changes.
+          """
+        changed, removed, added = results[SCAN_CHANGED], results[SCAN_REMOVED], results[SCAN_ADDED]
+        renamed = results[SCAN_RENAMED]
+        if paths is None and not directories and not patterns:
+            return list(changed), list(removed), list(added), list(renamed)
+
+        #records made before symlinks were resolved are keyed by the plain absolute path, both forms select
+        key = self.paths.key
+        selected = set()
+        for path in paths or ():
+            selected.update((key(self.normalise_file_path(path)), key(os.path.normpath(os.path.abspath(path)))))
+        #the trailing separator keeps /data/logs from also selecting /data/logs2
+        prefixes = set()
+        for directory in directories:
+            prefixes.update((os.path.join(key(self.normalise_folder_path(directory)), ''),
+                             os.path.join(key(os.path.normpath(os.path.abspath(directory))), '')))
+        prefixes = tuple(prefixes)
+        patterns = list(patterns)
+
+        def chosen(file_path):
+            if file_path is None:
+                return False
+            file_key = key(file_path)
+            return (file_key in selected or file_key.startswith(prefixes)
+                    or any(fnmatch.fnmatch(file_path, pattern) for pattern in patterns))
+
+        return ([file_path for file_path in changed if chosen(file_path)],
+                [file_path for file_path in removed if chosen(file_path)],
+                [file_path for file_path in added if chosen(file_path)],
+                [new_path for new_path in renamed if chosen(new_path) or chosen(self.renamed_files.get(new_path))])
+
+    def report_results(self, results, list_unchanged=False):
+        """JSON ready report of scan results, renames map the new path to the old one."""
+        report = {'changed': sorted(results[SCAN_CHANGED]), 'removed': sorted(results[SCAN_REMOVED]),
+                  'added': sorted(results[SCAN_ADDED]),
+                  'renamed': {new_path: self.renamed_files.get(new_path) for new_path in sorted(results[SCAN_RENAMED])},
+                  'not_changed': sorted(results[SCAN_NOT_CHANGED]) if list_unchanged else len(results[SCAN_NOT_CHANGED]),
+                  'pending': self.pending_files}
+        if self.changed_ranges:
+            report['changed_ranges'] = self.changed_ranges
+        if self.tampered_records:
+            report['tampered'] = self.tampered_records
+        if self.deleted_records:
+            #signed records deleted from the baseline whose files were not found, only their count is known
+            report['deleted_records'] = len(self.deleted_records)
+        if self.seal_problems:
+            report['seal_problems'] = self.seal_problems
+        return report
+
+    def snapshot_entries(self, results):
+        """Yield a (path, hash, size, mtime_ns) snapshot entry for every file the scan of results saw.
+
+        Unchanged files take their baseline record, changed files the digest the scan found (None when it
+        was not hashed, e.g. a record that failed the seal), added files have no digest. Only the changed,
+        added and renamed files are stat'd again, the baseline is streamed.
+        """
+        removed = set(results[SCAN_REMOVED])
+        removed.update(self.renamed_files.get(new_path) for new_path in results[SCAN_RENAMED])
+        changed = set(results[SCAN_CHANGED])
+
+        def entry(file_path, file_hash):
+            stat_result = stat_regular_file(file_path)
+            if stat_result is None:
+                return file_path, file_hash, None, None
+            return file_path, file_hash, stat_result.st_size, stat_result.st_mtime_ns
+
+        for file_path in self.baseline_hashes:
+            if file_path in removed:
+                continue
+            if file_path in changed:
+                yield entry(file_path, self.scan_hashes.get(file_path))
+                continue
+            record = self.baseline_hashes.get(file_path)
+            if record is not None:
+                yield file_path, record_hash(record), record_size(record), record.get('mtime_ns') if isinstance(record, dict) else None
+        for new_path in results[SCAN_RENAMED]:
+            old_path = self.renamed_files.get(new_path)
+            if old_path in self.baseline_hashes:
+                yield entry(new_path, record_hash(self.baseline_hashes[old_path]))
+        for file_path in results[SCAN_ADDED]:
+            yield entry(file_path, None)
+        for file_path in self.deleted_record_paths:
+            yield entry(file_path, None)
+
+    def take_snapshot(self, results, label=None):
+        """Save the scan results as a new snapshot. Returns its metadata, None if it could not be written."""
+        try:
+            with METRICS.timer('snapshot_write'):
+                return self.snapshots.take(self.snapshot_entries(results), label, pending=self.pending_files,
+                                           counts={status: len(file_paths) for status, file_paths in results.items()})
+        except (OSError, UnicodeError) as e:
+            print(f"Error writing the snapshot: {e}")
+            return None
+
+    def classify_files(self, quick=False):
+        """Sort files_to_check into changed, removed and not changed lists.
+
+      Args:
+          quick (bool): Skip rehashing files with an unchanged size/mtime/inode/ctime.
+
+      Returns:
+          tuple: (changed, removed, not_changed) lists of file paths.
+          """
+        results = self.scan_results(quick)
+        return results[SCAN_CHANGED], results[SCAN_REMOVED], results[SCAN_NOT_CHANGED]
+
+    def use_quick_check(self, quick_requested):
+        """Decide if the next check may use the stat fast path or must be a full paranoid sweep."""
+        quick = bool(quick_requested)
+        if quick and self.paranoid_every and self.quick_checks_since_full >= self.paranoid_every:
+            print("Running a full paranoid check instead of a quick check.")
+            quick = False
+
+        #the counter lives in the store so the paranoid sweep still happens across restarts
+        self.quick_checks_since_full = self.quick_checks_since_full + 1 if quick else 0
+        self.baseline_store.set_meta('quick_checks_since_full', self.quick_checks_since_full)
+        return quick
+
+    def accept_changes(self, changed=(), removed=(), added=(), renamed=()):
+        """Accept changed, removed, added and renamed files into the baseline with one batched write.
+
+        Changed files whose stat did not move on since the last scan get the digest that scan computed,
+        only the others and the added files are read again.
+
+      Args:
+          changed (iterable): Files whose current content becomes their new baseline.
+          removed (iterable): Files to drop from the baseline.
+          added (iterable): New files found in the added folders, hashed into the baseline.
+          renamed (iterable): New paths of renamed files found by the last scan, their record moves along.
+
+      Returns:
+          tuple: (number of changes, removals, additions and renames accepted).
+          """
+        renamed = {new_path: self.renamed_files[new_path] for new_path in renamed
+                   if new_path in self.renamed_files and self.renamed_files[new_path] in self.baseline_hashes}
+        #a file whose signed record was deleted gets a new record
+        changed = [file_path for file_path in changed
+                   if file_path in self.baseline_hashes or file_path in self.deleted_record_paths]
+        added = [file_path for file_path in added if file_path not in self.baseline_hashes]
+        stats = {file_path: stat_regular_file(file_path) for file_path in changed + added}
+
+        #changed files still at the version the last scan hashed take its digest, only the rest is read again
+        records = dict()
+        for file_path in changed:
+            scan_record = self.scan_records.get(file_path)
+            if scan_record is not None and stats[file_path] is not None and stat_unchanged(scan_record, stats[file_path]):
+                records[file_path] = scan_record
+        METRICS.inc('accept_reused_digests', len(records))
+        records.update(self.hash_records({file_path: stat_result for file_path, stat_result in stats.items()
+                                          if stat_result is not None and file_path not in records}))
+        removed = [file_path for file_path in removed if file_path in self.baseline_hashes]
+
+        #a renamed record keeps its hash, only the stat data of the new path is taken over
+        moved = dict()
+        for new_path, old_path in renamed.items():
+            stat_result = stat_regular_file(new_path)
+            if stat_result is not None:
+                moved[new_path] = refresh_record(self.baseline_hashes[old_path], stat_result)
+
+        try:
+            self.baseline_store.apply_changes({**records, **moved}, removed + [renamed[new_path] for new_path in moved])
+        except (sqlite3.Error, OSError, SealError) as e:
+            print(f"Error updating baseline hashes: {e}")
+            return 0, 0, 0, 0
+
+        self.baseline_hashes.update(records)
+        for file_path in records:
+            self.scan_records.pop(file_path, None)
+        for new_path, record in moved.items():
+            del self.baseline_hashes[renamed[new_path]]
+            self.baseline_hashes[new_path] = record
+            del self.renamed_files[new_path]
+        for file_path in removed:
+            del self.baseline_hashes[file_path]
+        accepted_additions = sum(1 for file_path in added if file_path in records)
+        return len(records) - accepted_additions, len(removed), accepted_additions, len(moved)
+
+    #compute hash and add file to baseline_hashes
+    def save_baseline(self, file_path, file_hash=None, stat_result=None):
+        #stat is taken before hashing, so a write racing the hash shows up as a stat mismatch later
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        if file_hash is None and self.use_chunks(stat_result):
+            record = self.build_chunked_record(file_path, stat_result)
+        else:
+            if file_hash is None:
+                file_hash = self.compute_file_hash(file_path, self.record_algorithms())
+            record = self.build_record(file_hash, stat_result)
+
+        #normalisig file path to have consistency in file path formats
+        normalise_file_path = self.normalise_file_path(file_path)
+
+        self.save_baseline_records({normalise_file_path: record})
+
+    def save_baseline_records(self, records):
+        """Add a batch of baseline records (normalised file path -> record) in one store write."""
+        self.append_to_baseline_hashes(records)
+
+        #adding to baseline_hashes for real time consistency, files_to_check is a view of its keys
+        self.baseline_hashes.update(records)
+
+    def load_baseline(self, file_path):
+        # Load from file or database
+        self.saved_hash = record_hash(self.baseline_hashes[file_path])
+        return self.saved_hash
+
+    def check_hash(self, file_path):
+        return self.verify_file(file_path)[0] == SCAN_NOT_CHANGED
+
+    def verify_file(self, file_path):
+        """Check a single baselined file against its record, used by the real time monitor.
+
+      Returns:
+          tuple: (status, current_hash) with status one of SCAN_STATUSES.
+          """
+        saved_record = self.baseline_hashes[file_path]
+        if self.verify_seal([file_path]):
+            return SCAN_CHANGED, None
+        stat_result = stat_regular_file(file_path)
+        if stat_result is None:
+            return SCAN_REMOVED, None
+
+        current_hash = self.current_hash(file_path, saved_record, stat_result)
+        if current_hash is not None and current_hash == record_hash(saved_record):
+            return SCAN_NOT_CHANGED, current_hash
+        return SCAN_CHANGED, current_hash
+
+    def current_hash(self, file_path, saved_record, stat_result):
+        """Hash a file the way saved_record was made: same algorithm, and as a Merkle root for chunked records."""
+        chunks = record_chunks(saved_record)
+        if chunks is not None:
+            current = self.build_chunked_record(file_path, stat_result, chunks[0], record_algorithm(saved_record))
+            return self.comparable_root(saved_record, current)
+        return self.compute_file_hash(file_path, record_algorithm(saved_record))
+
+    def paths_with_hash(self, file_hash):
+        """Baselined file paths whose content has file_hash, e.g. the copies of a duplicated file."""
+        return self.baseline_store.paths_with_hash(file_hash)
+
+    def add_folder_to_added_folders(self, folder, scan_filter=None):
+        """Store folder (and its scan filter) in the added folders. Returns False if they could not be stored."""
+        folder = self.normalise_folder_path(folder)
+        try:
+            #both meta keys are sealed, the in-memory copies only change once the store took them
+            if folder not in self.added_folders:
+                self.baseline_store.set_meta('added_folders', sorted(self.added_folders | {folder}))
+                self.added_folders.add(folder)
+            if scan_filter is not None and self.folder_filters.get(folder) != scan_filter.to_dict():
+                self.baseline_store.set_meta('folder_filters', {**self.folder_filters, folder: scan_filter.to_dict()})
+                self.folder_filters[folder] = scan_filter.to_dict()
+        except (sqlite3.Error, OSError, SealError) as e:
+            print(f"Error saving the added folders: {e}")
+            return False
+        return True
+
+    def get_added_folders(self):
+        return self.added_folders
+
+    def folder_scan_filter(self, folder):
+        return ScanFilter.from_dict(self.folder_filters.get(folder))
+
+    def load_dir_states(self, folder):
+        try:
+            dir_states = self.baseline_store.load_dir_states(folder)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error reading folder states: {e}")
+            return {}
+        if self.seal is None:
+            return dir_states
+        #a forged state would skip a directory and hide the files added to it
+        return {directory: state for directory, state in dir_states.items() if self.seal.cache_trusted('dir', directory, state)}
+
+    def save_dir_states(self, folder, dir_states):
+        #the number of baselined files per directory, a later scan lists a directory again if it differs
+        dir_states = {directory: {**state, 'known_files': self.baseline_hashes.count_in_dir(directory)}
+                      for directory, state in dir_states.items()}
+        if self.seal is not None:
+            dir_states = {directory: self.seal.seal_cache('dir', directory, state) for directory, state in dir_states.items()}
+        try:
+            self.baseline_store.save_dir_states(folder, dir_states)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error saving folder states: {e}")
+
+    def add_file_to_added_files(self, file):
+        self.added_files.add(file)
+
+    def normalise_file_path(self, file_path):
+        """Canonical baseline key of a file, see fic_paths.PathCanonicalizer."""
+        return self.paths.canonical(file_path)
+
+    def normalise_folder_path(self, folder):
+        """Canonical form of a folder, a symlinked folder is resolved to its target."""
+        return self.paths.canonical_dir(folder)
+
+    def create_baseline_file(self):
+        """
+        Creates the FIC folder and opens the baseline store inside it.
+        An existing baseline_hashes.json is imported the first time the store is created.
+        """
+
+        #file_path = "C:\\Program Files\\FIC\\baseline\\baseline_hashes.txt"
+        os.makedirs(os.path.dirname(self.baseline_store_path), exist_ok=True)
+
+        self.baseline_store = open_baseline_store(self.baseline_store_path, legacy_json_path=self.baseline_file_path)
+
+    #update data in baseline store
+    def append_to_baseline_hashes(self, data):
+        """Updates the baseline store with the given data in a single transaction.
+
+      Args:
+          data (dict): The data to update or add to the baseline hashes.
+    """
+        try:
+            with METRICS.timer('store_write'):
+                self.baseline_store.upsert_many(data)
+        except (sqlite3.Error, OSError, SealError, UnicodeError) as e:
+            print(f"Error updating baseline hashes: {e}")
+
+    #function to retrieve data from baseline store
+    def retrieve_data_from_baseline_hashes(self):
+        """Retrieves data from the baseline store.
+
+      Args:
+          None
+
+      Returns:
+          CompactBaseline: Every record in the baseline store, streamed from the store into the compact mapping.
+          """
+
+        baseline = CompactBaseline()
+        try:
+            with METRICS.timer('store_load'):
+                baseline.update(self.baseline_store.iter_all())
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error reading baseline store {self.baseline_store_path}: {e}")
+            return CompactBaseline()
+        return baseline
+
+    def export_baseline_hashes(self, json_path=None):
+        """Write the baseline store out in the baseline_hashes.json format."""
+        json_path = json_path or self.baseline_file_path
+        with METRICS.timer('export_json'):
+            count = self.baseline_store.export_json(json_path)
+        print(f"Exported {count} record(s) to {json_path}")
+        return count
+
+    def update_baseline_hashes(self, operation, file_name, new_name=None, new_hash=None, new_stat=None):
+        """
+        Update the baseline store.
+
+        Args:
+            operation (str): The operation to perform ('remove', 'rename', 'change').
+            file_name (str): The name of the file to update.
+            new_name (str, optional): The new name for the file if renaming.
+            new_hash (str, optional): The new hash value for the file if changing the hash,
+                computed with the algorithm already recorded for the file.
+            new_stat (os.stat_result, optional): Stat of the file taken before computing new_hash.
+
+        Raises:
+            ValueError: If an invalid operation is provided.
+        """
+        try:
+            if operation == 'remove':
+                if file_name in self.baseline_hashes:
+                    self.baseline_store.delete_many([file_name])
+                    del self.baseline_hashes[file_name]
+                    print(f"Deleted {file_name} from baseline hashes.")
+                else:
+                    print(f"{file_name} not found in baseline hashes.")
+
+            elif operation == 'rename':
+                if file_name in self.baseline_hashes:
+                    if new_name is not None:
+                        self.baseline_store.rename(file_name, new_name)
+                        self.baseline_hashes[new_name] = self.baseline_hashes.pop(file_name)
+                        print(f"Renamed {file_name} to {new_name}.")
+                    else:
+                        print("New name must be provided for renaming.")
+                else:
+                    print(f"{file_name} not found in baseline hashes.")
+
+            elif operation == 'change':
+                if file_name in self.baseline_hashes:
+                    if new_hash is not None:
+                        if new_stat is None:
+                            new_stat = os.stat(file_name)
+                        record = make_record(new_hash, new_stat, record_algorithm(self.baseline_hashes[file_name]))
+                        self.baseline_store.upsert_many({file_name: record})
+
+                        #update baseline_hash list too
+                        self.baseline_hashes[file_name] = record
+                        print(f"Changed hash for {file_name}.")
+                    else:
+                        print("New hash value must be provided for changing hash.")
+                else:
+                    print(f"{file_name} not found in baseline hashes.")
+
+            else:
+                raise ValueError("Invalid operation. Use 'remove', 'rename', or 'change'.")
+
+        except (sqlite3.Error, OSError, SealError) as e:
+            print(f"Error updating baseline hashes: {e}")
+
+    def open_seal(self):
+        """Check the signed root of a sealed baseline, or seal the baseline the first time a key is given.
+
+        Only the root signature is checked here, the records themselves are checked against the tree
+        by the scans (all files) and by verify_file (one file).
+        """
+        state = self.baseline_store.get_meta('baseline_seal')
+        if not self.seal_key:
+            if state is not None:
+                #the store refuses every write that would have to update the tree, self.seal stays None
+                #as nothing can be verified without the key either
+                print("Warning: the baseline is sealed but no seal key was given, its signature is not checked "
+                      "and it can not be changed.")
+                self.baseline_store.set_seal(MerkleSeal(MissingKeySigner(state), state['depth']))
+            return
+
+        #the depth of a new tree is picked by reseal_baseline from the baseline size
+        self.seal = MerkleSeal(load_signer(self.seal_key), state['depth']) if state else MerkleSeal(load_signer(self.seal_key))
+        self.baseline_store.set_seal(self.seal)
+        if state is None:
+            self.reseal_baseline()
+            return
+        with METRICS.timer('seal_verify'):
+            problem = self.seal.verify_root(state, self.baseline_store.load_merkle)
+        if problem is not None:
+            print(f"Warning: {problem}")
+            self.seal_problems.append(problem)
+            #no update may be signed on top of it
+            self.seal.problem = problem
+            return
+        try:
+            if state.get('version', 1) < SEAL_VERSION:
+                #the root is valid, the added folders and their filters are sealed from now on
+                self.baseline_store.seal_meta()
+                return
+            changed = self.baseline_store.verify_seal_meta()
+        except (sqlite3.Error, OSError, SealError) as e:
+            print(f"Error checking the sealed added folders: {e}")
+            return
+        if changed:
+            print(f"Warning: {META_CHANGED} ({', '.join(changed)})")
+            self.seal_problems.append(META_CHANGED)
+
+    def reseal_baseline(self):
+        """Build the Merkle tree of the whole baseline and sign it with the seal key, replacing an existing seal."""
+        try:
+            with METRICS.timer('seal_build'):
+                self.baseline_store.reseal(self.baseline_hashes)
+        except (sqlite3.Error, OSError, SealError) as e:
+            print(f"Error sealing the baseline: {e}")
+            return False
+        self.seal_problems = []
+        print(f"Sealed {len(self.baseline_hashes)} baseline record(s) with {self.seal.signer.scheme} key {self.seal.signer.key_id}")
+        return True
+
+    def verify_seal_all(self):
+        """Check every baseline record against the sealed baseline and return the set of tampered file paths.
+
+        The path digests of signed records that are no longer in the baseline go to deleted_records,
+        iter_scan names those whose file is still in an added folder.
+        """
+        self.deleted_records = set()
+        if self.seal is None:
+            return set()
+        try:
+            with METRICS.timer('seal_verify'):
+                tampered, self.deleted_records = self.baseline_store.verify_seal_all(self.baseline_hashes)
+        except SealError as e:
+            if str(e) not in self.seal_problems:
+                print(f"Warning: {e}")
+                self.seal_problems.append(str(e))
+            return set()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error reading the baseline seal: {e}")
+            return set()
+        if any(file_path.startswith(META_ENTRY_PREFIX) for file_path in tampered):
+            if META_CHANGED not in self.seal_problems:
+                print(f"Warning: {META_CHANGED}")
+                self.seal_problems.append(META_CHANGED)
+            tampered = [file_path for file_path in tampered if not file_path.startswith(META_ENTRY_PREFIX)]
+        for file_path in tampered:
+            print(f"Baseline record of {file_path} does not match the signed baseline")
+        if self.deleted_records:
+            print(f"{len(self.deleted_records)} record(s) of the signed baseline were deleted from the baseline")
+        return set(tampered)
+
+    def verify_seal(self, file_paths):
+        """Return the set of file_paths whose baseline record does not match the sealed baseline.
+
+        Checking k records reads k paths of the Merkle tree. A root that is not validly signed is
+        added to seal_problems instead, no single record can be trusted or blamed then.
+        """
+        if self.seal is None:
+            return set()
+        try:
+            with METRICS.timer('seal_verify'):
+                tampered = self.baseline_store.verify_seal(list(file_paths), self.baseline_hashes)
+        except SealError as e:
+            if str(e) not in self.seal_problems:
+                print(f"Warning: {e}")
+                self.seal_problems.append(str(e))
+            return set()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error reading the baseline seal: {e}")
+            return set()
+        for file_path in tampered:
+            print(f"Baseline record of {file_path} does not match the signed baseline")
+        return set(tampered)
+
+    def close(self):
+        self.baseline_store.close()
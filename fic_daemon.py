@@ -0,0 +1,447 @@
+"""Long running IntegriSecure service: real time monitoring and periodic scans under one asyncio event loop,
+controlled through a local HTTP API so several clients share one loaded baseline.
+
+Started with `python fic_cli.py [options] daemon [--socket PATH | --port PORT] [--scan-interval MINUTES]`.
+The API listens on a Unix socket (only the owner may connect) or on 127.0.0.1, bodies and answers are JSON.
+Every local user can reach 127.0.0.1, so there requests need `Authorization: Bearer TOKEN` with the fleet token
+(--token-file, else $FIC_FLEET_TOKEN or fleet.token in the config folder). POST bodies must be sent as
+`Content-Type: application/json` and requests with an Origin header are refused, a web page can reach neither API:
+
+    GET  /status   state of the daemon, the monitor and the last scan
+    POST /scan     start a scan, body {"quick": bool, "fresh": bool, "max_mb": int, "max_minutes": float}
+    POST /cancel   stop the running scan
+    GET  /results  results of the last scan, in the format of `fic check --json`
+    POST /accept   accept results of the last scan, body {"all": true} or any of
+                   {"paths": [...], "directories": [...], "patterns": ["*.log", ...]}
+    GET  /events   newline delimited JSON stream of monitor alerts and scan results as they are found
+
+For example: curl --unix-socket $XDG_RUNTIME_DIR/FIC/fic.sock -H 'Content-Type: application/json' -d '{"quick": true}' http://fic/scan
+"""
+import asyncio
+import errno
+import hmac
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from fic_core import SCAN_NOT_CHANGED, SCAN_STATUSES
+from fic_paths import default_data_dir, default_runtime_dir
+from rt_file_monitoring import EventPipeline, Notifier, start_observer, METRICS_WRITE_SECONDS
+from metrics import METRICS
+
+
+SOCKET_NAME = "fic.sock"
+#events buffered per /events client, a client that falls further behind is disconnected
+SUBSCRIBER_QUEUE_SIZE = 10000
+#largest request body accepted, accept requests with many paths are the biggest
+MAX_BODY_SIZE = 16 * 1024 * 1024
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 415: "Unsupported Media Type"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class DaemonNotifier(Notifier):
+    """Notifier that also hands every verified change to the daemon's /events clients.
+
+    Desktop notifications are optional, a daemon usually runs without a desktop session.
+    """
+
+    def __init__(self, daemon, desktop=False):
+        super().__init__()
+        self.daemon = daemon
+        self.desktop = desktop
+
+    def add(self, status, file_path):
+        super().add(status, file_path)
+        #called from the verification workers
+        self.daemon.publish_threadsafe({'event': 'monitor', 'status': status, 'path': file_path})
+
+    def show_notification(self, title, message):
+        if self.desktop:
+            super().show_notification(title, message)
+
+
+class FicDaemon:
+    """Runs the monitor, periodic scans and the control API of one IntegrityChecker on an asyncio loop.
+
+    The loop itself only routes events and requests. Hashing runs on executors: monitor verifications
+    on the EventPipeline workers, scans on the default executor (which hands the files to the checker's
+    hash engine). Scans and accepts change the checker's state and never run at the same time.
+    """
+
+    def __init__(self, checker, scan_interval=None, quick=True, desktop_notifications=False, metrics_file=None,
+                 snapshot_keep=None, token=None):
+        self.checker = checker
+        #bearer token every request needs, None accepts any client that can connect
+        self.token = token
+        #seconds between periodic scans, None only scans on request
+        self.scan_interval = scan_interval
+        #every complete scan is saved as a snapshot and only the newest snapshot_keep are kept, None takes none
+        self.snapshot_keep = snapshot_keep
+        self.quick = quick
+        self.desktop_notifications = desktop_notifications
+        self.metrics_file = metrics_file
+
+        self.loop = None
+        self.busy = None
+        self.stopping = None
+        self.scan_task = None
+        self.cancel_event = threading.Event()
+        self.subscribers = set()
+        self.started = None
+        self.pipeline = None
+        self.observer = None
+        self.watches = (0, 0)
+        #status -> file paths of the last finished scan, what /accept picks from
+        self.results = None
+        self.last_scan = None
+
+    def publish(self, event):
+        """Send event to every /events client, runs on the loop."""
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                #a stalled client must not make the daemon buffer without limit, its stream is ended
+                self.subscribers.discard(subscriber)
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(None)
+
+    def publish_threadsafe(self, event):
+        if self.loop is not None and self.subscribers:
+            self.loop.call_soon_threadsafe(self.publish, event)
+
+    def status(self):
+        return {
+            'state': 'scanning' if self.scanning() else 'idle',
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+            'baseline_files': len(self.checker.baseline_hashes),
+            'added_folders': sorted(self.checker.get_added_folders()),
+            'monitor': {'recursive_watches': self.watches[0], 'directory_watches': self.watches[1],
+                        'events_received': METRICS.value('events_received'), 'verifications': METRICS.value('verifications'),
+                        'pending_verifications': METRICS.value('pending_verifications')},
+            'scan_interval_seconds': self.scan_interval,
+            'last_scan': self.last_scan,
+            'sealed': self.checker.seal is not None,
+            'seal_problems': self.checker.seal_problems,
+            'clients': len(self.subscribers),
+        }
+
+    def scanning(self):
+        return self.scan_task is not None and not self.scan_task.done()
+
+    def start_scan(self, quick=None, resume=True, max_bytes=None, max_seconds=None):
+        """Start a scan task. Returns False when one is already running."""
+        if self.scanning():
+            return False
+        self.cancel_event.clear()
+        self.scan_task = asyncio.ensure_future(self.run_scan(self.quick if quick is None else quick, resume, max_bytes, max_seconds))
+        return True
+
+    async def run_scan(self, quick, resume, max_bytes, max_seconds):
+        async with self.busy:
+            start = time.time()
+            self.publish({'event': 'scan_started', 'quick': quick})
+            try:
+                results = await self.loop.run_in_executor(None, self.scan, quick, resume, max_bytes, max_seconds)
+            except Exception as e:
+                print(f"Scan failed: {e}")
+                self.publish({'event': 'scan_failed', 'error': str(e)})
+                return
+            self.results = results
+            self.last_scan = {'started': start, 'seconds': round(time.time() - start, 3), 'quick': quick,
+                              'cancelled': self.cancel_event.is_set(), 'pending': self.checker.pending_files,
+                              'counts': {status: len(file_paths) for status, file_paths in results.items()}}
+            self.publish({'event': 'scan_finished', **self.last_scan})
+
+    def scan(self, quick, resume, max_bytes, max_seconds):
+        #runs on the executor, results are streamed to the clients as the checker yields them
+        results = {status: list() for status in SCAN_STATUSES}
+        quick = self.checker.use_quick_check(quick)
+        for status, file_path, _ in self.checker.iter_scan(quick=quick, cancel_event=self.cancel_event, resume=resume,
+                                                           max_bytes=max_bytes, max_seconds=max_seconds):
+            results[status].append(file_path)
+            if status != SCAN_NOT_CHANGED:
+                self.publish_threadsafe({'event': 'scan_result', 'status': status, 'path': file_path,
+                                         'old_path': self.checker.renamed_files.get(file_path)})
+        #a cancelled or budget limited scan did not see every file, it would make a misleading snapshot
+        if self.snapshot_keep and not self.cancel_event.is_set() and not self.checker.pending_files:
+            meta = self.checker.take_snapshot(results)
+            if meta is not None:
+                self.checker.snapshots.prune(keep=self.snapshot_keep)
+                self.publish_threadsafe({'event': 'snapshot', 'id': meta['id'], 'entries': meta['entries']})
+        return results
+
+    async def accept(self, paths=None, directories=(), patterns=()):
+        if self.results is None:
+            raise ApiError(409, "No scan finished yet, there is nothing to accept.")
+        if self.scanning():
+            raise ApiError(409, "A scan is running, accept its results once it finished.")
+        async with self.busy:
+            selection = self.checker.select_changes(self.results, paths, directories, patterns)
+            accepted = await self.loop.run_in_executor(None, lambda: self.checker.accept_changes(*selection))
+            #accepted files are no longer results of the last scan
+            done = {file_path for file_paths in selection for file_path in file_paths}
+            for status in self.results:
+                self.results[status] = [file_path for file_path in self.results[status] if file_path not in done]
+        counts = dict(zip(('changed', 'removed', 'added', 'renamed'), accepted))
+        self.publish({'event': 'accepted', **counts})
+        return counts
+
+    async def handle_request(self, method, path, body):
+        """Route one API request. Returns (HTTP status, JSON body) or an async iterator for /events."""
+        routes = {
+            '/status': ('GET',), '/results': ('GET',), '/events': ('GET',),
+            '/scan': ('POST',), '/cancel': ('POST',), '/accept': ('POST',),
+        }
+        if path not in routes:
+            raise ApiError(404, f"Unknown path {path}")
+        if method not in routes[path]:
+            raise ApiError(405, f"{path} only takes {', '.join(routes[path])}")
+
+        if path == '/status':
+            return 200, self.status()
+        if path == '/results':
+            if self.results is None:
+                raise ApiError(409, "No scan finished yet.")
+            return 200, self.checker.report_results(self.results)
+        if path == '/events':
+            return 200, self.events()
+        if path == '/scan':
+            for key in ('quick', 'fresh'):
+                if not isinstance(body.get(key, False), bool):
+                    raise ApiError(400, f"\"{key}\" must be true or false.")
+            for key in ('max_mb', 'max_minutes'):
+                value = body.get(key)
+                #bool is an int subclass, true is no budget
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+                    raise ApiError(400, f"\"{key}\" must be a positive number.")
+            max_mb, max_minutes = body.get('max_mb'), body.get('max_minutes')
+            started = self.start_scan(quick=body.get('quick'), resume=not body.get('fresh', False),
+                                      max_bytes=max_mb * 1024 * 1024 if max_mb is not None else None,
+                                      max_seconds=max_minutes * 60 if max_minutes is not None else None)
+            if not started:
+                raise ApiError(409, "A scan is already running.")
+            return 202, {'started': True}
+        if path == '/cancel':
+            self.cancel_event.set()
+            return 200, {'cancelled': self.scanning()}
+        #/accept
+        if body.get('all'):
+            return 200, await self.accept()
+        selectors = ('paths', 'directories', 'patterns')
+        if not any(body.get(key) for key in selectors):
+            raise ApiError(400, "Give the files to accept in \"paths\", \"directories\" or \"patterns\", or \"all\": true.")
+        for key in selectors:
+            if not isinstance(body.get(key, []), list):
+                raise ApiError(400, f"\"{key}\" must be a list.")
+        return 200, await self.accept(body.get('paths', []), body.get('directories', []), body.get('patterns', []))
+
+    async def events(self):
+        subscriber = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(subscriber)
+        try:
+            while (event := await subscriber.get()) is not None:
+                yield event
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def authorized(self, header):
+        if not self.token:
+            return True
+        return header is not None and hmac.compare_digest(header, f"Bearer {self.token}")
+
+    async def handle_client(self, reader, writer):
+        """Minimal HTTP/1.1 server side, one request per connection."""
+        try:
+            try:
+                request_line = (await reader.readline()).decode('latin-1').split()
+                if len(request_line) != 3:
+                    return
+                method, path = request_line[0], request_line[1].split('?', 1)[0]
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                #browsers send an Origin with cross site requests, no client of this API does
+                if 'origin' in headers:
+                    raise ApiError(403, "Requests from web pages are not accepted.")
+                if not self.authorized(headers.get('authorization')):
+                    raise ApiError(401, "Missing or wrong token.")
+                #a form post needs no CORS preflight, a JSON one does
+                if method == 'POST' and headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+                    raise ApiError(415, "Send the request body as Content-Type: application/json.")
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    raise ApiError(413, f"Request bodies are limited to {MAX_BODY_SIZE} bytes.")
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                if not isinstance(body, dict):
+                    raise ApiError(400, "The request body must be a JSON object.")
+                status, result = await self.handle_request(method, path, body)
+            except ApiError as e:
+                status, result = e.status, {'error': str(e)}
+            except (ValueError, UnicodeDecodeError) as e:
+                status, result = 400, {'error': f"Invalid request: {e}"}
+
+            if hasattr(result, '__aiter__'):
+                writer.write(self.http_head(status, 'application/x-ndjson'))
+                await writer.drain()
+                async for event in result:
+                    writer.write(json.dumps(event).encode('utf-8') + b"\n")
+                    await writer.drain()
+            else:
+                data = json.dumps(result, indent=4).encode('utf-8') + b"\n"
+                writer.write(self.http_head(status, 'application/json', len(data)) + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            #the client went away
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def http_head(status, content_type, length=None):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}", f"Content-Type: {content_type}", "Connection: close"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+    async def run_coalescer(self):
+        while True:
+            await asyncio.sleep(self.pipeline.debounce / 2)
+            self.pipeline.coalesce()
+
+    async def run_periodic_scans(self):
+        while True:
+            await asyncio.sleep(self.scan_interval)
+            if not self.start_scan():
+                print("Skipping the periodic scan, the last one is still running.")
+
+    async def run_metrics_writer(self):
+        while True:
+            await asyncio.sleep(METRICS_WRITE_SECONDS)
+            METRICS.write_prometheus(self.metrics_file)
+
+    async def serve(self, socket_path=None, port=None):
+        """Run until SIGINT/SIGTERM. Listens on socket_path, or on 127.0.0.1:port when port is given."""
+        self.loop = asyncio.get_running_loop()
+        self.busy = asyncio.Lock()
+        self.stopping = asyncio.Event()
+        self.started = time.monotonic()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(signal_number, self.stopping.set)
+            except (NotImplementedError, RuntimeError):
+                #Windows event loops have no signal handlers, Ctrl+C still stops asyncio.run
+                pass
+
+        if port is not None:
+            server = await asyncio.start_server(self.handle_client, '127.0.0.1', port)
+            address = f"http://127.0.0.1:{port}"
+        else:
+            if os.path.exists(socket_path):
+                if socket_in_use(socket_path):
+                    raise OSError(errno.EADDRINUSE, f"Another daemon is already listening on {socket_path}")
+                #left behind by a daemon that was killed
+                os.remove(socket_path)
+            #created with the umask applied so it is never reachable by other users, not even briefly
+            old_umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self.handle_client, path=socket_path)
+            finally:
+                os.umask(old_umask)
+            #only this socket is removed on exit, not one a later daemon put in its place
+            socket_inode = os.stat(socket_path).st_ino
+            address = socket_path
+
+        self.pipeline = EventPipeline(self.checker, DaemonNotifier(self, self.desktop_notifications))
+        self.observer, roots, directories = start_observer(self.checker.get_files_to_check(), self.checker.get_added_folders(),
+                                                           self.pipeline)
+        self.watches = (len(roots), len(directories))
+        tasks = [asyncio.ensure_future(self.run_coalescer())]
+        if self.scan_interval:
+            tasks.append(asyncio.ensure_future(self.run_periodic_scans()))
+        if self.metrics_file:
+            tasks.append(asyncio.ensure_future(self.run_metrics_writer()))
+        print(f"Daemon listening on {address}")
+
+        try:
+            await self.stopping.wait()
+        finally:
+            print("Stopping the daemon")
+            server.close()
+            for task in tasks:
+                task.cancel()
+            #ends the /events streams
+            self.publish(None)
+            if self.scanning():
+                self.cancel_event.set()
+                await asyncio.wait([self.scan_task])
+            self.observer.stop()
+            await self.loop.run_in_executor(None, self.observer.join)
+            self.pipeline.stop()
+            await server.wait_closed()
+            if socket_path is not None and port is None:
+                try:
+                    if os.stat(socket_path).st_ino == socket_inode:
+                        os.remove(socket_path)
+                except FileNotFoundError:
+                    pass
+
+
+def socket_in_use(socket_path):
+    """Check if a process accepts connections on the Unix socket, the socket of a killed daemon refuses them."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(1)
+        try:
+            client.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        except OSError:
+            #a full backlog times out, someone is listening
+            return True
+    return True
+
+
+def default_socket_path(data_dir):
+    """Socket of the daemon of data_dir, None where Unix sockets are not available and a port has to be used.
+
+    The daemon of the default data folder listens in $XDG_RUNTIME_DIR/FIC when the session has one,
+    other data folders and sessions without it keep the socket in the data folder.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    runtime_dir = default_runtime_dir()
+    if runtime_dir is not None and os.path.abspath(data_dir) == os.path.abspath(default_data_dir()):
+        os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+        return os.path.join(runtime_dir, SOCKET_NAME)
+    return os.path.join(data_dir, SOCKET_NAME)
+
+
+def run_daemon(checker, socket_path=None, port=None, scan_interval=None, quick=True, desktop_notifications=False,
+               metrics_file=None, snapshot_keep=None, token=None):
+    """Run a FicDaemon for checker until it is stopped.
+
+      Args:
+          token (str, optional): Bearer token of the API on port, which every local user can reach.
+              The Unix socket is only open to its owner and takes no token.
+    """
+    socket_path = socket_path or default_socket_path(checker.data_dir)
+    if socket_path is None and port is None:
+        raise ValueError("Unix sockets are not available on this platform, give a port.")
+    if port is not None and not token:
+        raise ValueError("The API on a port needs a token, give --token-file or set FIC_FLEET_TOKEN.")
+    daemon = FicDaemon(checker, scan_interval, quick, desktop_notifications, metrics_file, snapshot_keep,
+                       token if port is not None else None)
+    try:
+        asyncio.run(daemon.serve(socket_path, port))
+    except KeyboardInterrupt:
+        pass
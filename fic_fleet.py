@@ -0,0 +1,372 @@
+"""Fleet mode: agents scan their own host and ship delta reports to a collector that merges them into a fleet view.
+
+An agent report is the `check --json` report of one scan (changed, removed, added and renamed files) with
+the changed files mapped to their new digest, plus summary counts. It never holds the baseline itself. Reports are spooled to an outbox folder first
+and sent in gzip compressed batches, so a collector that is down only delays them.
+
+    python fic_cli.py collector --port 8765 --token-file /etc/fic/fleet.token
+    python fic_cli.py agent --collector http://collector:8765 --token-file /etc/fic/fleet.token --interval 60
+
+Collector API, bodies and answers are JSON, requests need `Authorization: Bearer TOKEN` when a token is set:
+
+    POST /reports       batch of agent reports, {"reports": [...]}, gzip with Content-Encoding: gzip
+    GET  /fleet         per host summary (last report, counts, stale) and fleet wide totals
+    GET  /hosts/NAME    latest report of one host
+
+LocalTransport hands batches to an in-process FleetCollector through the same encoding, a stand-in
+for the HTTP collector in tests and single host setups.
+"""
+import gzip
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from fic_core import SCAN_CHANGED, SCAN_NOT_CHANGED, SCAN_STATUSES
+from fic_paths import default_config_dir
+
+
+REPORT_VERSION = 1
+#reports sent in one request, a long outage is caught up in several batches
+MAX_BATCH_REPORTS = 50
+#reports kept in the outbox while the collector is unreachable, the oldest are dropped beyond that
+MAX_OUTBOX_REPORTS = 1000
+#largest decompressed batch the collector takes, a gzip bomb stops here
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+TOKEN_NAME = "fleet.token"
+#a host without a report for this long is flagged as stale in the fleet view
+DEFAULT_STALE_SECONDS = 3 * 3600
+DEFAULT_PORT = 8765
+
+
+class FleetError(Exception):
+    """A batch could not be delivered to the collector or the collector refused it."""
+
+
+def encode_batch(reports):
+    return gzip.compress(json.dumps({'reports': reports}).encode('utf-8'))
+
+
+def decode_batch(body, encoding=None):
+    """Reports of a request body, gunzipped when encoding is gzip. Raises ValueError for a bad batch."""
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = decompressor.decompress(body, MAX_BATCH_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"The batch is larger than {MAX_BATCH_BYTES} bytes.")
+    batch = json.loads(body.decode('utf-8'))
+    reports = batch.get('reports') if isinstance(batch, dict) else None
+    if not isinstance(reports, list):
+        raise ValueError("The batch has no \"reports\" list.")
+    for report in reports:
+        if not isinstance(report, dict) or not isinstance(report.get('host'), str) or not isinstance(report.get('seq'), int):
+            raise ValueError("Every report needs a \"host\" and a \"seq\".")
+    return reports
+
+
+def read_token(token_file=None, config_dir=None):
+    """Shared secret of the agents and the collector. None disables it.
+
+    Taken from token_file, else FIC_FLEET_TOKEN, else fleet.token in the config folder if there is one.
+    """
+    if not token_file and os.environ.get('FIC_FLEET_TOKEN'):
+        return os.environ['FIC_FLEET_TOKEN']
+    if not token_file:
+        token_file = os.path.join(config_dir or default_config_dir(), TOKEN_NAME)
+        if not os.path.exists(token_file):
+            return None
+    with open(token_file) as f:
+        return f.read().strip() or None
+
+
+class HttpTransport:
+    """Sends batches to a collector at url with a POST /reports."""
+
+    def __init__(self, url, token=None, timeout=30):
+        self.url = url.rstrip('/') + '/reports'
+        self.token = token
+        self.timeout = timeout
+
+    def send(self, reports):
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url, data=encode_batch(reports), headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            raise FleetError(f"The collector refused the batch: {e.code} {e.reason}") from None
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise FleetError(f"Could not reach the collector at {self.url}: {e}") from None
+
+
+class LocalTransport:
+    """In-process stand-in for HttpTransport, batches go to collector through the same encoding."""
+
+    def __init__(self, collector):
+        self.collector = collector
+
+    def send(self, reports):
+        try:
+            return self.collector.receive(encode_batch(reports), 'gzip')
+        except ValueError as e:
+            raise FleetError(f"The collector refused the batch: {e}") from None
+
+
+class FleetAgent:
+    """Scans the host of an IntegrityChecker and ships a delta report of each scan through a transport.
+
+    Reports are numbered per agent (the counter and the agent id live in the store) so the collector
+    drops duplicates of a batch that was delivered but whose answer was lost. A new data folder is a new
+    agent id, its numbering starting over is not mistaken for duplicates.
+    """
+
+    def __init__(self, checker, transport, host=None, outbox_dir=None):
+        self.checker = checker
+        self.transport = transport
+        self.host = host or socket.gethostname()
+        #reports waiting for the collector, one gzip JSON file per report
+        self.outbox_dir = outbox_dir or os.path.join(checker.data_dir, "outbox")
+        self.agent_id = checker.baseline_store.get_meta('fleet_agent_id')
+        if self.agent_id is None:
+            self.agent_id = uuid.uuid4().hex
+            checker.baseline_store.set_meta('fleet_agent_id', self.agent_id)
+
+    def build_report(self, results, started, quick):
+        """Delta report of one scan: its findings and counts, not the baseline."""
+        seq = self.checker.baseline_store.get_meta('fleet_report_seq', 0) + 1
+        self.checker.baseline_store.set_meta('fleet_report_seq', seq)
+        report = self.checker.report_results(results)
+        report.update({
+            'version': REPORT_VERSION,
+            'host': self.host,
+            'agent_id': self.agent_id,
+            'seq': seq,
+            'started': started,
+            'seconds': round(time.time() - started, 3),
+            'quick': quick,
+            'baseline_files': len(self.checker.baseline_hashes),
+            'counts': {status: len(file_paths) for status, file_paths in results.items()},
+            #changed files map to their new digest, the same digest on several hosts points at one file spreading
+            'changed': {file_path: self.checker.scan_hashes.get(file_path) for file_path in sorted(results[SCAN_CHANGED])},
+        })
+        return report
+
+    def spool(self, report):
+        os.makedirs(self.outbox_dir, exist_ok=True)
+        report_path = os.path.join(self.outbox_dir, f"{report['seq']:012d}.json.gz")
+        temp_path = report_path + ".tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(report, f)
+        os.replace(temp_path, report_path)
+
+        spooled = self.outbox()
+        for old_path in spooled[:max(len(spooled) - MAX_OUTBOX_REPORTS, 0)]:
+            print(f"Outbox full, dropping the report {os.path.basename(old_path)}")
+            os.remove(old_path)
+
+    def outbox(self):
+        """Paths of the spooled reports, oldest first."""
+        if not os.path.isdir(self.outbox_dir):
+            return []
+        return [os.path.join(self.outbox_dir, name) for name in sorted(os.listdir(self.outbox_dir)) if name.endswith(".json.gz")]
+
+    def flush(self):
+        """Send the outbox in batches of MAX_BATCH_REPORTS. Returns the number of reports delivered.
+
+        Raises FleetError when a batch could not be delivered, the undelivered reports stay in the outbox.
+        """
+        delivered = 0
+        spooled = self.outbox()
+        for start in range(0, len(spooled), MAX_BATCH_REPORTS):
+            batch = spooled[start:start + MAX_BATCH_REPORTS]
+            reports = list()
+            for report_path in batch:
+                try:
+                    with gzip.open(report_path, 'rt', encoding='utf-8') as f:
+                        reports.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"Dropping the unreadable report {report_path}: {e}")
+                    os.remove(report_path)
+            if reports:
+                self.transport.send(reports)
+            for report_path in batch:
+                if os.path.exists(report_path):
+                    os.remove(report_path)
+            delivered += len(reports)
+        return delivered
+
+    def run_once(self, quick=True, max_bytes=None, max_seconds=None):
+        """Scan, spool the report and send the outbox. Returns the report."""
+        started = time.time()
+        quick = self.checker.use_quick_check(quick)
+        results = self.checker.scan_results(quick=quick, max_bytes=max_bytes, max_seconds=max_seconds)
+        report = self.build_report(results, started, quick)
+        try:
+            self.spool(report)
+        except OSError as e:
+            print(f"Error spooling the report: {e}")
+        try:
+            self.flush()
+        except FleetError as e:
+            print(f"{e}, {len(self.outbox())} report(s) wait in the outbox.")
+        return report
+
+    def run(self, interval, quick=True, max_bytes=None, max_seconds=None, stop_event=None):
+        """Run a scan every interval seconds until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            report = self.run_once(quick, max_bytes, max_seconds)
+            counts = report['counts']
+            print(f"Report {report['seq']}: " + ", ".join(f"{counts[status]} {status}" for status in SCAN_STATUSES))
+            stop_event.wait(interval)
+
+
+class FleetCollector:
+    """Merges the agents' reports into a fleet view: the latest report of every host plus totals.
+
+    The view is saved to state_path (if given) after every batch, so a restarted collector keeps it.
+    """
+
+    def __init__(self, state_path=None, token=None, stale_seconds=DEFAULT_STALE_SECONDS):
+        self.state_path = state_path
+        self.token = token
+        self.stale_seconds = stale_seconds
+        self.lock = threading.Lock()
+        #host -> {'agent_id', 'seq', 'received', 'reports', 'report'}
+        self.hosts = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path) as f:
+                    self.hosts = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading the fleet state {state_path}: {e}")
+
+    def authorized(self, header):
+        if not self.token:
+            return True
+        return header is not None and hmac.compare_digest(header, f"Bearer {self.token}")
+
+    def receive(self, body, encoding=None):
+        """Merge a request body of reports. Returns counts of the accepted and duplicate reports."""
+        reports = decode_batch(body, encoding)
+        accepted = duplicates = 0
+        with self.lock:
+            #oldest first, so a batch of a long outage leaves the newest report of each host in the view
+            for report in sorted(reports, key=lambda report: report['seq']):
+                if self.merge(report):
+                    accepted += 1
+                else:
+                    duplicates += 1
+            if accepted:
+                self.save()
+        return {'accepted': accepted, 'duplicates': duplicates}
+
+    def merge(self, report):
+        #called with the lock held. A report of the same agent that is not newer than its last one was seen already
+        host = self.hosts.get(report['host'])
+        if host is not None and report.get('agent_id') == host['agent_id'] and report['seq'] <= host['seq']:
+            return False
+        self.hosts[report['host']] = {
+            'agent_id': report.get('agent_id'),
+            'seq': report['seq'],
+            'received': time.time(),
+            'reports': (host['reports'] if host is not None else 0) + 1,
+            'report': report,
+        }
+        return True
+
+    def save(self):
+        if not self.state_path:
+            return
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.hosts, f)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            print(f"Error saving the fleet state: {e}")
+
+    def fleet(self):
+        """Summary of every host and totals over the fleet."""
+        now = time.time()
+        hosts = dict()
+        totals = {status: 0 for status in SCAN_STATUSES}
+        with self.lock:
+            for name, host in sorted(self.hosts.items()):
+                report = host['report']
+                counts = report.get('counts', {})
+                for status in SCAN_STATUSES:
+                    totals[status] += counts.get(status, 0)
+                hosts[name] = {'seq': host['seq'], 'received': host['received'], 'reports': host['reports'],
+                               'stale': now - host['received'] > self.stale_seconds, 'counts': counts,
+                               'baseline_files': report.get('baseline_files'), 'pending': report.get('pending', 0),
+                               'seal_problems': len(report.get('seal_problems', ())),
+                               'tampered': len(report.get('tampered', ()))}
+        attention = sorted(name for name, host in hosts.items()
+                           if host['stale'] or host['seal_problems'] or host['tampered']
+                           or any(host['counts'].get(status) for status in SCAN_STATUSES if status != SCAN_NOT_CHANGED))
+        return {'hosts': hosts, 'totals': totals, 'attention': attention}
+
+    def host(self, name):
+        with self.lock:
+            host = self.hosts.get(name)
+            return dict(host) if host is not None else None
+
+    def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        """Serve the collector API from a daemon thread. Returns the server, port 0 picks a free port."""
+        collector = self
+
+        class CollectorHandler(BaseHTTPRequestHandler):
+            def answer(self, status, body):
+                data = json.dumps(body, indent=4).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not collector.authorized(self.headers.get('Authorization')):
+                    return self.answer(401, {'error': "Missing or wrong token."})
+                if self.path == '/fleet':
+                    return self.answer(200, collector.fleet())
+                if self.path.startswith('/hosts/'):
+                    host = collector.host(unquote(self.path[len('/hosts/'):]))
+                    if host is None:
+                        return self.answer(404, {'error': "No report from this host."})
+                    return self.answer(200, host)
+                self.answer(404, {'error': f"Unknown path {self.path}"})
+
+            def do_POST(self):
+                if not collector.authorized(self.headers.get('Authorization')):
+                    return self.answer(401, {'error': "Missing or wrong token."})
+                if self.path != '/reports':
+                    return self.answer(404, {'error': f"Unknown path {self.path}"})
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                except ValueError:
+                    length = -1
+                if not 0 < length <= MAX_BATCH_BYTES:
+                    return self.answer(413 if length > MAX_BATCH_BYTES else 400, {'error': "Bad Content-Length."})
+                try:
+                    result = collector.receive(self.rfile.read(length), self.headers.get('Content-Encoding'))
+                except (ValueError, zlib.error, EOFError) as e:
+                    return self.answer(400, {'error': str(e)})
+                self.answer(200, result)
+
+            def log_message(self, format, *args):
+                #every agent posts on every scan, the log would only repeat that
+                pass
+
+        server = ThreadingHTTPServer((host, port), CollectorHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
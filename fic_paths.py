@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+import unicodedata
+
+
+APP_NAME = "FIC"
+#platform -> (file names are case sensitive, Unicode normal form file names are stored in).
+#NTFS and APFS/HFS+ are case insensitive but case preserving. APFS and HFS+ also treat the NFC and NFD
+#spellings of a name as one file, so macOS paths are kept in NFC whatever form a tool handed over.
+#ext4 and most other Unix filesystems store names as bytes, two spellings there are two files.
+PATH_RULES = {
+    'win32': (False, None),
+    'cygwin': (False, None),
+    'darwin': (False, 'NFC'),
+}
+DEFAULT_PATH_RULES = (True, None)
+#directories remembered by a PathCanonicalizer, the memo is started over once it holds more
+DIR_CACHE_SIZE = 100000
+
+
+def path_rules(platform=None):
+    """(case sensitive, Unicode normal form or None) of file paths on platform, sys.platform by default."""
+    return PATH_RULES.get(platform or sys.platform, DEFAULT_PATH_RULES)
+
+
+def _xdg_dir(variable, fallback):
+    #the XDG spec says relative values are invalid and must be ignored
+    value = os.environ.get(variable)
+    if value and os.path.isabs(value):
+        return value
+    return os.path.join(os.path.expanduser('~'), *fallback)
+
+
+def legacy_data_dir():
+    """Where IntegriSecure kept the baseline on every platform but Windows before XDG paths."""
+    return os.path.join(os.path.expanduser('~'), '.local', 'share', APP_NAME)
+
+
+def default_data_dir():
+    """Folder holding the baseline.
+
+    FIC_DATA_DIR overrides it, otherwise it is %APPDATA%\\FIC on Windows, ~/Library/Application Support/FIC
+    on macOS and $XDG_DATA_HOME/FIC (~/.local/share/FIC) elsewhere. A baseline already kept in
+    ~/.local/share/FIC stays there.
+    """
+    override = os.environ.get('FIC_DATA_DIR')
+    if override:
+        return os.path.abspath(os.path.expanduser(override))
+    if sys.platform == 'win32' and os.environ.get('APPDATA'):
+        return os.path.join(os.environ['APPDATA'], APP_NAME)
+    if sys.platform == 'darwin':
+        data_dir = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', APP_NAME)
+    else:
+        data_dir = os.path.join(_xdg_dir('XDG_DATA_HOME', ('.local', 'share')), APP_NAME)
+    if not os.path.isdir(data_dir) and os.path.isdir(legacy_data_dir()):
+        return legacy_data_dir()
+    return data_dir
+
+
+def default_config_dir():
+    """Folder for settings and secrets such as the fleet token, kept apart from the baseline.
+
+    FIC_CONFIG_DIR overrides it, otherwise it is %APPDATA%\\FIC on Windows, ~/Library/Application Support/FIC
+    on macOS and $XDG_CONFIG_HOME/FIC (~/.config/FIC) elsewhere.
+    """
+    override = os.environ.get('FIC_CONFIG_DIR')
+    if override:
+        return os.path.abspath(os.path.expanduser(override))
+    if sys.platform == 'win32' and os.environ.get('APPDATA'):
+        return os.path.join(os.environ['APPDATA'], APP_NAME)
+    if sys.platform == 'darwin':
+        return os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', APP_NAME)
+    return os.path.join(_xdg_dir('XDG_CONFIG_HOME', ('.config',)), APP_NAME)
+
+
+def default_runtime_dir():
+    """$XDG_RUNTIME_DIR/FIC for sockets, None where the session has no runtime folder."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isabs(runtime_dir) and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, APP_NAME)
+    return None
+
+
+class PathCanonicalizer:
+    """Memoized canonical form of file paths, the keys of the baseline.
+
+    A canonical path is absolute and normalised, the symlinks of its directory are resolved and it
+    follows the platform's PATH_RULES: Unicode normal form, and on case insensitive filesystems the
+    case the directory listing has. Directories are resolved once and remembered, so canonicalising
+    the files of one folder costs a dict lookup each instead of a realpath per file. The file itself
+    is not resolved, a symlinked file is baselined under its own name.
+    """
+
+    def __init__(self, platform=None, resolve_symlinks=True):
+        self.case_sensitive, self.unicode_form = path_rules(platform)
+        self.resolve_symlinks = resolve_symlinks
+        self.lock = threading.Lock()
+        #directory as given -> canonical directory
+        self.dirs = {}
+        #canonical directory -> {casefolded name: name as listed}, only on case insensitive filesystems
+        self.listings = {}
+
+    def clear(self):
+        """Forget every resolved directory, e.g. after symlinks were changed."""
+        with self.lock:
+            self.dirs.clear()
+            self.listings.clear()
+
+    def normalize_name(self, name):
+        if self.unicode_form is None or name.isascii():
+            return name
+        return unicodedata.normalize(self.unicode_form, name)
+
+    def canonical_dir(self, directory):
+        canonical = self.dirs.get(directory)
+        if canonical is not None:
+            return canonical
+        if self.resolve_symlinks:
+            #realpath also gives the case as stored on Windows
+            canonical = os.path.realpath(directory)
+        else:
+            canonical = os.path.normpath(os.path.abspath(directory))
+        canonical = self.normalize_name(canonical)
+        with self.lock:
+            if len(self.dirs) >= DIR_CACHE_SIZE:
+                self.dirs.clear()
+                self.listings.clear()
+            #relative directories depend on the working directory, only absolute ones are remembered
+            if os.path.isabs(directory):
+                self.dirs[directory] = canonical
+        return canonical
+
+    def listed_name(self, directory, name):
+        #the spelling of name in its directory listing, for case insensitive filesystems
+        listing = self.listings.get(directory)
+        if listing is None:
+            try:
+                listing = {self.normalize_name(entry).casefold(): entry for entry in os.listdir(directory)}
+            except OSError:
+                listing = {}
+            with self.lock:
+                self.listings[directory] = listing
+        listed = listing.get(name.casefold())
+        return self.normalize_name(listed) if listed is not None else name
+
+    def canonical(self, file_path):
+        """Canonical form of file_path, relative paths are taken from the working directory."""
+        if not os.path.isabs(file_path):
+            file_path = os.path.abspath(file_path)
+        directory, name = os.path.split(file_path)
+        if name in ('', '.', '..'):
+            #a folder, or a path ending in a separator or dot segment
+            return self.canonical_dir(file_path)
+        directory = self.canonical_dir(directory)
+        name = self.normalize_name(name)
+        if not self.case_sensitive:
+            name = self.listed_name(directory, name)
+        return os.path.join(directory, name)
+
+    def key(self, file_path):
+        """Comparison key of a canonical path: two paths of one file get the same key."""
+        return file_path if self.case_sensitive else file_path.casefold()
@@ -0,0 +1,132 @@
+import fnmatch
+import os
+import stat
+
+
+class ScanFilter:
+    """Include/exclude globs and size limits applied while enumerating folders.
+
+    Exclude globs are matched against the entry name and its full path, so 'node_modules',
+    '*.log' and '/var/cache/*' all work; an excluded directory is not descended into.
+    Include globs only apply to files, when given a file has to match one of them.
+    """
+
+    def __init__(self, include=(), exclude=(), min_size=None, max_size=None):
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.min_size = min_size
+        self.max_size = max_size
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else cls()
+
+    def to_dict(self):
+        return {'include': list(self.include), 'exclude': list(self.exclude), 'min_size': self.min_size, 'max_size': self.max_size}
+
+    def signature(self):
+        #stored with every directory state, states made under another filter are not trusted
+        return repr(sorted(self.to_dict().items()))
+
+    def excluded(self, name, path):
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in self.exclude)
+
+    def limits_size(self):
+        return self.min_size is not None or self.max_size is not None
+
+    def accepts_file(self, name, path, size):
+        """Check a file against the globs and size limits, a size of None skips the size limits."""
+        if self.excluded(name, path):
+            return False
+        if self.include and not any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in self.include):
+            return False
+        if size is None:
+            return True
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        return True
+
+
+class FolderScanner:
+    """Enumerates folders with os.scandir, reusing the DirEntry results instead of extra stat calls.
+
+    dir_states holds, per directory, its mtime_ns, link count, entry count, sub directories and number
+    of baselined files from an earlier scan. A directory whose mtime and link count did not change and
+    whose files were all known at that time is not listed again, only its sub directories are visited.
+    With known_count (directory -> number of baselined files in it), a directory whose baselined files
+    were removed or added since is listed again too, so a file dropped from the baseline but still on
+    disk is found. States for the visited directories are collected in new_dir_states; a directory is
+    only given a state when every file in it satisfies is_known, so directories holding unknown files
+    are listed on every scan.
+    """
+
+    def __init__(self, scan_filter=None, dir_states=None, is_known=None, known_count=None):
+        self.scan_filter = scan_filter or ScanFilter()
+        self.dir_states = dir_states or {}
+        self.is_known = is_known or (lambda file_path: True)
+        self.known_count = known_count
+        self.new_dir_states = {}
+        self.listed_dirs = 0
+        self.skipped_dirs = 0
+
+    def iter_files(self, folder):
+        """Yield (file_path, stat_result) for every accepted regular file under folder."""
+        signature = self.scan_filter.signature()
+        stack = [folder]
+        while stack:
+            directory = stack.pop()
+            try:
+                dir_stat = os.stat(directory)
+            except OSError:
+                continue
+
+            saved = self.dir_states.get(directory)
+            if (saved is not None and saved['mtime_ns'] == dir_stat.st_mtime_ns
+                    and saved['nlink'] == dir_stat.st_nlink and saved['filter'] == signature
+                    and (self.known_count is None or saved.get('known_files') == self.known_count(directory))):
+                #no entry was added, removed or renamed here since the last scan
+                self.skipped_dirs += 1
+                self.new_dir_states[directory] = saved
+                stack.extend(saved['subdirs'])
+                continue
+
+            self.listed_dirs += 1
+            entry_count = 0
+            subdirs = []
+            complete = True
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        entry_count += 1
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self.scan_filter.excluded(entry.name, entry.path):
+                                    subdirs.append(entry.path)
+                                continue
+                            if not entry.is_file():
+                                continue
+                            stat_result = entry.stat()
+                        except OSError:
+                            continue
+                        if not stat.S_ISREG(stat_result.st_mode):
+                            continue
+                        if not self.scan_filter.accepts_file(entry.name, entry.path, stat_result.st_size):
+                            continue
+                        if not self.is_known(entry.path):
+                            complete = False
+                        yield entry.path, stat_result
+            except OSError as e:
+                print(f"Could not list folder {directory}: {e}")
+                continue
+
+            if complete:
+                self.new_dir_states[directory] = {
+                    'mtime_ns': dir_stat.st_mtime_ns,
+                    'nlink': dir_stat.st_nlink,
+                    'entry_count': entry_count,
+                    'subdirs': subdirs,
+                    'filter': signature,
+                }
+            stack.extend(subdirs)
@@ -0,0 +1,383 @@
+import ctypes
+import ctypes.util
+import hashlib
+import mmap
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+#optional fast hashes, only offered when the packages are installed
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+DEFAULT_ALGORITHM = 'sha256'
+
+#files at least this big are hashed through mmap, smaller ones with readinto into a reused buffer
+MMAP_THRESHOLD = 64 * 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+MMAP_BLOCK_SIZE = 16 * 1024 * 1024
+READ_STRATEGIES = ('auto', 'read', 'mmap')
+
+#mincore tells which pages of a file are in the page cache, only pages a hash brought in are dropped after it
+try:
+    _mincore = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True).mincore
+    _mincore.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p)
+    _mincore.restype = ctypes.c_int
+except (OSError, AttributeError, TypeError):
+    _mincore = None
+#mincore sets the lowest bit of a page's byte if the page is resident
+_RESIDENT_TABLE = bytes(ord('1') if value & 1 else ord('0') for value in range(256))
+
+#one read buffer per thread, reused for every file that thread hashes
+_thread_buffers = threading.local()
+
+#hashlib algorithms that are offered as baseline algorithms
+HASHLIB_ALGORITHMS = ('sha256', 'sha512', 'sha3_256', 'blake2b', 'blake2s', 'sha1', 'md5')
+
+#algorithms an attacker can not forge a collision for, only these may be the confirming hash
+CRYPTOGRAPHIC_ALGORITHMS = ('sha256', 'sha512', 'sha3_256', 'blake2b', 'blake2s', 'blake3')
+
+
+def available_algorithms():
+    """Return the names of the hash algorithms usable on this install."""
+    algorithms = list(HASHLIB_ALGORITHMS)
+    if blake3 is not None:
+        algorithms.append('blake3')
+    if xxhash is not None:
+        algorithms.extend(('xxh3_64', 'xxh3_128'))
+    return algorithms
+
+
+def new_hasher(hash_algorithm):
+    """Create a hash object with update()/hexdigest() for hash_algorithm."""
+    if hash_algorithm == 'blake3':
+        if blake3 is None:
+            raise ValueError("Hash algorithm 'blake3' needs the blake3 package.")
+        return blake3.blake3()
+    if hash_algorithm in ('xxh3_64', 'xxh3_128'):
+        if xxhash is None:
+            raise ValueError(f"Hash algorithm '{hash_algorithm}' needs the xxhash package.")
+        return getattr(xxhash, hash_algorithm)()
+    return hashlib.new(hash_algorithm)
+
+
+def _read_buffer():
+    buffer = getattr(_thread_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _thread_buffers.buffer = bytearray(READ_BLOCK_SIZE)
+    return buffer
+
+
+def _fadvise(file, advice_name):
+    #posix_fadvise only exists on POSIX, the hint is best effort everywhere
+    advice = getattr(os, advice_name, None)
+    if advice is None or not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(file.fileno(), 0, 0, advice)
+    except OSError:
+        pass
+
+
+def _resident_pages(file, size):
+    """Page cache residency of the open file as a str of '1' (resident) and '0' per page, None if it can not be told."""
+    if _mincore is None or not hasattr(os, 'posix_fadvise') or size == 0:
+        return None
+    stat_result = os.fstat(file.fileno())
+    #since Linux 5.2 mincore only reports the cache of files the caller owns or may write,
+    #for other files it would call cached pages missing and they would be dropped
+    if os.geteuid() != 0 and stat_result.st_uid != os.geteuid():
+        return None
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    vector = (ctypes.c_ubyte * pages)()
+    try:
+        #a private writable map, ctypes needs a writable buffer to take its address, nothing is written
+        with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_COPY) as mapped:
+            anchor = ctypes.c_char.from_buffer(mapped)
+            try:
+                result = _mincore(ctypes.addressof(anchor), size, vector)
+            finally:
+                del anchor
+    except (OSError, ValueError, BufferError):
+        return None
+    if result != 0:
+        return None
+    return bytes(vector).translate(_RESIDENT_TABLE).decode('ascii')
+
+
+def _drop_new_pages(file, resident):
+    """Drop the pages of file from the page cache that were not resident before it was hashed.
+
+    Pages the host's workloads had cached stay, unknown residency (None) drops nothing.
+    """
+    if resident is None:
+        return
+    for run in re.finditer('0+', resident):
+        try:
+            os.posix_fadvise(file.fileno(), run.start() * mmap.PAGESIZE, (run.end() - run.start()) * mmap.PAGESIZE,
+                             os.POSIX_FADV_DONTNEED)
+        except OSError:
+            return
+
+
+def _update_by_read(file, hash_funcs):
+    buffer = _read_buffer()
+    with memoryview(buffer) as view:
+        while read_size := file.readinto(buffer):
+            with view[:read_size] as chunk:
+                for hash_func in hash_funcs:
+                    hash_func.update(chunk)
+
+
+def _update_small(file, size, hash_funcs):
+    #one read call for the whole file, asking for a byte more so a file that grew since fstat is noticed
+    data = file.read(size + 1)
+    for hash_func in hash_funcs:
+        hash_func.update(data)
+    if len(data) > size:
+        _update_by_read(file, hash_funcs)
+
+
+def _update_by_mmap(file, hash_funcs):
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, 'madvise'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        #every view has to be released before the map can be closed
+        with memoryview(mapped) as view:
+            for offset in range(0, len(mapped), MMAP_BLOCK_SIZE):
+                with view[offset:offset + MMAP_BLOCK_SIZE] as chunk:
+                    for hash_func in hash_funcs:
+                        hash_func.update(chunk)
+
+
+def compute_file_hashes(file_path, hash_algorithms, strategy='auto'):
+    """Compute several hashes of a file in a single read. Returns a tuple of hex digests, or None.
+
+    Files of MMAP_THRESHOLD bytes or more are mapped and hashed in MMAP_BLOCK_SIZE views, files below
+    READ_BLOCK_SIZE are read with a single call, the rest with readinto into a per thread buffer.
+    Mapped and readinto reads are announced as sequential, and afterwards the pages that were not
+    in the page cache before are dropped again, so a scan neither fills the cache nor evicts the
+    pages the workloads on the host had cached.
+    strategy forces 'read' or 'mmap' (used by the benchmarks).
+    """
+    if strategy not in READ_STRATEGIES:
+        raise ValueError(f"Invalid read strategy '{strategy}'. Use one of {', '.join(READ_STRATEGIES)}.")
+    hash_funcs = [new_hasher(hash_algorithm) for hash_algorithm in hash_algorithms]
+    try:
+        with open(file_path, 'rb', buffering=0) as file:
+            size = os.fstat(file.fileno()).st_size
+            use_mmap = strategy == 'mmap' or (strategy == 'auto' and size >= MMAP_THRESHOLD)
+            if not use_mmap and strategy == 'auto' and size < READ_BLOCK_SIZE:
+                _update_small(file, size, hash_funcs)
+            else:
+                resident = _resident_pages(file, size)
+                _fadvise(file, 'POSIX_FADV_SEQUENTIAL')
+                #empty files can not be mapped
+                if use_mmap and size > 0:
+                    _update_by_mmap(file, hash_funcs)
+                else:
+                    _update_by_read(file, hash_funcs)
+                _drop_new_pages(file, resident)
+        return tuple(hash_func.hexdigest() for hash_func in hash_funcs)
+    except Exception as e:
+        print(f"Could not read file {file_path}: {e}")
+        return None
+
+
+def compute_file_hash(file_path, hash_algorithm=DEFAULT_ALGORITHM):
+    """Compute the hash of a file.
+
+    hash_algorithm may also be a tuple of algorithm names, then a tuple of hashes is returned.
+    """
+    if isinstance(hash_algorithm, tuple):
+        return compute_file_hashes(file_path, hash_algorithm)
+    hashes = compute_file_hashes(file_path, (hash_algorithm,))
+    return hashes[0] if hashes else None
+
+
+def hash_chunk(file_path, index, chunk_size, hash_algorithm=DEFAULT_ALGORITHM):
+    """Hash the index-th chunk of a file. Every call opens the file so chunks can be hashed in parallel."""
+    hash_func = new_hasher(hash_algorithm)
+    with open(file_path, 'rb', buffering=0) as file:
+        file.seek(index * chunk_size)
+        hash_func.update(file.read(chunk_size))
+    return hash_func.hexdigest()
+
+
+def _hash_batch(file_paths, hash_algorithm):
+    #module level so it can be pickled and sent to worker processes
+    return [(file_path, compute_file_hash(file_path, hash_algorithm)) for file_path in file_paths]
+
+
+class HashEngine:
+    """Hashes a batch of files either serially or on a pool of workers.
+
+    Modes:
+        'serial'  - hash in the calling thread, one file after another.
+        'thread'  - thread pool, best when the scan is bound by disk I/O
+                    (hashlib releases the GIL while hashing large buffers).
+        'process' - process pool, best when the scan is bound by SHA-256 CPU time.
+    """
+
+    MODES = ('serial', 'thread', 'process')
+
+    def __init__(self, mode='thread', workers=None, hash_algorithm=DEFAULT_ALGORITHM, batch_size=None, throttle=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Invalid hashing mode '{mode}'. Use one of {', '.join(self.MODES)}.")
+
+        self.mode = mode
+        self.hash_algorithm = hash_algorithm
+        self.workers = workers or self.default_workers(mode)
+        #optional throttle.ScanThrottle, files are admitted by it before they are handed to a worker
+        self.throttle = throttle
+
+        #process workers get bigger batches to amortise the pickling round trip
+        if batch_size is None:
+            batch_size = 64 if mode == 'process' else 16
+        self.batch_size = batch_size
+
+    @staticmethod
+    def default_workers(mode):
+        cpu_count = os.cpu_count() or 1
+        if mode == 'serial':
+            return 1
+        if mode == 'process':
+            return cpu_count
+        #same default as ThreadPoolExecutor, threads mostly wait on the disk
+        return min(32, cpu_count + 4)
+
+    def hash_file(self, file_path, hash_algorithm=None):
+        return compute_file_hash(file_path, hash_algorithm or self.hash_algorithm)
+
+    def hash_files(self, file_paths, hash_algorithm=None):
+        """Hash every file in file_paths.
+
+        Args:
+            file_paths (iterable): Paths of the files to hash.
+            hash_algorithm (str or tuple, optional): Algorithm to use instead of the engine default,
+                a tuple of algorithms yields a tuple of hashes per file.
+
+        Yields:
+            tuple: (file_path, hash) pairs, hash is None if the file could not be read.
+                   With a pool the pairs come in completion order, not input order.
+        """
+        hash_algorithm = hash_algorithm or self.hash_algorithm
+        if self.mode == 'serial' or self.workers <= 1:
+            for file_path in file_paths:
+                if self.throttle is not None:
+                    self.throttle.admit(file_path)
+                yield file_path, compute_file_hash(file_path, hash_algorithm)
+            return
+
+        executor_class = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+        with executor_class(max_workers=self.workers) as executor:
+            yield from self._run_batches(executor, file_paths, hash_algorithm)
+
+    def hash_chunks(self, file_path, indices, chunk_size, hash_algorithm=None):
+        """Hash chunks of one file on the engine's workers.
+
+        Only a few chunks per worker are pending at a time, and with a throttle the bytes of every
+        chunk are admitted before it is read, so a huge file is read at the same pace as many small ones.
+
+        Args:
+            file_path (str): The file, admitted by the caller.
+            indices (iterable): Numbers of the chunks to hash.
+            chunk_size (int): Size of the chunks in bytes.
+            hash_algorithm (str, optional): Algorithm to use instead of the engine default.
+
+        Yields:
+            tuple: (index, hex digest) pairs in completion order, a read error is raised.
+        """
+        hash_algorithm = hash_algorithm or self.hash_algorithm
+        if self.mode == 'serial' or self.workers <= 1:
+            for index in indices:
+                if self.throttle is not None:
+                    self.throttle.admit_bytes(chunk_size)
+                yield index, hash_chunk(file_path, index, chunk_size, hash_algorithm)
+            return
+
+        max_in_flight = self.workers * 4
+        executor_class = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+        with executor_class(max_workers=self.workers) as executor:
+            #future -> chunk index
+            in_flight = dict()
+
+            def collect():
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+
+            try:
+                for index in indices:
+                    if self.throttle is not None:
+                        self.throttle.admit_bytes(chunk_size)
+                    in_flight[executor.submit(hash_chunk, file_path, index, chunk_size, hash_algorithm)] = index
+                    if len(in_flight) >= max_in_flight:
+                        yield from collect()
+
+                while in_flight:
+                    yield from collect()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def _run_batches(self, executor, file_paths, hash_algorithm):
+        #only keep a few batches per worker in flight so huge file lists are not all queued at once
+        max_in_flight = self.workers * 4
+        per_device = self.throttle.per_device if self.throttle is not None else None
+        #future -> device its batch reads from, for the per device limit
+        in_flight = dict()
+
+        def collect():
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                yield from future.result()
+
+        try:
+            for device, batch in self._batches(file_paths):
+                while per_device and sum(1 for busy in in_flight.values() if busy == device) >= per_device:
+                    yield from collect()
+                in_flight[executor.submit(_hash_batch, batch, hash_algorithm)] = device
+                if len(in_flight) >= max_in_flight:
+                    yield from collect()
+
+            while in_flight:
+                yield from collect()
+        finally:
+            #the caller stopped early (cancelled scan), drop the batches that have not started
+            for future in in_flight:
+                future.cancel()
+
+    def _batches(self, file_paths):
+        """Yield (device, batch) pairs. Without a throttle the device is None and batches are not split by device."""
+        if self.throttle is None:
+            batch = []
+            for file_path in file_paths:
+                batch.append(file_path)
+                if len(batch) >= self.batch_size:
+                    yield None, batch
+                    batch = []
+            if batch:
+                yield None, batch
+            return
+
+        #one open batch per device, so a batch only ever reads from one disk
+        batches = {}
+        for file_path in file_paths:
+            device = self.throttle.admit(file_path)
+            batch = batches.setdefault(device, [])
+            batch.append(file_path)
+            if len(batch) >= self.batch_size:
+                yield device, batches.pop(device)
+        for device, batch in batches.items():
+            yield device, batch
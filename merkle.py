@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+from hash_engine import HashEngine, new_hasher, DEFAULT_ALGORITHM
+
+
+#size of the byte ranges hashed as Merkle leaves
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+#version 2 trees hash leaves, inner nodes and the root (with the file size and leaf count) with these
+#prefixes, version 1 trees had no prefixes and records without a 'merkle_version' are version 1
+MERKLE_VERSION = 2
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+ROOT_PREFIX = b"\x02"
+
+#completed leaves are written to the resume state every this many chunks
+SAVE_STATE_EVERY = 64
+
+
+def chunk_count(size, chunk_size):
+    #an empty file still has one (empty) chunk so it gets a root
+    return max(1, (size + chunk_size - 1) // chunk_size)
+
+
+def merkle_root(leaves, size, hash_algorithm=DEFAULT_ALGORITHM, version=MERKLE_VERSION):
+    """Root of the binary Merkle tree over hex leaf digests of a file of size bytes, an odd node is carried up unchanged.
+
+    Leaves, inner nodes and the root are hashed with different prefixes and the root also covers
+    the file size and leaf count, so no root is the digest of some other (e.g. shorter) content.
+    Version 1 roots, made before that, are only computed to check and upgrade old records.
+    """
+    if version == 1:
+        return _legacy_root(leaves, hash_algorithm)
+    level = []
+    for leaf in leaves:
+        hash_func = new_hasher(hash_algorithm)
+        hash_func.update(LEAF_PREFIX)
+        hash_func.update(bytes.fromhex(leaf))
+        level.append(hash_func.digest())
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            hash_func = new_hasher(hash_algorithm)
+            hash_func.update(NODE_PREFIX)
+            hash_func.update(level[i])
+            hash_func.update(level[i + 1])
+            next_level.append(hash_func.digest())
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    hash_func = new_hasher(hash_algorithm)
+    hash_func.update(ROOT_PREFIX)
+    hash_func.update(size.to_bytes(8, 'big'))
+    hash_func.update(len(leaves).to_bytes(8, 'big'))
+    if level:
+        hash_func.update(level[0])
+    return hash_func.hexdigest()
+
+
+def _legacy_root(leaves, hash_algorithm):
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    if not level:
+        return new_hasher(hash_algorithm).hexdigest()
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            hash_func = new_hasher(hash_algorithm)
+            hash_func.update(level[i])
+            hash_func.update(level[i + 1])
+            next_level.append(hash_func.digest())
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0].hex()
+
+
+def changed_ranges(old_leaves, new_leaves, chunk_size, new_size, old_size=None):
+    """Byte ranges (start, end) that differ between two chunk lists, adjacent chunks are merged.
+
+    Chunks that only exist in the old list were truncated away, they are reported from the new
+    end of the file up to their old end.
+    """
+    ranges = []
+    for index in range(max(len(old_leaves), len(new_leaves))):
+        old_leaf = old_leaves[index] if index < len(old_leaves) else None
+        new_leaf = new_leaves[index] if index < len(new_leaves) else None
+        if old_leaf == new_leaf:
+            continue
+        start = index * chunk_size
+        end = (index + 1) * chunk_size
+        if new_leaf is not None:
+            end = min(end, new_size)
+        else:
+            start = max(start, new_size)
+            if old_size is not None:
+                end = min(end, old_size)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+class ChunkResumeState:
+    """Leaves hashed so far for one file, kept on disk so an interrupted hash can continue.
+
+    The state is only reused if the file still has the same size, mtime, ctime and inode and the
+    same chunk size and algorithm are asked for. With a seal (a MerkleSeal of baseline_seal) the
+    state is saved with a MAC and a state without a valid one is not reused.
+    """
+
+    def __init__(self, state_dir, file_path, stat_result, chunk_size, hash_algorithm, seal=None):
+        name = hashlib.sha1(file_path.encode('utf-8', 'surrogateescape')).hexdigest()
+        self.state_path = os.path.join(state_dir, f"{name}.json")
+        self.file_path = file_path
+        self.seal = seal
+        self.key = {
+            'path': file_path,
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            #an mtime can be set back, the ctime and inode of a rewritten file can not
+            'ctime_ns': stat_result.st_ctime_ns,
+            'inode': stat_result.st_ino,
+            'chunk_size': chunk_size,
+            'algorithm': hash_algorithm,
+        }
+        os.makedirs(state_dir, exist_ok=True)
+
+    def load(self):
+        """Return {chunk index: leaf} saved by an earlier run for the same file version."""
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if not isinstance(state, dict) or state.get('key') != self.key:
+            return {}
+        if self.seal is not None and not self.seal.cache_trusted('chunks', self.file_path, state):
+            return {}
+        return {int(index): leaf for index, leaf in state.get('leaves', {}).items()}
+
+    def save(self, leaves):
+        #the keys as they read back from JSON, the MAC is checked against the loaded state
+        state = {'key': self.key, 'leaves': {str(index): leaf for index, leaf in leaves.items()}}
+        if self.seal is not None:
+            state = self.seal.seal_cache('chunks', self.file_path, state)
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def clear(self):
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+
+
+def compute_chunk_hashes(file_path, chunk_size=DEFAULT_CHUNK_SIZE, hash_algorithm=DEFAULT_ALGORITHM,
+                         engine=None, state_dir=None, stat_result=None, seal=None):
+    """Hash a file as fixed size chunks on the workers of a HashEngine. Returns the list of hex leaves, or None.
+
+    Without an engine the chunks are hashed on a thread pool of the default size.
+    With a state_dir, completed leaves are saved as they finish and picked up again if the
+    same file version is hashed after an interruption. A seal authenticates the saved leaves.
+    """
+    try:
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        count = chunk_count(stat_result.st_size, chunk_size)
+
+        resume_state = None
+        leaves = {}
+        if state_dir is not None:
+            resume_state = ChunkResumeState(state_dir, file_path, stat_result, chunk_size, hash_algorithm, seal)
+            leaves = resume_state.load()
+        pending = [index for index in range(count) if index not in leaves]
+
+        engine = engine or HashEngine(mode='thread')
+        finished = 0
+        for index, leaf in engine.hash_chunks(file_path, pending, chunk_size, hash_algorithm):
+            leaves[index] = leaf
+            finished += 1
+            if resume_state is not None and finished % SAVE_STATE_EVERY == 0:
+                resume_state.save(leaves)
+
+        if resume_state is not None:
+            resume_state.clear()
+        return [leaves[index] for index in range(count)]
+    except Exception as e:
+        print(f"Could not read file {file_path}: {e}")
+        return None
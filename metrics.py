@@ -0,0 +1,199 @@
+import cProfile
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+#prefix of every exported metric name
+METRIC_PREFIX = 'integrisecure_'
+
+
+class Metrics:
+    """Thread safe counters, gauges and phase timers of the scanner and the monitor.
+
+    Counters only go up (files stat'd, bytes hashed, events received), gauges hold the last
+    value set (queue depth), timers add up the seconds and the number of runs of a phase.
+    Everything is exported in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+        self.descriptions = {}
+
+    def describe(self, name, description):
+        self.descriptions[name] = description
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            total, count = self.timers.get(name, (0.0, 0))
+            self.timers[name] = (total + seconds, count + 1)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the block as one run of the phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def value(self, name):
+        with self.lock:
+            if name in self.counters:
+                return self.counters[name]
+            return self.gauges.get(name, 0)
+
+    def snapshot(self):
+        """Copy of every metric as a dict, timers as (seconds, runs)."""
+        with self.lock:
+            return {'counters': dict(self.counters), 'gauges': dict(self.gauges), 'timers': dict(self.timers)}
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+
+        def add(name, metric_type, value, described=None):
+            full_name = METRIC_PREFIX + name
+            if described in self.descriptions:
+                lines.append(f"# HELP {full_name} {self.descriptions[described]}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            lines.append(f"{full_name} {value}")
+
+        for name, value in sorted(snapshot['counters'].items()):
+            add(f"{name}_total", 'counter', value, name)
+        for name, value in sorted(snapshot['gauges'].items()):
+            add(name, 'gauge', value, name)
+        for name, (seconds, runs) in sorted(snapshot['timers'].items()):
+            add(f"{name}_seconds_total", 'counter', f"{seconds:.6f}")
+            add(f"{name}_runs_total", 'counter', runs)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path):
+        """Write the metrics for the node exporter textfile collector, swapped in atomically."""
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, file_path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve the metrics at http://host:port/metrics from a daemon thread. Returns the server."""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                #scrapes every few seconds would flood the output
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def summary(self):
+        """Human readable one metric per line, for the end of a command line run."""
+        snapshot = self.snapshot()
+        lines = [f"{name}: {value}" for name, value in sorted(snapshot['counters'].items())]
+        lines += [f"{name}: {value}" for name, value in sorted(snapshot['gauges'].items())]
+        lines += [f"{name}: {seconds:.3f}s in {runs} run(s)" for name, (seconds, runs) in sorted(snapshot['timers'].items())]
+        return "\n".join(lines)
+
+
+#registry shared by every module of a process
+METRICS = Metrics()
+
+METRICS.describe('files_stat', "Files stat'd by scans.")
+METRICS.describe('files_hashed', "Files hashed by scans and baseline updates.")
+METRICS.describe('bytes_hashed', "Bytes of the files hashed by scans and baseline updates.")
+METRICS.describe('quick_check_hits', "Files a quick check passed on their stat alone.")
+METRICS.describe('checkpoint_hits', "Files reported from the checkpoint of an unfinished scan.")
+METRICS.describe('hardlink_hits', "Files that shared the hash of another link to the same inode.")
+METRICS.describe('accept_reused_digests', "Accepted changed files that took the digest of the scan instead of a rehash.")
+METRICS.describe('dirs_listed', "Folders listed while looking for added files.")
+METRICS.describe('dirs_skipped', "Unchanged folders that were not listed again.")
+METRICS.describe('events_received', "File system events received by the monitor.")
+METRICS.describe('events_coalesced', "Events merged into an already pending verification.")
+METRICS.describe('events_dropped', "Events dropped because the event queue was full.")
+METRICS.describe('overflow_rescans', "Rescans of every monitored file after the event queue overflowed.")
+METRICS.describe('verifications', "Files verified by the monitor.")
+METRICS.describe('event_queue_depth', "Events waiting for the coalescer.")
+METRICS.describe('pending_verifications', "Files waiting for their debounce window to pass.")
+
+
+@contextmanager
+def profile_capture(cprofile_path=None, tracemalloc_top=None):
+    """Optionally run the block under cProfile and/or tracemalloc.
+
+    The cProfile stats are dumped to cprofile_path (open them with pstats or snakeviz), the
+    tracemalloc_top biggest allocation sites are printed along with the peak traced memory.
+    """
+    profiler = cProfile.Profile() if cprofile_path else None
+    if tracemalloc_top:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            print(f"Profile written to {cprofile_path}, the top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        if tracemalloc_top:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Peak traced memory: {peak / (1024 * 1024):.1f} MiB, the biggest allocation sites:")
+            for statistic in snapshot.statistics('lineno')[:tracemalloc_top]:
+                print(statistic)
+
+
+def timed(iterable, name, metrics=METRICS):
+    """Yield from iterable, timing only the time spent producing the items, not the consumer's.
+
+    For generators that stream results to a GUI or a queue, where a timer around the loop
+    would also count the time spent rendering each result.
+    """
+    iterator = iter(iterable)
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            yield item
+    finally:
+        metrics.add_time(name, seconds)
+        #an early close of this generator also stops the wrapped one (cancels its hash futures)
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
@@ -1,15 +1,37 @@
+import argparse
 import time
 import os
-import tkinter as tk
+import sys
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from plyer import notification
-from FIC import FileIntegrityCheckerApp
+from fic_core import IntegrityChecker, SCAN_CHANGED, SCAN_REMOVED, SCAN_NOT_CHANGED, SCAN_ADDED
+from metrics import METRICS
 
-class FileChangeHandler(FileSystemEventHandler):
-    def __init__(self, files_to_monitor):
-        # Convert all file paths to absolute paths to ensure correct matching
-        self.files_to_monitor = {os.path.abspath(file) for file in files_to_monitor}
+
+#raw events waiting for the coalescer, when it is full events are dropped and every file is re-verified
+EVENT_QUEUE_SIZE = 10000
+#a path is verified once no new event arrived for it for this many seconds
+DEBOUNCE_SECONDS = 0.5
+VERIFY_WORKERS = 4
+#at most one desktop notification per interval, everything verified meanwhile is summarised in it
+NOTIFY_INTERVAL_SECONDS = 5
+NOTIFY_MAX_PATHS = 5
+#how often the monitor rewrites its Prometheus metrics file
+METRICS_WRITE_SECONDS = 15
+
+
+class Notifier:
+    """Collects verified changes and shows them as rate limited, aggregated notifications."""
+
+    def __init__(self, interval=NOTIFY_INTERVAL_SECONDS):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {SCAN_CHANGED: [], SCAN_REMOVED: [], SCAN_ADDED: []}
+        self.last_notified = 0.0
 
     def show_notification(self, title, message):
         """Show a system notification"""
@@ -20,63 +42,393 @@ class FileChangeHandler(FileSystemEventHandler):
             timeout=3  # duration in seconds
         )
 
+    def add(self, status, file_path):
+        with self.lock:
+            self.pending[status].append(file_path)
+
+    def flush(self, force=False):
+        """Show one notification for everything collected, unless the last one is too recent."""
+        with self.lock:
+            if not any(self.pending.values()):
+                return
+            if not force and time.monotonic() - self.last_notified < self.interval:
+                return
+            pending = self.pending
+            self.pending = {SCAN_CHANGED: [], SCAN_REMOVED: [], SCAN_ADDED: []}
+            self.last_notified = time.monotonic()
+
+        lines = []
+        for status, label in ((SCAN_CHANGED, "modified"), (SCAN_REMOVED, "deleted or moved"), (SCAN_ADDED, "created")):
+            file_paths = pending[status]
+            if file_paths:
+                shown = ", ".join(file_paths[:NOTIFY_MAX_PATHS])
+                more = f" and {len(file_paths) - NOTIFY_MAX_PATHS} more" if len(file_paths) > NOTIFY_MAX_PATHS else ""
+                lines.append(f"{len(file_paths)} file(s) {label}: {shown}{more}")
+        self.show_notification("Integrity Alert", "\n".join(lines))
+
+
+class EventPipeline:
+    """Turns bursts of watchdog events into one verification per file.
+
+    Handler threads only put events into a bounded queue. A coalescer thread keeps the last
+    event time per path and hands a path to the worker pool once it has been quiet for the
+    debounce window; workers rehash it against the baseline and only real changes reach
+    the notifier. At most a few paths per worker are handed over at a time, the others wait
+    in pending, and so does a rescan after lost events.
+    """
+
+    def __init__(self, checker, notifier=None, debounce=DEBOUNCE_SECONDS, workers=VERIFY_WORKERS,
+                 queue_size=EVENT_QUEUE_SIZE):
+        self.checker = checker
+        self.notifier = notifier or Notifier()
+        self.debounce = debounce
+        self.events = queue.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_in_flight = workers * 4
+        self.stop_event = threading.Event()
+        self.coalescer = threading.Thread(target=self.run_coalescer, daemon=True)
+
+        #only touched by the coalescer thread, except in_flight which the workers clear
+        self.pending = {}
+        self.in_flight = set()
+        self.in_flight_lock = threading.Lock()
+        self.overflow = threading.Event()
+        #paths still to verify after lost events, see iter_rescan
+        self.rescan = None
+        #last reported (status, hash) per path, so a file is reported once per new content
+        self.reported = {}
+        self.reported_lock = threading.Lock()
+
+    def start(self):
+        self.coalescer.start()
+
+    def stop(self):
+        self.stop_event.set()
+        #not started when an event loop drives coalesce() instead
+        if self.coalescer.is_alive():
+            self.coalescer.join()
+        self.executor.shutdown(wait=True)
+        self.notifier.flush(force=True)
+
+    def submit(self, file_path):
+        """Called from the watchdog thread, never blocks."""
+        METRICS.inc('events_received')
+        try:
+            self.events.put_nowait(file_path)
+        except queue.Full:
+            METRICS.inc('events_dropped')
+            self.overflow.set()
+
+    def run_coalescer(self):
+        while not self.stop_event.is_set():
+            self.coalesce(timeout=self.debounce / 2)
+
+    def coalesce(self, timeout=None):
+        """One round of the coalescer: take the queued events, dispatch the due paths and flush the notifier.
+
+        timeout waits that long for a first event, None only takes what is already queued.
+        """
+        METRICS.set_gauge('event_queue_depth', self.events.qsize())
+        try:
+            if timeout is not None:
+                self.add_pending(self.events.get(timeout=timeout))
+            #drain whatever else is queued before looking at due paths
+            while True:
+                self.add_pending(self.events.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self.overflow.is_set():
+            #events were lost, the only safe answer is to verify every monitored file, a running rescan starts over
+            self.overflow.clear()
+            METRICS.inc('overflow_rescans')
+            self.rescan = self.iter_rescan()
+
+        self.dispatch_due()
+        self.dispatch_rescan()
+        METRICS.set_gauge('pending_verifications', len(self.pending))
+        self.notifier.flush()
+
+    def add_pending(self, file_path):
+        if file_path in self.pending:
+            METRICS.inc('events_coalesced')
+        self.pending[file_path] = time.monotonic()
+
+    def dispatch_due(self):
+        now = time.monotonic()
+        for file_path, last_event in list(self.pending.items()):
+            if now - last_event < self.debounce:
+                continue
+            with self.in_flight_lock:
+                if len(self.in_flight) >= self.max_in_flight:
+                    return
+                #a path still being verified stays pending so it is checked again afterwards
+                if file_path in self.in_flight:
+                    continue
+                self.in_flight.add(file_path)
+            del self.pending[file_path]
+            self.executor.submit(self.verify, file_path)
+
+    def iter_rescan(self):
+        """Every baselined file and every file new to the added folders, to verify after lost events."""
+        #a copy, the baseline may change while the rescan runs
+        yield from list(self.checker.get_files_to_check())
+        for file_path, _ in self.checker.iter_added_files():
+            yield file_path
+
+    def dispatch_rescan(self):
+        """Hand the next rescan paths to the workers, as many as fit next to the verifications in flight."""
+        while self.rescan is not None:
+            with self.in_flight_lock:
+                if len(self.in_flight) >= self.max_in_flight:
+                    return
+            file_path = next(self.rescan, None)
+            if file_path is None:
+                self.rescan = None
+                return
+            with self.in_flight_lock:
+                #a path with a pending event is verified once its debounce window passed
+                if file_path in self.in_flight or file_path in self.pending:
+                    continue
+                self.in_flight.add(file_path)
+            self.executor.submit(self.verify, file_path, True)
+
+    def verify(self, file_path, throttled=False):
+        """Worker: verify one path and report it if it changed. Rescan reads (throttled) go through the checker's throttle."""
+        try:
+            if throttled and self.checker.throttle is not None:
+                self.checker.throttle.admit(file_path)
+            if file_path in self.checker.baseline_hashes:
+                with METRICS.timer('monitor_verify'):
+                    status, current_hash = self.checker.verify_file(file_path)
+            elif os.path.isfile(file_path):
+                #new file in a monitored folder, it is reported until it is added to the baseline
+                status, current_hash = SCAN_ADDED, None
+            else:
+                #created and removed again before it was verified
+                status, current_hash = SCAN_NOT_CHANGED, None
+            METRICS.inc('verifications')
+        except Exception as e:
+            print(f"Could not verify {file_path}: {e}")
+            return
+        finally:
+            with self.in_flight_lock:
+                self.in_flight.discard(file_path)
+
+        with self.reported_lock:
+            if status == SCAN_NOT_CHANGED:
+                #back to the baseline content, report it again if it changes later
+                self.reported.pop(file_path, None)
+                return
+            if self.reported.get(file_path) == (status, current_hash):
+                return
+            self.reported[file_path] = (status, current_hash)
+
+        print(f"File {status}: {file_path}")
+        self.notifier.add(status, file_path)
+
+
+def plan_watches(files_to_monitor, folders):
+    """Compute the smallest set of watches that covers every monitored file.
+
+    Added folders become recursive watches, folders inside another added folder are dropped.
+    Files outside every added folder are covered by a non recursive watch on their directory.
+
+  Returns:
+      tuple: (recursive roots, non recursive directories), both sorted lists.
+      """
+    #shortest paths first, so a parent folder is always a root before its children are looked at
+    roots = WatchRoots(())
+    for folder in sorted({os.path.abspath(folder) for folder in folders}, key=len):
+        if not roots.covers(folder):
+            roots.add(folder)
+
+    covered = roots
+    roots = sorted(roots.roots)
+    directories = {os.path.dirname(os.path.abspath(file)) for file in files_to_monitor}
+    return roots, sorted(directory for directory in directories if not covered.covers(directory))
+
+
+class WatchRoots:
+    """Answers "is this directory inside a recursive watch" with one dict lookup per directory.
+
+    filters maps a root to its file_scanner.ScanFilter: a directory an exclude glob drops is not
+    covered by that root, and files are only accepted if a root covering them accepts them, the
+    same way a check enumerates the added folders.
+    """
+
+    def __init__(self, roots, filters=None):
+        self.roots = set(roots)
+        self.filters = dict(filters or {})
+        #directory -> roots covering it
+        self.cache = {}
+
+    def add(self, root, scan_filter=None):
+        self.roots.add(root)
+        if scan_filter is not None:
+            self.filters[root] = scan_filter
+        self.cache.clear()
+
+    def covering(self, directory):
+        covering = self.cache.get(directory)
+        if covering is not None:
+            return covering
+        parent = os.path.dirname(directory)
+        covering = self.covering(parent) if parent != directory else ()
+        if covering:
+            name = os.path.basename(directory)
+            covering = tuple(root for root in covering if root not in self.filters
+                             or not self.filters[root].excluded(name, directory))
+        if directory in self.roots:
+            covering += (directory,)
+        self.cache[directory] = covering
+        return covering
+
+    def covers(self, directory):
+        return bool(self.covering(directory))
+
+    def accepts(self, file_path):
+        """Check if a file below the roots passes the filter of one of them, its size is only read for size limits."""
+        directory, name = os.path.split(file_path)
+        size = None
+        for root in self.covering(directory):
+            scan_filter = self.filters.get(root)
+            if scan_filter is None:
+                return True
+            if size is None and scan_filter.limits_size():
+                try:
+                    size = os.stat(file_path).st_size
+                except OSError:
+                    #deleted or moved away already, the globs decide
+                    size = None
+            if scan_filter.accepts_file(name, file_path, size):
+                return True
+        return False
+
+
+def count_kernel_watches(roots, directories, dir_states):
+    """inotify needs one watch per directory, so a recursive watch costs one per sub directory on Linux.
+
+    The sub directories are taken from the folder states of the last scan (dir_states: folder -> states,
+    see file_scanner.FolderScanner) instead of walking the trees a second time at startup. Folders that
+    were never scanned count as one watch, so the figure is a lower bound.
+    """
+    if not sys.platform.startswith('linux'):
+        return len(roots) + len(directories)
+    covered = WatchRoots(roots)
+    watched = set(roots)
+    for states in dir_states.values():
+        for directory, state in states.items():
+            for sub_directory in (directory, *state['subdirs']):
+                if covered.covers(sub_directory):
+                    watched.add(sub_directory)
+    return len(directories) + len(watched)
+
+
+class FileChangeHandler(FileSystemEventHandler):
+    def __init__(self, files_to_monitor, pipeline, roots=(), filters=None):
+        #the checker's live view of the baseline paths, only relative paths get an absolute copy to match events against
+        self.files_to_monitor = files_to_monitor
+        self.relative_files = {os.path.abspath(file) for file in files_to_monitor if not os.path.isabs(file)}
+        self.pipeline = pipeline
+        #any file below a recursive root that its folder filter accepts is of interest, also ones created after the baseline
+        self.roots = WatchRoots(roots, filters)
+
+    def is_monitored(self, path):
+        return path in self.files_to_monitor or path in self.relative_files or self.roots.accepts(path)
+
     def on_modified(self, event):
-        if event.src_path in self.files_to_monitor:
-            print(f"File modified: {event.src_path}")
-            self.show_notification("File Modified", f"{event.src_path} was modified.")
+        if not event.is_directory and self.is_monitored(event.src_path):
+            self.pipeline.submit(event.src_path)
 
     def on_created(self, event):
-        if event.src_path in self.files_to_monitor:
-            print(f"File created: {event.src_path}")
-            self.show_notification("File Created", f"{event.src_path} was created.")
+        if not event.is_directory and self.is_monitored(event.src_path):
+            self.pipeline.submit(event.src_path)
 
     def on_deleted(self, event):
-        if event.src_path in self.files_to_monitor:
-            print(f"File deleted: {event.src_path}")
-            self.show_notification("File Deleted", f"{event.src_path} was deleted.")
+        if not event.is_directory and self.is_monitored(event.src_path):
+            self.pipeline.submit(event.src_path)
 
     def on_moved(self, event):
-        if event.src_path in self.files_to_monitor:
-            print(f"File moved or renamed from {event.src_path} to {event.dest_path}")
-            self.show_notification("File Moved", f"{event.src_path} was moved or renamed.")
+        if event.is_directory:
+            return
+        if self.is_monitored(event.src_path):
+            self.pipeline.submit(event.src_path)
+        if self.is_monitored(event.dest_path):
+            self.pipeline.submit(event.dest_path)
+
+def start_observer(files_to_monitor, folders, pipeline):
+    """Schedule the watches for the files and added folders and start a watchdog observer feeding pipeline.
+
+  Returns:
+      tuple: (observer, recursive roots, non recursive directories)
+      """
+    start = time.perf_counter()
 
-def monitor_files(files_to_monitor):
     # Ensure all files exist
-    for file in files_to_monitor:
-        if not os.path.isfile(file):
-            print(f"Warning: {file} does not exist and won't be monitored.")
+    missing = sum(1 for file in files_to_monitor if not os.path.isfile(file))
+    if missing:
+        print(f"Warning: {missing} file(s) do not exist, they are watched in case they come back.")
 
-    event_handler = FileChangeHandler(files_to_monitor)
+    roots, directories = plan_watches(files_to_monitor, folders)
+    #nested added folders share their parent's watch but keep their own filter, so events are matched
+    #against every added folder and not only against the watched roots
+    folder_roots = [os.path.abspath(folder) for folder in folders]
+    filters = {root: pipeline.checker.folder_scan_filter(folder) for root, folder in zip(folder_roots, folders)}
+    event_handler = FileChangeHandler(files_to_monitor, pipeline, folder_roots, filters)
     observer = Observer()
-    
-    # Monitor the parent directories of the files
-    parent_directories = {os.path.dirname(os.path.abspath(file)) for file in files_to_monitor}
-    
-    for directory in parent_directories:
-        print(f"Monitoring directory: {directory}")
-        observer.schedule(event_handler, directory, recursive=False)
+
+    # Monitor added folders recursively and the parent directories of the remaining files
+    for root in roots:
+        print(f"Monitoring folder recursively: {root}")
+        observer.schedule(event_handler, root, recursive=True)
+    for directory in directories:
+        if os.path.isdir(directory):
+            observer.schedule(event_handler, directory, recursive=False)
 
     observer.start()
 
+    elapsed = time.perf_counter() - start
+    dir_states = {folder: pipeline.checker.baseline_store.load_dir_states(folder) for folder in folders}
+    print(f"Monitoring {len(files_to_monitor)} file(s) with {len(roots)} recursive and {len(directories)} directory watch(es), "
+          f"at least {count_kernel_watches(roots, directories, dir_states)} kernel watch(es), started in {elapsed:.2f}s")
+    return observer, roots, directories
+
+def monitor_files(files_to_monitor, checker, folders=(), metrics_file=None):
+    """Watch the files and added folders until Ctrl+C. metrics_file is rewritten every METRICS_WRITE_SECONDS."""
+    pipeline = EventPipeline(checker)
+    pipeline.start()
+    observer, _, _ = start_observer(files_to_monitor, folders, pipeline)
+
     try:
+        last_write = 0.0
         while True:
             time.sleep(1)  # Keep the script running
+            if metrics_file and time.monotonic() - last_write >= METRICS_WRITE_SECONDS:
+                METRICS.write_prometheus(metrics_file)
+                last_write = time.monotonic()
     except KeyboardInterrupt:
         observer.stop()
 
     observer.join()
+    pipeline.stop()
+    if metrics_file:
+        METRICS.write_prometheus(metrics_file)
 
 if __name__ == "__main__":
-    # Create a Tkinter root instance (needed to initialize the app)
-    root = tk.Tk()
-    # Create an instance of the FileIntegrityCheckerApp
-    app = FileIntegrityCheckerApp(root)
-    
+    parser = argparse.ArgumentParser(description="Real time file integrity monitoring")
+    parser.add_argument('--data-dir', help="folder holding the baseline (default: $FIC_DATA_DIR or the platform's data folder)")
+    parser.add_argument('--metrics-file', help="write Prometheus metrics to this file (node exporter textfile collector)")
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args()
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+
+    # Load the baseline without any GUI
+    checker = IntegrityChecker(data_dir=args.data_dir)
+
     # Get the list of files to monitor
-    files_to_monitor = app.get_files_to_check()
-    
-    # Close the Tkinter window (optional, as you might not need it for monitoring)
-    root.destroy()  
+    files_to_monitor = checker.get_files_to_check()
 
     # Start monitoring the files
-    monitor_files(files_to_monitor)
+    monitor_files(files_to_monitor, checker, checker.get_added_folders(), metrics_file=args.metrics_file)
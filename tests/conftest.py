@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+#the modules live in the repository root, next to FIC.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fic_core import IntegrityChecker
+
+
+@pytest.fixture
+def make_checker(tmp_path, monkeypatch):
+    """IntegrityChecker factory on a data folder in tmp_path, closed after the test."""
+    #a key or data folder of the shell running the tests must not leak in
+    monkeypatch.delenv('FIC_SEAL_KEY', raising=False)
+    monkeypatch.delenv('FIC_DATA_DIR', raising=False)
+    checkers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('data_dir', str(tmp_path / "data"))
+        checker = IntegrityChecker(**kwargs)
+        checkers.append(checker)
+        return checker
+
+    yield make
+    for checker in checkers:
+        checker.close()
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """A folder of three small files."""
+    path = tmp_path / "files"
+    path.mkdir()
+    for name in ("a.txt", "b.txt", "c.txt"):
+        (path / name).write_text(f"contents of {name}\n")
+    return path
@@ -0,0 +1,288 @@
+import json
+import os
+
+import pytest
+
+import baseline_seal
+from baseline_seal import HmacSigner, MerkleSeal, MissingKeySigner, SealError, generate_key, meta_entries
+from baseline_record import record_hash, stat_fields
+from baseline_store import JsonBaselineStore, SqliteBaselineStore
+from fic_core import SCAN_ADDED, SCAN_CHANGED, SCAN_NOT_CHANGED
+
+
+def make_records(count):
+    return {f"/data/file_{i:05d}": {'hash': f"{i:064x}", 'size': i, 'mtime_ns': i * 1000} for i in range(count)}
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def sealed_store(request, tmp_path):
+    """A store of 300 records sealed with an HMAC key."""
+    if request.param == 'sqlite':
+        store = SqliteBaselineStore(str(tmp_path / "baseline.db"))
+    else:
+        store = JsonBaselineStore(str(tmp_path / "baseline.json"))
+    records = make_records(300)
+    store.upsert_many(records)
+    store.set_seal(MerkleSeal(HmacSigner(b"test key")))
+    store.reseal(records)
+    yield store, records
+    store.close()
+
+
+def test_intact_baseline_verifies(sealed_store):
+    store, records = sealed_store
+
+    assert store.verify_seal_all(records) == ([], set())
+    assert store.verify_seal(list(records), records) == []
+    assert store.verify_seal_meta() == []
+
+
+def test_sealed_writes_keep_the_tree_up_to_date(sealed_store):
+    store, records = sealed_store
+    changes = {"/data/file_00001": {'hash': "f" * 64}, "/data/new": {'hash': "e" * 64}}
+    store.upsert_many(changes)
+    store.delete_many(["/data/file_00002"])
+    records = {**records, **changes}
+    del records["/data/file_00002"]
+
+    assert store.verify_seal_all(records) == ([], set())
+
+
+def test_tampered_and_deleted_records_are_found(sealed_store):
+    store, records = sealed_store
+    tampered = dict(records)
+    #written around the store, the way an attacker with access to the baseline would
+    tampered["/data/file_00007"] = {**records["/data/file_00007"], 'hash': "0" * 64}
+    del tampered["/data/file_00011"]
+
+    changed, deleted = store.verify_seal_all(tampered)
+
+    assert changed == ["/data/file_00007"]
+    assert deleted == {MerkleSeal.path_digest("/data/file_00011")}
+    assert store.verify_seal(["/data/file_00007", "/data/file_00008"], tampered) == ["/data/file_00007"]
+
+
+def test_record_added_around_the_seal_is_found(sealed_store):
+    store, records = sealed_store
+
+    changed, _ = store.verify_seal_all({**records, "/data/planted": {'hash': "1" * 64}})
+
+    assert changed == ["/data/planted"]
+
+
+def test_verify_all_in_several_passes(sealed_store, monkeypatch):
+    monkeypatch.setattr(baseline_seal, 'VERIFY_PASS_ENTRIES', 70)
+    store, records = sealed_store
+    tampered = dict(records)
+    for file_path in ("/data/file_00003", "/data/file_00150", "/data/file_00299"):
+        tampered[file_path] = {'hash': "2" * 64}
+    del tampered["/data/file_00100"]
+
+    changed, deleted = store.verify_seal_all(tampered)
+
+    assert sorted(changed) == ["/data/file_00003", "/data/file_00150", "/data/file_00299"]
+    assert deleted == {MerkleSeal.path_digest("/data/file_00100")}
+
+
+def test_forged_root_is_refused(sealed_store):
+    store, records = sealed_store
+    state = dict(store.get_meta('baseline_seal'), signature="0" * 64)
+    store.set_meta('baseline_seal', state)
+
+    with pytest.raises(SealError):
+        store.verify_seal_all(records)
+
+
+def test_other_key_is_refused(sealed_store):
+    store, _ = sealed_store
+    seal = MerkleSeal(HmacSigner(b"other key"))
+
+    assert "another key" in seal.verify_root(store.get_meta('baseline_seal'), store.load_merkle)
+
+
+def test_sealed_meta_is_checked(sealed_store):
+    store, records = sealed_store
+    store.set_meta('folder_filters', {"/data": {'include': [], 'exclude': ["*.log"], 'min_size': None, 'max_size': None}})
+    assert store.verify_seal_meta() == []
+
+    #an exclude pattern slipped in around the store
+    store.seal = None
+    store.set_meta('folder_filters', {"/data": {'include': [], 'exclude': ["*"], 'min_size': None, 'max_size': None}})
+    store.set_seal(MerkleSeal(HmacSigner(b"test key"), store.get_meta('baseline_seal')['depth']))
+
+    assert store.verify_seal_meta() == ['folder_filters']
+    assert store.verify_seal_all(records)[0] == [baseline_seal.META_ENTRY_PREFIX + 'folder_filters']
+
+
+def test_missing_key_refuses_writes(sealed_store):
+    store, records = sealed_store
+    state = store.get_meta('baseline_seal')
+    store.set_seal(MerkleSeal(MissingKeySigner(state), state['depth']))
+
+    with pytest.raises(SealError):
+        store.upsert_many({"/data/file_00001": {'hash': "f" * 64}})
+    with pytest.raises(SealError):
+        store.set_meta('added_folders', ["/elsewhere"])
+
+    assert store.get("/data/file_00001") == records["/data/file_00001"]
+    assert store.get_meta('added_folders', []) == []
+    assert store.get_meta('baseline_seal') == state
+
+
+def test_depth_follows_the_baseline_size():
+    assert MerkleSeal.depth_for(0) == baseline_seal.MIN_DEPTH
+    assert MerkleSeal.depth_for(8 * 2 ** 10) == 11
+    assert MerkleSeal.depth_for(10 ** 12) == baseline_seal.MAX_DEPTH
+
+
+def test_entry_digest_does_not_depend_on_the_record_form():
+    assert MerkleSeal.entry_digest("/a", "ab" * 32) == MerkleSeal.entry_digest("/a", {'hash': "ab" * 32, 'inode': None})
+    assert MerkleSeal.entry_digest("/a", {'hash': "ab" * 32}) != MerkleSeal.entry_digest("/b", {'hash': "ab" * 32})
+
+
+def test_meta_entries_cover_every_sealed_key():
+    assert sorted(meta_entries(lambda key, default: default)) == \
+           sorted(baseline_seal.META_ENTRY_PREFIX + key for key in baseline_seal.SEALED_META)
+
+
+@pytest.fixture
+def seal_key(tmp_path):
+    return generate_key(str(tmp_path / "seal.key"))
+
+
+def test_checker_reports_a_deleted_record(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    removed = checker.normalise_file_path(str(folder / "b.txt"))
+    with checker.baseline_store.lock, checker.baseline_store.connection:
+        checker.baseline_store.connection.execute("DELETE FROM baseline WHERE path = ?", (removed,))
+    checker.close()
+
+    checker = make_checker(seal_key=seal_key)
+    results = checker.scan_results()
+
+    assert results[SCAN_CHANGED] == [removed]
+    assert checker.deleted_record_paths == [removed]
+    assert checker.report_results(results)['tampered'] == [removed]
+    assert checker.accept_changes(changed=[removed])[0] == 1
+    assert checker.verify_seal_all() == set()
+    assert checker.deleted_records == set()
+
+
+def test_checker_counts_deleted_records_of_missing_files(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    removed = checker.normalise_file_path(str(folder / "b.txt"))
+    with checker.baseline_store.lock, checker.baseline_store.connection:
+        checker.baseline_store.connection.execute("DELETE FROM baseline WHERE path = ?", (removed,))
+    checker.close()
+    (folder / "b.txt").unlink()
+
+    checker = make_checker(seal_key=seal_key)
+    results = checker.scan_results()
+
+    assert results[SCAN_CHANGED] == []
+    assert checker.report_results(results)['deleted_records'] == 1
+
+
+def test_checker_reports_a_tampered_record(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    tampered = checker.normalise_file_path(str(folder / "a.txt"))
+    with checker.baseline_store.lock, checker.baseline_store.connection:
+        checker.baseline_store.connection.execute("UPDATE baseline SET hash = ? WHERE path = ?", ("0" * 64, tampered))
+    checker.close()
+
+    checker = make_checker(seal_key=seal_key)
+    results = checker.scan_results()
+
+    assert results[SCAN_CHANGED] == [tampered]
+    assert len(results[SCAN_NOT_CHANGED]) == 2
+    assert checker.tampered_records == [tampered]
+
+
+def test_checker_reports_changed_folder_filters(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    folder_path = checker.normalise_folder_path(str(folder))
+    with checker.baseline_store.lock, checker.baseline_store.connection:
+        checker.baseline_store.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('folder_filters', ?)",
+            (json.dumps({folder_path: {'include': [], 'exclude': ["*.txt"], 'min_size': None, 'max_size': None}}),))
+    checker.close()
+
+    checker = make_checker(seal_key=seal_key)
+
+    assert checker.seal_problems == ["The added folders or their filters were changed outside IntegriSecure."]
+
+
+def test_checker_without_the_key_does_not_change_a_sealed_baseline(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    checker.close()
+    (folder / "d.txt").write_text("new\n")
+
+    checker = make_checker()
+    added = checker.normalise_file_path(str(folder / "d.txt"))
+    assert checker.accept_changes(added=[added]) == (0, 0, 0, 0)
+    assert added not in checker.baseline_store.load_all()
+    checker.close()
+
+    checker = make_checker(seal_key=seal_key)
+    assert checker.verify_seal_all() == set()
+    assert checker.seal_problems == []
+
+
+def test_cache_entries_need_the_key():
+    seal = MerkleSeal(HmacSigner(b"test key"))
+    entry = seal.seal_cache('checkpoint', "/a", {'status': SCAN_NOT_CHANGED, 'size': 1})
+
+    assert seal.cache_trusted('checkpoint', "/a", entry)
+    assert not seal.cache_trusted('checkpoint', "/b", entry)
+    assert not seal.cache_trusted('dir', "/a", entry)
+    assert not seal.cache_trusted('checkpoint', "/a", {**entry, 'status': SCAN_CHANGED})
+    assert not MerkleSeal(HmacSigner(b"other key")).cache_trusted('checkpoint', "/a", entry)
+    assert not MerkleSeal(MissingKeySigner({})).cache_trusted('checkpoint', "/a", entry)
+
+
+def test_checker_does_not_trust_a_forged_checkpoint(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    changed = checker.normalise_file_path(str(folder / "a.txt"))
+    checker.scan_results(max_bytes=1)
+    (folder / "a.txt").write_text("changed\n")
+    #a row claiming the changed file was hashed and found unchanged
+    checker.baseline_store.save_scan_checkpoint({changed: {
+        'status': SCAN_NOT_CHANGED, 'hash': record_hash(checker.baseline_hashes[changed]),
+        'baseline': record_hash(checker.baseline_hashes[changed]), 'ranges': None, **stat_fields(os.stat(changed))}})
+    checker.close()
+
+    checker = make_checker(seal_key=seal_key)
+
+    assert checker.scan_results()[SCAN_CHANGED] == [changed]
+
+
+def test_checker_trusts_its_own_checkpoint(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    [sliced] = checker.scan_results(max_bytes=1)[SCAN_NOT_CHANGED]
+
+    assert checker.checkpointed(sliced, os.stat(sliced))
+
+
+def test_checker_does_not_trust_forged_folder_states(make_checker, folder, seal_key):
+    checker = make_checker(seal_key=seal_key)
+    checker.add_folder_to_baseline(str(folder))
+    folder_path = checker.normalise_folder_path(str(folder))
+    checker.scan_results()
+    states = checker.baseline_store.load_dir_states(folder_path)
+    assert checker.load_dir_states(folder_path) == states and folder_path in states
+
+    (folder / "d.txt").write_text("new\n")
+    #a state claiming the folder was listed after d.txt was created
+    states[folder_path]['mtime_ns'] = os.stat(folder).st_mtime_ns
+    states[folder_path]['nlink'] = os.stat(folder).st_nlink
+    checker.baseline_store.save_dir_states(folder_path, states)
+
+    assert checker.load_dir_states(folder_path) == {}
+    assert checker.scan_results()[SCAN_ADDED] == [checker.normalise_file_path(str(folder / "d.txt"))]
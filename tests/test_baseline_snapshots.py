@@ -0,0 +1,162 @@
+import os
+import random
+import sys
+
+import pytest
+
+from baseline_snapshots import (DIFF_ADDED, DIFF_CHANGED, DIFF_REMOVED, DIFF_RENAMED, RunSorter, SnapshotError,
+                                SnapshotStore, diff_snapshots)
+
+
+def entry(path, digest, size=10, mtime_ns=1000):
+    return path, digest, size, mtime_ns
+
+
+def diff(store, old_entries, new_entries):
+    old, new = store.take(old_entries), store.take(new_entries)
+    return sorted(store.diff(old['id'], new['id']))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "snapshots"))
+
+
+def test_snapshot_entries_come_back_in_path_order(store):
+    entries = [entry(f"/data/{i:04d}", f"{i:064x}") for i in range(500)]
+    shuffled = list(entries)
+    random.Random(1).shuffle(shuffled)
+
+    meta = store.take(shuffled, label="first", pending=0)
+
+    assert meta['entries'] == 500
+    assert meta['label'] == "first"
+    assert meta['pending'] == 0
+    assert list(store.entries(meta['id'])) == entries
+
+
+def test_diff_finds_every_kind_of_change(store):
+    old_entries = [entry("/a", "1" * 64), entry("/b", "2" * 64), entry("/c", "3" * 64), entry("/d", "4" * 64)]
+    new_entries = [entry("/a", "1" * 64), entry("/b", "9" * 64), entry("/e", "4" * 64), entry("/f", "5" * 64)]
+
+    assert diff(store, old_entries, new_entries) == [
+        (DIFF_ADDED, "/f", None),
+        (DIFF_CHANGED, "/b", None),
+        (DIFF_REMOVED, "/c", None),
+        (DIFF_RENAMED, "/e", "/d"),
+    ]
+
+
+def test_identical_snapshots_have_no_differences(store):
+    entries = [entry(f"/data/{i}", f"{i:064x}") for i in range(100)]
+
+    assert diff(store, entries, entries) == []
+
+
+def test_renamed_copies_keep_their_names_first(store):
+    old_entries = [entry("/old/a.txt", "1" * 64), entry("/old/b.txt", "1" * 64), entry("/old/c.txt", "1" * 64)]
+    new_entries = [entry("/new/b.txt", "1" * 64), entry("/new/x.txt", "1" * 64)]
+
+    assert diff(store, old_entries, new_entries) == [
+        (DIFF_REMOVED, "/old/c.txt", None),
+        (DIFF_RENAMED, "/new/b.txt", "/old/b.txt"),
+        (DIFF_RENAMED, "/new/x.txt", "/old/a.txt"),
+    ]
+
+
+def test_same_digest_of_another_size_is_no_rename(store):
+    assert diff(store, [entry("/a", "1" * 64, size=10)], [entry("/b", "1" * 64, size=11)]) == [
+        (DIFF_ADDED, "/b", None),
+        (DIFF_REMOVED, "/a", None),
+    ]
+
+
+def test_files_without_a_digest_compare_by_size_and_mtime(store):
+    old_entries = [entry("/a", None, 10, 1), entry("/b", None, 10, 1), entry("/c", None, 10, 1)]
+    new_entries = [entry("/a", None, 10, 1), entry("/b", None, 10, 2), entry("/d", None, 10, 1)]
+
+    assert diff(store, old_entries, new_entries) == [
+        (DIFF_ADDED, "/d", None),
+        (DIFF_CHANGED, "/b", None),
+        (DIFF_REMOVED, "/c", None),
+    ]
+
+
+def test_diff_of_sorted_streams_spills_in_runs(tmp_path):
+    old_entries = [entry(f"/old/{i:03d}", f"{i:064x}") for i in range(50)]
+    new_entries = [entry(f"/new/{i:03d}", f"{i:064x}") for i in range(0, 50, 2)]
+
+    results = list(diff_snapshots(old_entries, new_entries, str(tmp_path)))
+
+    assert sorted(new_path for status, new_path, _ in results if status == DIFF_RENAMED) == \
+           [f"/new/{i:03d}" for i in range(0, 50, 2)]
+    assert sorted(old_path for status, old_path, _ in results if status == DIFF_REMOVED) == \
+           [f"/old/{i:03d}" for i in range(1, 50, 2)]
+
+
+def test_run_sorter_merges_its_runs(tmp_path):
+    entries = [entry(f"/data/{i:04d}", f"{i:064x}") for i in range(100)]
+    sorter = RunSorter(str(tmp_path), run_entries=7)
+    for item in reversed(entries):
+        sorter.add(item)
+    sorter.flush()
+
+    assert len(sorter.runs) == 15
+    assert list(sorter.merged()) == entries
+
+
+def test_compact_keeps_the_entries(store, monkeypatch):
+    entries = [entry(f"/data/{i:04d}", f"{i:064x}") for i in range(100)]
+    monkeypatch.setattr(RunSorter.__init__, '__defaults__', (RunSorter.__init__.__defaults__[0], 30, "run"))
+    meta = store.take(entries)
+    assert len(meta['runs']) == 4
+
+    assert store.compact(meta['id'])
+    assert not store.compact(meta['id'])
+    assert list(store.entries(meta['id'])) == entries
+
+
+def test_undecodable_file_names(store):
+    #what os.listdir makes of a file name that is not valid UTF-8
+    bad = "/data/bad\udcff.txt"
+    old = store.take([entry(bad, "1" * 64), entry("/data/ok", "2" * 64)])
+    new = store.take([entry(bad, "3" * 64), entry("/data/ok", "2" * 64)])
+
+    assert list(store.entries(old['id'])) == [entry(bad, "1" * 64), entry("/data/ok", "2" * 64)]
+    assert list(store.diff(old['id'], new['id'])) == [(DIFF_CHANGED, bad, None)]
+
+
+@pytest.mark.skipif(sys.platform in ('win32', 'darwin'), reason="the filesystem only takes valid names")
+def test_checker_snapshots_undecodable_file_names(make_checker, folder):
+    with open(os.path.join(os.fsencode(folder), b"bad\xff.txt"), 'wb') as f:
+        f.write(b"bad\n")
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+
+    meta = checker.take_snapshot(checker.scan_results())
+
+    assert meta is not None and meta['entries'] == 4
+    assert checker.normalise_file_path(os.fsdecode(os.path.join(os.fsencode(folder), b"bad\xff.txt"))) in \
+           {file_path for file_path, *_ in checker.snapshots.entries(meta['id'])}
+
+
+def test_resolve_and_prune(store):
+    first = store.take([entry("/a", "1" * 64)], label="before")
+    second = store.take([entry("/a", "2" * 64)])
+    third = store.take([entry("/a", "3" * 64)])
+
+    assert store.resolve('latest')['id'] == third['id']
+    assert store.resolve('previous')['id'] == second['id']
+    assert store.resolve("before")['id'] == first['id']
+    with pytest.raises(SnapshotError):
+        store.resolve("nothing")
+
+    deleted, _ = store.prune(keep=1)
+
+    assert deleted == [first['id'], second['id']]
+    assert [meta['id'] for meta in store.list()] == [third['id']]
+
+
+def test_no_snapshots_yet(store):
+    with pytest.raises(SnapshotError):
+        store.resolve('latest')
@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+
+import pytest
+
+from baseline_store import JsonBaselineStore, SqliteBaselineStore, open_baseline_store
+from fic_core import SCAN_ADDED, SCAN_NOT_CHANGED
+
+#a file name that is not valid UTF-8, as os.listdir returns it (PEP 383)
+UNDECODABLE = "bad\udcff.txt"
+
+
+def record(digit, size=10):
+    return {'hash': digit * 64, 'algorithm': 'sha256', 'size': size, 'mtime_ns': 1000, 'inode': 7, 'ctime_ns': 2000}
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        store = SqliteBaselineStore(str(tmp_path / "baseline.db"))
+    else:
+        store = JsonBaselineStore(str(tmp_path / "baseline.json"))
+    yield store
+    store.close()
+
+
+def reopen(store):
+    store.close()
+    if isinstance(store, SqliteBaselineStore):
+        return SqliteBaselineStore(store.db_path)
+    return JsonBaselineStore(store.json_path)
+
+
+def test_records_round_trip(store):
+    records = {"/a": record("1"), "/b": {**record("2"), 'fast_hash': "ff", 'fast_algorithm': 'xxh3_64'},
+               "/c": {'hash': "3" * 64}}
+    store.upsert_many(records)
+
+    store = reopen(store)
+
+    assert store.load_all() == records
+    assert store.get("/a") == record("1")
+    assert store.get("/missing") is None
+    assert store.count() == 3
+    assert dict(store.iter_all()) == store.load_all()
+    store.close()
+
+
+def test_batched_changes(store):
+    store.upsert_many({"/a": record("1"), "/b": record("2"), "/c": record("3")})
+
+    store.apply_changes({"/b": record("4"), "/d": record("5")}, ["/a", "/b"])
+    store.delete_many(["/c", "/missing"])
+
+    assert store.load_all() == {"/b": record("4"), "/d": record("5")}
+
+
+def test_rename(store):
+    store.upsert_many({"/a": record("1")})
+
+    assert store.rename("/a", "/moved/a")
+    assert not store.rename("/a", "/elsewhere")
+    assert store.load_all() == {"/moved/a": record("1")}
+
+
+def test_paths_with_hash(store):
+    store.upsert_many({"/a": record("1"), "/copy/a": record("1"), "/b": record("2")})
+
+    assert sorted(store.paths_with_hash("1" * 64)) == ["/a", "/copy/a"]
+    assert store.paths_with_hash("9" * 64) == []
+
+
+def test_meta_dir_states_and_checkpoint(store):
+    store.set_meta('quick_checks_since_full', 3)
+    store.save_dir_states("/data", {"/data": {'mtime_ns': 1}, "/data/sub": {'mtime_ns': 2}})
+    store.save_dir_states("/other", {"/other": {'mtime_ns': 3}})
+    store.save_scan_checkpoint({"/a": {'status': 'changed', 'hash': "1" * 64}})
+    store.save_scan_checkpoint({"/b": {'status': 'not_changed', 'hash': "2" * 64}})
+    store.clear_scan_checkpoint(["/a"])
+
+    store = reopen(store)
+
+    assert store.get_meta('quick_checks_since_full') == 3
+    assert store.get_meta('missing', "default") == "default"
+    assert store.load_dir_states("/data") == {"/data": {'mtime_ns': 1}, "/data/sub": {'mtime_ns': 2}}
+    assert store.load_scan_checkpoint() == {"/b": {'status': 'not_changed', 'hash': "2" * 64}}
+    store.clear_scan_checkpoint()
+    assert store.load_scan_checkpoint() == {}
+    store.close()
+
+
+def test_undecodable_paths_round_trip(store):
+    file_path = "/data/" + UNDECODABLE
+    store.upsert_many({file_path: record("1"), "/data/ok.txt": record("2")})
+    store.save_dir_states("/data/" + UNDECODABLE + "dir", {"/data/" + UNDECODABLE + "dir": {'mtime_ns': 1}})
+    store.save_scan_checkpoint({file_path: {'status': 'changed'}})
+
+    store = reopen(store)
+
+    assert store.get(file_path) == record("1")
+    assert set(store.load_all()) == {file_path, "/data/ok.txt"}
+    assert store.paths_with_hash("1" * 64) == [file_path]
+    assert list(store.load_dir_states("/data/" + UNDECODABLE + "dir")) == ["/data/" + UNDECODABLE + "dir"]
+    assert list(store.load_scan_checkpoint()) == [file_path]
+    assert store.rename(file_path, file_path + ".old")
+    store.delete_many([file_path + ".old"])
+    assert set(store.load_all()) == {"/data/ok.txt"}
+    store.close()
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    legacy_path = str(tmp_path / "baseline_hashes.json")
+    with open(legacy_path, 'w') as f:
+        json.dump({"/a": "1" * 64, "/b": record("2")}, f)
+    db_path = str(tmp_path / "baseline.db")
+
+    store = open_baseline_store(db_path, legacy_path)
+    assert store.count() == 2
+    store.upsert_many({"/c": record("3")})
+    store.close()
+    with open(legacy_path, 'w') as f:
+        json.dump({"/d": record("4")}, f)
+
+    store = open_baseline_store(db_path, legacy_path)
+    assert sorted(store.load_all()) == ["/a", "/b", "/c"]
+    store.export_json(legacy_path)
+    store.close()
+    with open(legacy_path) as f:
+        assert sorted(json.load(f)) == ["/a", "/b", "/c"]
+
+
+@pytest.mark.skipif(sys.platform in ('win32', 'darwin'), reason="the filesystem only takes valid names")
+def test_folder_with_an_undecodable_name(make_checker, tmp_path):
+    folder = tmp_path / "files"
+    folder.mkdir()
+    (folder / "ok.txt").write_text("ok\n")
+    with open(os.path.join(os.fsencode(folder), b"bad\xff.txt"), 'wb') as f:
+        f.write(b"bad\n")
+    checker = make_checker()
+
+    assert checker.add_folder_to_baseline(str(folder)) == 2
+    checker.close()
+
+    results = make_checker().scan_results()
+    assert results[SCAN_ADDED] == []
+    assert len(results[SCAN_NOT_CHANGED]) == 2
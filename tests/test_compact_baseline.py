@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from compact_baseline import CompactBaseline
+
+DIGEST = "ab" * 32
+
+
+def full_record(**fields):
+    return {'hash': DIGEST, 'algorithm': 'sha256', 'size': 10, 'mtime_ns': 1, 'inode': 2, 'ctime_ns': 3, **fields}
+
+
+@pytest.mark.parametrize('record', [
+    full_record(),
+    full_record(algorithm='blake2b', hash="cd" * 64),
+    full_record(hash="AB" * 32),
+    full_record(fast_hash="0123456789abcdef", fast_algorithm='xxh3_64'),
+    full_record(chunk_size=1024, chunks=["ef" * 32], merkle_version=2),
+    full_record(inode=2 ** 64 - 1),
+    {'hash': DIGEST},
+    {'hash': None, 'algorithm': 'sha256', 'size': 0},
+    DIGEST,
+], ids=['full', 'other_digest_size', 'upper_case', 'prefilter', 'chunked', 'unsigned_inode', 'hash_only',
+        'unreadable', 'legacy_string'])
+def test_records_round_trip(record):
+    baseline = CompactBaseline({"/data/file": record})
+
+    assert baseline["/data/file"] == record
+
+
+def test_mapping_behaviour():
+    baseline = CompactBaseline()
+    baseline.update({"/a/1": full_record(), "/a/2": full_record(size=20)})
+    baseline["/b/1"] = DIGEST
+
+    assert len(baseline) == 3
+    assert sorted(baseline) == ["/a/1", "/a/2", "/b/1"]
+    assert "/a/1" in baseline and "/a/3" not in baseline and 5 not in baseline
+    assert baseline.get("/a/3") is None
+
+    del baseline["/a/1"]
+    with pytest.raises(KeyError):
+        del baseline["/a/1"]
+    with pytest.raises(KeyError):
+        baseline["/a/1"]
+    assert len(baseline) == 2
+
+
+def test_freed_slots_are_reused():
+    baseline = CompactBaseline({f"/data/{i}": full_record(size=i) for i in range(10)})
+    slots = len(baseline.algorithm_codes)
+    for i in range(5):
+        del baseline[f"/data/{i}"]
+
+    baseline.update({f"/other/{i}": full_record(fast_hash="ff", fast_algorithm='xxh3_64') for i in range(5)})
+
+    assert len(baseline.algorithm_codes) == slots
+    assert baseline["/data/7"] == full_record(size=7)
+    assert baseline["/other/3"] == full_record(fast_hash="ff", fast_algorithm='xxh3_64')
+    #extras of a deleted record do not leak into the record that takes its slot
+    baseline["/again/0"] = full_record()
+    del baseline["/other/0"]
+    baseline["/again/1"] = full_record()
+    assert baseline["/again/1"] == full_record()
+
+
+def test_count_in_dir():
+    base = os.path.join(os.sep, "data")
+    baseline = CompactBaseline({os.path.join(base, "a"): DIGEST, os.path.join(base, "b"): DIGEST,
+                                os.path.join(base, "sub", "c"): DIGEST})
+
+    assert baseline.count_in_dir(base) == 2
+    assert baseline.count_in_dir(os.path.join(base, "sub")) == 1
+    assert baseline.count_in_dir(os.path.join(base, "missing")) == 0
+
+
+def test_iteration_survives_additions():
+    baseline = CompactBaseline({"/data/a": DIGEST, "/data/b": DIGEST})
+
+    for file_path in baseline:
+        baseline["/data/new_" + os.path.basename(file_path)] = DIGEST
+
+    assert len(baseline) == 4
+
+
+def test_checker_keeps_the_baseline_compact(make_checker, folder):
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+
+    reopened = make_checker()
+
+    assert isinstance(reopened.baseline_hashes, CompactBaseline)
+    assert dict(reopened.baseline_hashes) == dict(checker.baseline_hashes)
+    assert reopened.baseline_hashes.count_in_dir(checker.normalise_folder_path(str(folder))) == 3
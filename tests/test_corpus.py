@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+sys.path.insert(0, BENCHMARKS)
+
+from corpus import CorpusSpec, corpus_size, generate_corpus
+
+SMALL = CorpusSpec(tiny=25, huge=1, huge_mb=1, depth=5, hardlinks=3, sparse=1, sparse_mb=1)
+
+
+def contents(created):
+    return {os.path.basename(file_path): Path(file_path).read_bytes() for file_paths in created.values() for file_path in file_paths}
+
+
+def test_same_seed_same_corpus(tmp_path):
+    first = generate_corpus(str(tmp_path / "first"), SMALL)
+    second = generate_corpus(str(tmp_path / "second"), SMALL)
+    other = generate_corpus(str(tmp_path / "other"), CorpusSpec(**{**SMALL.to_dict(), 'seed': 2}))
+
+    assert contents(first) == contents(second)
+    assert contents(first) != contents(other)
+
+
+def test_every_shape_is_created(tmp_path):
+    created = generate_corpus(str(tmp_path), SMALL)
+
+    assert {shape: len(file_paths) for shape, file_paths in created.items()} == \
+           {'tiny': 25, 'huge': 1, 'deep': 5, 'hardlinks': 3, 'sparse': 1}
+    assert os.path.getsize(created['huge'][0]) == 1024 * 1024
+    assert os.path.getsize(created['sparse'][0]) == 1024 * 1024
+    assert created['deep'][-1].count("level_") == 5
+    assert os.path.samefile(created['hardlinks'][0], created['tiny'][0])
+
+    files, total = corpus_size(created)
+    assert files == 35
+    assert total == 2 * 1024 * 1024 + sum(os.path.getsize(path) for path in created['tiny'] + created['deep'])
+
+
+def test_scanner_benchmark_writes_its_results(tmp_path):
+    output = tmp_path / "results.json"
+
+    subprocess.run([sys.executable, os.path.join(BENCHMARKS, "bench_scanner.py"), '--tiny', '50', '--huge', '1',
+                    '--huge-mb', '1', '--depth', '3', '--hardlinks', '5', '--sparse', '1', '--sparse-mb', '1',
+                    '--output', str(output)], check=True, capture_output=True)
+
+    phases = {phase['name']: phase for phase in json.loads(output.read_text())['phases']}
+    assert {'baseline', 'full_check', 'quick_check'} <= set(phases)
+    assert phases['baseline']['files'] > 50
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from fic_cli import main
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    """Run the command line on a data folder in tmp_path, returns the exit code and what it printed."""
+    monkeypatch.delenv('FIC_SEAL_KEY', raising=False)
+    monkeypatch.delenv('FIC_DATA_DIR', raising=False)
+    data_dir = str(tmp_path / "data")
+
+    def run(capsys, *argv):
+        code = main(['--data-dir', data_dir, *argv])
+        return code, capsys.readouterr().out
+
+    return run
+
+
+def test_check_exit_codes(cli, folder, capsys):
+    code, output = cli(capsys, 'baseline', 'add', str(folder))
+    assert (code, output.splitlines()[-1]) == (0, "Added 3 file(s).")
+    assert cli(capsys, 'check')[0] == 0
+
+    (folder / "a.txt").write_text("changed\n")
+    code, output = cli(capsys, 'check')
+
+    assert code == 1
+    assert output.startswith(f"CHANGED\n{folder / 'a.txt'}\n")
+    assert "1 changed, 0 removed, 0 added, 0 renamed, 2 unchanged" in output
+
+
+def test_check_json(cli, folder, capsys):
+    cli(capsys, 'baseline', 'add', '--exclude', 'c.txt', str(folder))
+    (folder / "b.txt").unlink()
+    (folder / "d.txt").write_text("new\n")
+
+    code, output = cli(capsys, 'check', '--json', '--show-unchanged')
+    report = json.loads(output)
+
+    assert code == 1
+    assert report['removed'] == [str(folder / "b.txt")]
+    assert report['added'] == [str(folder / "d.txt")]
+    assert report['not_changed'] == [str(folder / "a.txt")]
+
+
+def test_accept_then_check_is_clean(cli, folder, capsys):
+    cli(capsys, 'baseline', 'add', str(folder))
+    (folder / "a.txt").write_text("changed\n")
+    (folder / "c.txt").unlink()
+
+    assert cli(capsys, 'accept')[0] == 2
+    code, output = cli(capsys, 'accept', str(folder / "a.txt"))
+    assert (code, output) == (0, "Accepted 1 change(s), 0 removal(s), 0 addition(s) and 0 rename(s).\n")
+    assert cli(capsys, 'check')[0] == 1
+    assert cli(capsys, 'accept', '--all')[0] == 0
+    assert cli(capsys, 'check')[0] == 0
+
+
+def test_export(cli, folder, tmp_path, capsys):
+    cli(capsys, 'baseline', 'add', str(folder))
+    json_path = tmp_path / "export.json"
+
+    assert cli(capsys, 'export', str(json_path))[0] == 0
+    assert sorted(json.loads(json_path.read_text())) == [str(folder / name) for name in ("a.txt", "b.txt", "c.txt")]
+
+
+def test_core_and_cli_import_without_tk():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, fic_cli; sys.exit('tkinter' in sys.modules)"
+
+    assert subprocess.run([sys.executable, '-c', code], cwd=root).returncode == 0
@@ -0,0 +1,330 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+import fic_core
+from fic_core import SCAN_ADDED, SCAN_CHANGED, SCAN_NOT_CHANGED, SCAN_REMOVED, SCAN_RENAMED
+from metrics import METRICS
+
+
+@pytest.fixture
+def baselined(make_checker, folder):
+    """A checker with the three files of folder in its baseline, and their baseline keys."""
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    paths = {name: checker.normalise_file_path(str(folder / name)) for name in ("a.txt", "b.txt", "c.txt")}
+    return checker, paths
+
+
+def count_hashed(checker, monkeypatch):
+    """Count the files the checker's hash engine reads."""
+    hashed = []
+    hash_files = checker.hash_engine.hash_files
+
+    def counting(file_paths, hash_algorithm=None):
+        file_paths = list(file_paths)
+        hashed.extend(file_paths)
+        return hash_files(file_paths, hash_algorithm)
+
+    monkeypatch.setattr(checker.hash_engine, 'hash_files', counting)
+    return hashed
+
+
+def test_records_keep_the_stat_they_were_hashed_with(baselined, folder):
+    checker, paths = baselined
+    stat_result = os.stat(folder / "a.txt")
+
+    record = checker.baseline_hashes[paths["a.txt"]]
+
+    assert record['size'] == stat_result.st_size
+    assert record['mtime_ns'] == stat_result.st_mtime_ns
+    assert record['inode'] == stat_result.st_ino
+    assert record['algorithm'] == 'sha256'
+
+
+def test_quick_check_skips_unchanged_files(baselined, folder, monkeypatch):
+    checker, paths = baselined
+    (folder / "b.txt").write_text("changed\n")
+    hashed = count_hashed(checker, monkeypatch)
+
+    results = checker.scan_results(quick=True)
+
+    assert hashed == [paths["b.txt"]]
+    assert results[SCAN_CHANGED] == [paths["b.txt"]]
+    assert sorted(results[SCAN_NOT_CHANGED]) == [paths["a.txt"], paths["c.txt"]]
+
+
+def test_paranoid_sweep_rehashes_what_the_quick_check_trusts(baselined, monkeypatch):
+    checker, paths = baselined
+    #a record whose stat still matches but whose digest does not, only a rehash can tell
+    forged = {**checker.baseline_hashes[paths["a.txt"]], 'hash': "0" * 64}
+    checker.save_baseline_records({paths["a.txt"]: forged})
+
+    assert checker.scan_results(quick=True)[SCAN_CHANGED] == []
+    hashed = count_hashed(checker, monkeypatch)
+    assert checker.scan_results(quick=False)[SCAN_CHANGED] == [paths["a.txt"]]
+    assert sorted(hashed) == sorted(paths.values())
+
+
+def test_touched_file_is_refreshed_not_reported(baselined, folder):
+    checker, paths = baselined
+    os.utime(folder / "c.txt", ns=(1, 1))
+
+    assert checker.scan_results(quick=True)[SCAN_CHANGED] == []
+    assert checker.baseline_hashes[paths["c.txt"]]['mtime_ns'] == 1
+    assert checker.baseline_store.get(paths["c.txt"])['mtime_ns'] == 1
+
+
+def test_every_nth_quick_check_is_a_paranoid_sweep(make_checker):
+    checker = make_checker(paranoid_every=3)
+
+    assert [checker.use_quick_check(True) for _ in range(5)] == [True, True, True, False, True]
+    assert checker.use_quick_check(False) is False
+    #the counter lives in the store
+    assert make_checker().quick_checks_since_full == 0
+
+
+def test_missing_and_new_files(baselined, folder):
+    checker, paths = baselined
+    (folder / "a.txt").unlink()
+    (folder / "d.txt").write_text("new\n")
+
+    results = checker.scan_results(quick=True)
+
+    assert results[SCAN_REMOVED] == [paths["a.txt"]]
+    assert results[SCAN_ADDED] == [checker.normalise_file_path(str(folder / "d.txt"))]
+
+
+def test_results_stream_while_the_scan_runs(baselined, monkeypatch):
+    checker, paths = baselined
+    monkeypatch.setattr(fic_core, 'SCAN_BATCH', 1)
+    hashed = count_hashed(checker, monkeypatch)
+
+    results = checker.iter_scan()
+    first = next(results)
+
+    assert first[0] == SCAN_NOT_CHANGED
+    assert hashed == [first[1]]
+    assert sorted([first[1]] + [file_path for _, file_path, _ in results]) == sorted(paths.values())
+
+
+def test_cancelled_scan_stops_early(baselined, folder, monkeypatch):
+    checker, paths = baselined
+    monkeypatch.setattr(fic_core, 'SCAN_BATCH', 1)
+    (folder / "d.txt").write_text("new\n")
+    cancel_event = threading.Event()
+
+    seen = []
+    for status, file_path, _ in checker.iter_scan(cancel_event=cancel_event):
+        seen.append(file_path)
+        cancel_event.set()
+
+    assert len(seen) == 1
+    #the added file is only reported by a scan that ran to the end
+    assert checker.scan_results()[SCAN_ADDED] == [checker.normalise_file_path(str(folder / "d.txt"))]
+
+
+def hashed_with(checker, monkeypatch):
+    """Record the (algorithm(s), file path) pairs the checker's hash engine is asked for."""
+    requests = []
+    hash_files = checker.hash_engine.hash_files
+
+    def recording(file_paths, hash_algorithm=None):
+        file_paths = list(file_paths)
+        requests.extend((hash_algorithm, file_path) for file_path in file_paths)
+        return hash_files(file_paths, hash_algorithm)
+
+    monkeypatch.setattr(checker.hash_engine, 'hash_files', recording)
+    return requests
+
+
+def test_records_keep_their_algorithm(make_checker, folder):
+    make_checker(hash_algorithm='blake2b').add_folder_to_baseline(str(folder))
+    checker = make_checker(hash_algorithm='sha256')
+    a_path = checker.normalise_file_path(str(folder / "a.txt"))
+    (folder / "d.txt").write_text("new\n")
+
+    results = checker.scan_results()
+    checker.accept_changes(*checker.select_changes(results))
+
+    assert results[SCAN_CHANGED] == []
+    assert checker.baseline_hashes[a_path]['algorithm'] == 'blake2b'
+    assert checker.baseline_hashes[a_path]['hash'] == hashlib.blake2b((folder / "a.txt").read_bytes()).hexdigest()
+    assert checker.baseline_hashes[checker.normalise_file_path(str(folder / "d.txt"))]['algorithm'] == 'sha256'
+
+
+def test_only_cryptographic_main_algorithms(make_checker):
+    with pytest.raises(ValueError):
+        make_checker(hash_algorithm='md5')
+    with pytest.raises(ValueError):
+        make_checker(prefilter_algorithm='sha257')
+
+
+def test_prefilter_confirms_mismatches_with_the_main_hash(make_checker, folder, monkeypatch):
+    checker = make_checker(prefilter_algorithm='md5')
+    checker.add_folder_to_baseline(str(folder))
+    paths = {name: checker.normalise_file_path(str(folder / name)) for name in ("a.txt", "b.txt", "c.txt")}
+    assert checker.baseline_hashes[paths["a.txt"]]['fast_hash'] == hashlib.md5((folder / "a.txt").read_bytes()).hexdigest()
+    #a stale fast hash has to be confirmed by the main hash, a changed file fails both
+    checker.save_baseline_records({paths["a.txt"]: {**checker.baseline_hashes[paths["a.txt"]], 'fast_hash': "0" * 32}})
+    (folder / "b.txt").write_text("changed\n")
+    requests = hashed_with(checker, monkeypatch)
+
+    results = checker.scan_results()
+
+    assert results[SCAN_CHANGED] == [paths["b.txt"]]
+    assert sorted(path for algorithm, path in requests if algorithm == 'md5') == sorted(paths.values())
+    assert sorted(path for algorithm, path in requests if algorithm == ('sha256', 'md5')) == [paths["a.txt"], paths["b.txt"]]
+    #the confirmed record gets its fast hash back
+    assert checker.baseline_hashes[paths["a.txt"]]['fast_hash'] == hashlib.md5((folder / "a.txt").read_bytes()).hexdigest()
+
+
+def test_accept_takes_the_digests_of_the_scan(baselined, folder, monkeypatch):
+    checker, paths = baselined
+    (folder / "a.txt").write_text("changed\n")
+    (folder / "b.txt").write_text("changed\n")
+    results = checker.scan_results()
+    #changed again after the scan, its digest is out of date
+    (folder / "b.txt").write_text("changed twice, and longer\n")
+    hashed = count_hashed(checker, monkeypatch)
+    reused = METRICS.value('accept_reused_digests')
+
+    assert checker.accept_changes(*checker.select_changes(results)) == (2, 0, 0, 0)
+
+    assert hashed == [paths["b.txt"]]
+    assert METRICS.value('accept_reused_digests') - reused == 1
+    for name in ("a.txt", "b.txt"):
+        assert checker.baseline_hashes[paths[name]]['hash'] == hashlib.sha256((folder / name).read_bytes()).hexdigest()
+    assert checker.scan_records == {}
+
+
+def test_moved_file_is_a_rename(baselined, folder):
+    checker, paths = baselined
+    (folder / "sub").mkdir()
+    os.rename(folder / "a.txt", folder / "sub" / "a.txt")
+    new_path = checker.normalise_file_path(str(folder / "sub" / "a.txt"))
+
+    results = checker.scan_results()
+
+    assert (results[SCAN_RENAMED], results[SCAN_REMOVED], results[SCAN_ADDED]) == ([new_path], [], [])
+    assert checker.renamed_files == {new_path: paths["a.txt"]}
+    assert checker.accept_changes(*checker.select_changes(results)) == (0, 0, 0, 1)
+    assert paths["a.txt"] not in checker.baseline_hashes
+    assert checker.paths_with_hash(checker.baseline_hashes[new_path]['hash']) == [new_path]
+    assert checker.scan_results()[SCAN_RENAMED] == []
+
+
+def test_a_changed_file_is_no_rename(baselined, folder):
+    checker, paths = baselined
+    (folder / "a.txt").unlink()
+    (folder / "d.txt").write_text("other contents\n")
+
+    results = checker.scan_results()
+
+    assert results[SCAN_RENAMED] == []
+    assert results[SCAN_REMOVED] == [paths["a.txt"]]
+
+
+def test_identical_copies_pair_by_name(make_checker, tmp_path):
+    old = tmp_path / "old"
+    old.mkdir()
+    for name in ("a.txt", "b.txt"):
+        (old / name).write_text("same\n")
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(tmp_path))
+    new = tmp_path / "new"
+    new.mkdir()
+    os.rename(old / "b.txt", new / "b.txt")
+    (old / "a.txt").unlink()
+
+    results = checker.scan_results()
+
+    assert checker.renamed_files == {checker.normalise_file_path(str(new / "b.txt")): checker.normalise_file_path(str(old / "b.txt"))}
+    assert results[SCAN_REMOVED] == [checker.normalise_file_path(str(old / "a.txt"))]
+
+
+@pytest.mark.skipif(not hasattr(os, 'link'), reason="needs hardlinks")
+def test_hardlinks_are_hashed_once(make_checker, tmp_path, monkeypatch):
+    folder = tmp_path / "links"
+    folder.mkdir()
+    (folder / "a").write_text("shared\n")
+    for name in ("b", "c"):
+        os.link(folder / "a", folder / name)
+    checker = make_checker()
+    hashed = count_hashed(checker, monkeypatch)
+
+    assert checker.add_folder_to_baseline(str(folder)) == 3
+    assert len(hashed) == 1
+    assert checker.hardlinks_skipped == 2
+    assert len({checker.baseline_hashes[path]['hash'] for path in checker.get_files_to_check()}) == 1
+
+    hashed.clear()
+    assert checker.scan_results()[SCAN_NOT_CHANGED] != []
+    assert len(hashed) == 1
+
+
+def test_byte_budget_slices_cover_the_baseline(baselined, folder, monkeypatch):
+    checker, paths = baselined
+    (folder / "c.txt").write_text("changed, and now the biggest file\n")
+    hashed = count_hashed(checker, monkeypatch)
+
+    first = checker.scan_results(max_bytes=1)
+    #smallest files first, at least one file per scan
+    assert len(hashed) == 1 and hashed != [paths["c.txt"]]
+    assert checker.pending_files == 2
+    assert first[SCAN_NOT_CHANGED] == hashed
+
+    sliced = hashed[0]
+    hashed.clear()
+    second = checker.scan_results(max_bytes=10 ** 6)
+    assert sliced not in hashed and len(hashed) == 2
+    assert checker.pending_files == 0
+    #the sliced scans together report every file, the first slice from the checkpoint
+    assert second[SCAN_CHANGED] == [paths["c.txt"]]
+    assert sorted(second[SCAN_NOT_CHANGED]) == [paths["a.txt"], paths["b.txt"]]
+    assert checker.baseline_store.load_scan_checkpoint() == {}
+
+
+def test_time_budget_hashes_at_least_one_file(baselined, monkeypatch):
+    checker, paths = baselined
+    monkeypatch.setattr(fic_core, 'SCAN_BATCH', 1)
+    hashed = count_hashed(checker, monkeypatch)
+
+    checker.scan_results(max_seconds=0)
+
+    assert len(hashed) == 1
+    assert checker.pending_files == 2
+
+
+def test_checkpoint_survives_a_restart(baselined, make_checker, monkeypatch):
+    checker, paths = baselined
+    sliced = checker.scan_results(max_bytes=1)[SCAN_NOT_CHANGED]
+    checker.close()
+
+    restarted = make_checker()
+    hashed = count_hashed(restarted, monkeypatch)
+    results = restarted.scan_results()
+
+    assert sorted(hashed + sliced) == sorted(paths.values())
+    assert sorted(results[SCAN_NOT_CHANGED]) == sorted(paths.values())
+
+
+def test_checkpoint_is_not_trusted_for_a_changed_file(baselined):
+    checker, paths = baselined
+    [sliced] = checker.scan_results(max_bytes=1)[SCAN_NOT_CHANGED]
+    with open(sliced, 'w') as f:
+        f.write("changed after the first slice\n")
+
+    assert checker.scan_results()[SCAN_CHANGED] == [sliced]
+
+
+def test_fresh_scan_ignores_the_checkpoint(baselined, monkeypatch):
+    checker, paths = baselined
+    checker.scan_results(max_bytes=1)
+    hashed = count_hashed(checker, monkeypatch)
+
+    checker.scan_results(resume=False)
+
+    assert sorted(hashed) == sorted(paths.values())
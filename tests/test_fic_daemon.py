@@ -0,0 +1,302 @@
+import asyncio
+import json
+import os
+import socket
+
+import pytest
+
+#the daemon runs the real time monitor, which needs both
+pytest.importorskip('watchdog')
+pytest.importorskip('plyer')
+
+from fic_core import SCAN_ADDED, SCAN_CHANGED
+from fic_daemon import ApiError, FicDaemon, run_daemon, socket_in_use
+
+
+def run(coroutine_function):
+    """Run coroutine_function(daemon) on a fresh loop, the way FicDaemon.serve sets the daemon up."""
+    async def main(daemon):
+        daemon.loop = asyncio.get_running_loop()
+        daemon.busy = asyncio.Lock()
+        daemon.started = daemon.loop.time()
+        return await coroutine_function(daemon)
+    return main
+
+
+@pytest.fixture
+def daemon(make_checker, folder):
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    return FicDaemon(checker)
+
+
+async def request(daemon, method, path, body=None):
+    try:
+        return await daemon.handle_request(method, path, body or {})
+    except ApiError as e:
+        return e.status, {'error': str(e)}
+
+
+async def finish_scan(daemon, body=None):
+    status, result = await request(daemon, 'POST', '/scan', body)
+    assert (status, result) == (202, {'started': True})
+    await daemon.scan_task
+    return await request(daemon, 'GET', '/results')
+
+
+@pytest.mark.parametrize('method, path, status', [
+    ('GET', '/nothing', 404),
+    ('POST', '/status', 405),
+    ('GET', '/scan', 405),
+    ('GET', '/accept', 405),
+    ('GET', '/results', 409),
+])
+def test_routing(daemon, method, path, status):
+    async def check(daemon):
+        return await request(daemon, method, path)
+
+    assert asyncio.run(run(check)(daemon))[0] == status
+
+
+@pytest.mark.parametrize('body', [
+    {'quick': "yes"},
+    {'fresh': 1},
+    {'max_mb': "10"},
+    {'max_mb': True},
+    {'max_mb': 0},
+    {'max_minutes': -1},
+    {'max_minutes': [5]},
+])
+def test_scan_options_are_validated(daemon, body):
+    async def check(daemon):
+        return await request(daemon, 'POST', '/scan', body)
+
+    status, result = asyncio.run(run(check)(daemon))
+
+    assert status == 400
+    assert 'error' in result
+    assert daemon.scan_task is None
+
+
+def test_scan_and_results(daemon, folder):
+    (folder / "a.txt").write_text("changed\n")
+    (folder / "d.txt").write_text("new\n")
+
+    async def check(daemon):
+        return await finish_scan(daemon, {'quick': False, 'max_mb': 100, 'max_minutes': 0.5})
+
+    status, report = asyncio.run(run(check)(daemon))
+
+    checker = daemon.checker
+    assert status == 200
+    assert report['changed'] == [checker.normalise_file_path(str(folder / "a.txt"))]
+    assert report['added'] == [checker.normalise_file_path(str(folder / "d.txt"))]
+    assert daemon.last_scan['counts'][SCAN_CHANGED] == 1
+    assert daemon.last_scan['counts'][SCAN_ADDED] == 1
+
+
+def test_status(daemon, folder):
+    async def check(daemon):
+        return await request(daemon, 'GET', '/status')
+
+    status, result = asyncio.run(run(check)(daemon))
+
+    assert status == 200
+    assert result['state'] == 'idle'
+    assert result['baseline_files'] == 3
+    assert result['added_folders'] == [daemon.checker.normalise_folder_path(str(folder))]
+    assert result['sealed'] is False
+
+
+def test_accept_selected_paths(daemon, folder):
+    (folder / "a.txt").write_text("changed\n")
+    (folder / "b.txt").write_text("changed too\n")
+    changed_a = daemon.checker.normalise_file_path(str(folder / "a.txt"))
+    changed_b = daemon.checker.normalise_file_path(str(folder / "b.txt"))
+
+    async def check(daemon):
+        await finish_scan(daemon, {'quick': False})
+        accepted = await request(daemon, 'POST', '/accept', {'paths': [changed_a]})
+        return accepted, await request(daemon, 'GET', '/results')
+
+    (status, counts), (_, report) = asyncio.run(run(check)(daemon))
+
+    assert status == 200
+    assert counts == {'changed': 1, 'removed': 0, 'added': 0, 'renamed': 0}
+    assert report['changed'] == [changed_b]
+
+
+def test_accept_all(daemon, folder):
+    (folder / "c.txt").unlink()
+
+    async def check(daemon):
+        await finish_scan(daemon)
+        accepted = await request(daemon, 'POST', '/accept', {'all': True})
+        return accepted, await finish_scan(daemon)
+
+    (status, counts), (_, report) = asyncio.run(run(check)(daemon))
+
+    assert status == 200
+    assert counts['removed'] == 1
+    assert report['removed'] == []
+
+
+@pytest.mark.parametrize('body, status', [
+    ({}, 400),
+    ({'paths': "/a"}, 400),
+    ({'paths': ["/a"], 'patterns': "*.log"}, 400),
+])
+def test_accept_is_validated(daemon, body, status):
+    async def check(daemon):
+        await finish_scan(daemon)
+        return await request(daemon, 'POST', '/accept', body)
+
+    assert asyncio.run(run(check)(daemon))[0] == status
+
+
+def test_accept_needs_a_finished_scan(daemon):
+    async def check(daemon):
+        return await request(daemon, 'POST', '/accept', {'all': True})
+
+    assert asyncio.run(run(check)(daemon))[0] == 409
+
+
+def test_one_scan_at_a_time(daemon):
+    async def check(daemon):
+        first = await request(daemon, 'POST', '/scan')
+        second = await request(daemon, 'POST', '/scan')
+        await daemon.scan_task
+        return first, second
+
+    first, second = asyncio.run(run(check)(daemon))
+
+    assert first[0] == 202
+    assert second[0] == 409
+
+
+def test_events_stream_scan_results(daemon, folder):
+    (folder / "a.txt").write_text("changed\n")
+
+    async def check(daemon):
+        status, events = await request(daemon, 'GET', '/events')
+        received = []
+
+        async def read():
+            async for event in events:
+                received.append(event)
+                if event['event'] == 'scan_finished':
+                    break
+
+        reader = asyncio.ensure_future(read())
+        #the subscription starts with the first step of the stream
+        await asyncio.sleep(0)
+        await finish_scan(daemon, {'quick': False})
+        await asyncio.wait_for(reader, 10)
+        return status, received
+
+    status, received = asyncio.run(run(check)(daemon))
+
+    assert status == 200
+    assert [event['event'] for event in received] == ['scan_started', 'scan_result', 'scan_finished']
+    assert received[1]['path'] == daemon.checker.normalise_file_path(str(folder / "a.txt"))
+
+
+class BufferWriter:
+    """The writer side of a client connection, collecting what the daemon answers."""
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def send(daemon, data):
+    """Hand one raw HTTP request to handle_client, returns the status line and the JSON body of the answer."""
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    writer = BufferWriter()
+    await daemon.handle_client(reader, writer)
+    head, _, body = writer.data.partition(b"\r\n\r\n")
+    return head.split(b"\r\n")[0].decode('latin-1'), json.loads(body)
+
+
+JSON_POST = b"POST /scan HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+
+
+def test_http_requests(daemon):
+    body = json.dumps({'quick': "no"}).encode('utf-8')
+
+    async def check(daemon):
+        return [await send(daemon, JSON_POST % len(body) + body),
+                await send(daemon, JSON_POST % 3 + b"{x}"),
+                await send(daemon, JSON_POST % 2 + b"[]"),
+                await send(daemon, b"GET /status?verbose HTTP/1.1\r\n\r\n")]
+
+    bad_option, bad_json, not_object, status = asyncio.run(run(check)(daemon))
+
+    assert bad_option == ("HTTP/1.1 400 Bad Request", {'error': "\"quick\" must be true or false."})
+    assert bad_json[0] == "HTTP/1.1 400 Bad Request"
+    assert not_object[0] == "HTTP/1.1 400 Bad Request"
+    assert status[0] == "HTTP/1.1 200 OK"
+    assert status[1]['state'] == 'idle'
+
+
+def test_web_pages_are_refused(daemon):
+    body = b'{"quick": true}'
+
+    async def check(daemon):
+        return [await send(daemon, b"POST /scan HTTP/1.1\r\nContent-Type: text/plain\r\nContent-Length: %d\r\n\r\n"
+                           % len(body) + body),
+                await send(daemon, b"POST /cancel HTTP/1.1\r\n\r\n"),
+                await send(daemon, b"GET /status HTTP/1.1\r\nOrigin: http://example.com\r\n\r\n"),
+                await send(daemon, b"POST /cancel HTTP/1.1\r\nContent-Type: application/json; charset=utf-8\r\n\r\n")]
+
+    form, no_type, origin, cancel = asyncio.run(run(check)(daemon))
+
+    assert form[0] == "HTTP/1.1 415 Unsupported Media Type"
+    assert no_type[0] == "HTTP/1.1 415 Unsupported Media Type"
+    assert origin[0] == "HTTP/1.1 403 Forbidden"
+    assert cancel[0] == "HTTP/1.1 200 OK"
+    assert daemon.scan_task is None
+
+
+def test_token_is_required(daemon):
+    daemon.token = "secret"
+
+    async def check(daemon):
+        return [await send(daemon, b"GET /status HTTP/1.1\r\n\r\n"),
+                await send(daemon, b"GET /status HTTP/1.1\r\nAuthorization: Bearer wrong\r\n\r\n"),
+                await send(daemon, b"GET /status HTTP/1.1\r\nAuthorization: Bearer secret\r\n\r\n")]
+
+    missing, wrong, right = asyncio.run(run(check)(daemon))
+
+    assert missing == ("HTTP/1.1 401 Unauthorized", {'error': "Missing or wrong token."})
+    assert wrong[0] == "HTTP/1.1 401 Unauthorized"
+    assert right[0] == "HTTP/1.1 200 OK"
+
+
+def test_port_needs_a_token(daemon):
+    with pytest.raises(ValueError):
+        run_daemon(daemon.checker, port=0)
+
+
+def test_socket_in_use(tmp_path):
+    socket_path = str(tmp_path / "fic.sock")
+    assert not socket_in_use(socket_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)
+        assert socket_in_use(socket_path)
+
+    #the socket file a killed daemon leaves behind
+    assert os.path.exists(socket_path)
+    assert not socket_in_use(socket_path)
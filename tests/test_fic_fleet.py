@@ -0,0 +1,189 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import fic_fleet
+from fic_core import SCAN_CHANGED
+from fic_fleet import FleetAgent, FleetCollector, FleetError, LocalTransport, decode_batch, encode_batch
+
+
+class RecordingTransport(LocalTransport):
+    """LocalTransport that remembers the size of every batch it sent."""
+
+    def __init__(self, collector):
+        super().__init__(collector)
+        self.batches = []
+
+    def send(self, reports):
+        self.batches.append(len(reports))
+        return super().send(reports)
+
+
+class DownTransport:
+    def send(self, reports):
+        raise FleetError("The collector is down")
+
+
+def spool_reports(agent, count):
+    results = agent.checker.scan_results(quick=True)
+    for _ in range(count):
+        agent.spool(agent.build_report(results, 0, True))
+
+
+def test_report_is_a_delta_with_the_new_digests(make_checker, folder):
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    (folder / "a.txt").write_text("changed\n")
+    collector = FleetCollector()
+    agent = FleetAgent(checker, LocalTransport(collector), host="web1")
+
+    report = agent.run_once(quick=False)
+
+    changed = checker.normalise_file_path(str(folder / "a.txt"))
+    assert report['counts'][SCAN_CHANGED] == 1
+    assert list(report['changed']) == [changed]
+    assert report['changed'][changed] == checker.scan_hashes[changed]
+    assert report['baseline_files'] == 3
+    assert collector.host("web1")['report']['seq'] == report['seq']
+    assert collector.fleet()['attention'] == ["web1"]
+    assert agent.outbox() == []
+
+
+def test_outbox_is_sent_in_batches(make_checker, monkeypatch):
+    monkeypatch.setattr(fic_fleet, 'MAX_BATCH_REPORTS', 3)
+    collector = FleetCollector()
+    transport = RecordingTransport(collector)
+    agent = FleetAgent(make_checker(), transport, host="web1")
+    spool_reports(agent, 7)
+
+    assert agent.flush() == 7
+
+    assert transport.batches == [3, 3, 1]
+    assert agent.outbox() == []
+    assert collector.host("web1")['seq'] == 7
+    assert collector.host("web1")['reports'] == 7
+
+
+def test_undelivered_reports_stay_in_the_outbox(make_checker):
+    agent = FleetAgent(make_checker(), DownTransport(), host="web1")
+    agent.run_once()
+    agent.run_once()
+    assert len(agent.outbox()) == 2
+
+    collector = FleetCollector()
+    agent.transport = LocalTransport(collector)
+    report = agent.run_once()
+
+    assert agent.outbox() == []
+    assert collector.host("web1")['reports'] == 3
+    assert collector.host("web1")['seq'] == report['seq'] == 3
+
+
+def test_outbox_drops_the_oldest_reports_beyond_its_cap(make_checker, monkeypatch):
+    monkeypatch.setattr(fic_fleet, 'MAX_OUTBOX_REPORTS', 4)
+    agent = FleetAgent(make_checker(), DownTransport(), host="web1")
+    spool_reports(agent, 6)
+
+    spooled = agent.outbox()
+    assert [os.path.basename(report_path) for report_path in spooled] == \
+           [f"{seq:012d}.json.gz" for seq in range(3, 7)]
+    with gzip.open(spooled[0], 'rt', encoding='utf-8') as f:
+        assert json.load(f)['seq'] == 3
+
+
+def test_unreadable_reports_are_dropped(make_checker):
+    collector = FleetCollector()
+    agent = FleetAgent(make_checker(), LocalTransport(collector), host="web1")
+    spool_reports(agent, 1)
+    with open(os.path.join(agent.outbox_dir, f"{2:012d}.json.gz"), 'wb') as f:
+        f.write(b"not gzip")
+
+    assert agent.flush() == 1
+    assert agent.outbox() == []
+
+
+def test_collector_drops_duplicate_reports():
+    collector = FleetCollector()
+    reports = [{'host': "web1", 'agent_id': "a", 'seq': seq} for seq in (1, 2)]
+
+    assert collector.receive(encode_batch(reports), 'gzip') == {'accepted': 2, 'duplicates': 0}
+    #the answer was lost and the agent sends the batch again
+    assert collector.receive(encode_batch(reports), 'gzip') == {'accepted': 0, 'duplicates': 2}
+    assert collector.receive(encode_batch(reports[:1] + [{'host': "web1", 'agent_id': "a", 'seq': 3}]), 'gzip') == \
+           {'accepted': 1, 'duplicates': 1}
+    assert collector.host("web1")['reports'] == 3
+
+
+def test_collector_keeps_the_newest_report_of_a_batch():
+    collector = FleetCollector()
+    reports = [{'host': "web1", 'agent_id': "a", 'seq': seq, 'counts': {'changed': seq}} for seq in (3, 1, 2)]
+
+    collector.receive(encode_batch(reports), 'gzip')
+
+    assert collector.host("web1")['seq'] == 3
+    assert collector.fleet()['totals']['changed'] == 3
+
+
+def test_collector_takes_a_new_agent_of_a_host_starting_over():
+    collector = FleetCollector()
+    collector.receive(encode_batch([{'host': "web1", 'agent_id': "old", 'seq': 5}]), 'gzip')
+
+    answer = collector.receive(encode_batch([{'host': "web1", 'agent_id': "new", 'seq': 1}]), 'gzip')
+
+    assert answer == {'accepted': 1, 'duplicates': 0}
+    assert collector.host("web1")['agent_id'] == "new"
+
+
+def test_agent_numbering_survives_a_restart(make_checker):
+    collector = FleetCollector()
+    agent = FleetAgent(make_checker(), LocalTransport(collector), host="web1")
+    agent.run_once()
+    restarted = FleetAgent(agent.checker, LocalTransport(collector), host="web1")
+
+    assert restarted.agent_id == agent.agent_id
+    assert restarted.run_once()['seq'] == 2
+    assert collector.host("web1")['reports'] == 2
+
+
+def test_collector_keeps_its_state(tmp_path):
+    state_path = str(tmp_path / "fleet.json")
+    FleetCollector(state_path).receive(encode_batch([{'host': "web1", 'agent_id': "a", 'seq': 1}]), 'gzip')
+
+    collector = FleetCollector(state_path)
+
+    assert collector.receive(encode_batch([{'host': "web1", 'agent_id': "a", 'seq': 1}]), 'gzip')['duplicates'] == 1
+
+
+@pytest.mark.parametrize('batch', [
+    {},
+    {'reports': {}},
+    {'reports': [{'host': "web1"}]},
+    {'reports': [{'seq': 1}]},
+    {'reports': ["web1"]},
+])
+def test_bad_batches_are_refused(batch):
+    with pytest.raises(ValueError):
+        decode_batch(json.dumps(batch).encode('utf-8'))
+
+
+def test_refused_batch_is_a_fleet_error():
+    with pytest.raises(FleetError):
+        LocalTransport(FleetCollector()).send([{'host': "web1"}])
+
+
+def test_oversized_batches_are_refused(monkeypatch):
+    monkeypatch.setattr(fic_fleet, 'MAX_BATCH_BYTES', 1000)
+    body = encode_batch([{'host': "web1", 'seq': 1, 'padding': "x" * 2000}])
+
+    with pytest.raises(ValueError):
+        decode_batch(body, 'gzip')
+
+
+def test_collector_token():
+    collector = FleetCollector(token="secret")
+
+    assert collector.authorized("Bearer secret")
+    assert not collector.authorized("Bearer other")
+    assert not collector.authorized(None)
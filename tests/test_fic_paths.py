@@ -0,0 +1,96 @@
+import os
+import unicodedata
+
+import pytest
+
+from fic_paths import DEFAULT_PATH_RULES, PathCanonicalizer, path_rules
+
+NFC_NAME = unicodedata.normalize('NFC', "café.txt")
+NFD_NAME = unicodedata.normalize('NFD', "café.txt")
+
+
+@pytest.fixture
+def files(tmp_path):
+    """A folder holding Report.TXT and café.txt, the latter spelled in NFD as some tools write it."""
+    folder = tmp_path / "files"
+    folder.mkdir()
+    (folder / "Report.TXT").write_text("report\n")
+    (folder / NFD_NAME).write_text("café\n")
+    return folder
+
+
+def test_platform_rules():
+    assert path_rules('linux') == DEFAULT_PATH_RULES == (True, None)
+    assert path_rules('win32') == (False, None)
+    assert path_rules('darwin') == (False, 'NFC')
+
+
+def test_case_sensitive_paths_are_kept_as_given(files):
+    canonicalizer = PathCanonicalizer('linux')
+    folder = os.path.realpath(files)
+
+    assert canonicalizer.canonical(str(files / "report.txt")) == os.path.join(folder, "report.txt")
+    assert canonicalizer.canonical(str(files / NFD_NAME)) == os.path.join(folder, NFD_NAME)
+    assert canonicalizer.key("/data/Report.TXT") != canonicalizer.key("/data/report.txt")
+
+
+def test_case_insensitive_paths_take_the_listed_case(files):
+    canonicalizer = PathCanonicalizer('win32')
+    folder = os.path.realpath(files)
+
+    assert canonicalizer.canonical(str(files / "report.txt")) == os.path.join(folder, "Report.TXT")
+    assert canonicalizer.canonical(str(files / "REPORT.txt")) == os.path.join(folder, "Report.TXT")
+    #a file that is not there keeps the case it was given in
+    assert canonicalizer.canonical(str(files / "New.txt")) == os.path.join(folder, "New.txt")
+    assert canonicalizer.key("/data/Report.TXT") == canonicalizer.key("/data/report.txt")
+
+
+def test_nfc_platforms_take_one_spelling_of_a_name(files):
+    canonicalizer = PathCanonicalizer('darwin')
+    folder = os.path.realpath(files)
+
+    #the NFD name on disk, asked for in either spelling and in another case, is the same NFC key
+    assert canonicalizer.canonical(str(files / NFD_NAME)) == os.path.join(folder, NFC_NAME)
+    assert canonicalizer.canonical(str(files / NFC_NAME)) == os.path.join(folder, NFC_NAME)
+    assert canonicalizer.canonical(str(files / NFC_NAME.upper())) == os.path.join(folder, NFC_NAME)
+    #the directories are normalised as well
+    nfd_folder = files / unicodedata.normalize('NFD', "dossier é")
+    nfd_folder.mkdir()
+    assert canonicalizer.canonical(str(nfd_folder / "a")) == \
+           os.path.join(folder, unicodedata.normalize('NFC', "dossier é"), "a")
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason="needs symlinks")
+def test_symlinked_folders_are_resolved_not_files(files, tmp_path):
+    os.symlink(files, tmp_path / "link")
+    os.symlink(files / "Report.TXT", files / "report-link")
+    folder = os.path.realpath(files)
+
+    assert PathCanonicalizer('linux').canonical(str(tmp_path / "link" / "Report.TXT")) == os.path.join(folder, "Report.TXT")
+    assert PathCanonicalizer('linux').canonical(str(files / "report-link")) == os.path.join(folder, "report-link")
+    assert PathCanonicalizer('linux', resolve_symlinks=False).canonical(str(tmp_path / "link" / "Report.TXT")) == \
+           os.path.join(os.path.abspath(tmp_path), "link", "Report.TXT")
+
+
+def test_relative_and_dotted_paths(files, monkeypatch):
+    canonicalizer = PathCanonicalizer('linux')
+    folder = os.path.realpath(files)
+    monkeypatch.chdir(files)
+
+    assert canonicalizer.canonical("Report.TXT") == os.path.join(folder, "Report.TXT")
+    assert canonicalizer.canonical(str(files / "sub" / ".." / "Report.TXT")) == os.path.join(folder, "Report.TXT")
+    assert canonicalizer.canonical(str(files) + os.sep) == folder
+    #relative directories depend on the working directory, they are not remembered
+    assert all(os.path.isabs(directory) for directory in canonicalizer.dirs)
+
+
+def test_listings_are_remembered_until_cleared(files):
+    canonicalizer = PathCanonicalizer('win32')
+    folder = os.path.realpath(files)
+    assert canonicalizer.canonical(str(files / "other.txt")) == os.path.join(folder, "other.txt")
+    (files / "Other.txt").write_text("other\n")
+
+    #the listing of the folder is the one taken before Other.txt was created
+    assert canonicalizer.canonical(str(files / "other.txt")) == os.path.join(folder, "other.txt")
+    canonicalizer.clear()
+    assert canonicalizer.canonical(str(files / "other.txt")) == os.path.join(folder, "Other.txt")
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from file_scanner import FolderScanner, ScanFilter
+from fic_core import SCAN_ADDED
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A folder with a sub folder, a node_modules folder, a log file and files of 1 and 100 bytes."""
+    root = tmp_path / "tree"
+    for sub in ("src", "node_modules/pkg"):
+        (root / sub).mkdir(parents=True)
+    (root / "small.txt").write_text("x")
+    (root / "src" / "big.py").write_text("y" * 100)
+    (root / "src" / "debug.log").write_text("log\n")
+    (root / "node_modules" / "pkg" / "index.js").write_text("js\n")
+    return root
+
+
+def listed(tree, scanner):
+    return sorted(os.path.relpath(file_path, tree) for file_path, _ in scanner.iter_files(str(tree)))
+
+
+def test_every_regular_file_is_listed_with_its_stat(tree):
+    scanner = FolderScanner()
+    files = dict(scanner.iter_files(str(tree)))
+
+    assert sorted(os.path.relpath(file_path, tree) for file_path in files) == \
+           ["node_modules/pkg/index.js", "small.txt", "src/big.py", "src/debug.log"]
+    assert files[str(tree / "src" / "big.py")].st_size == 100
+
+
+def test_excluded_folders_are_not_entered(tree):
+    assert listed(tree, FolderScanner(ScanFilter(exclude=['node_modules', '*.log']))) == ["small.txt", "src/big.py"]
+    assert listed(tree, FolderScanner(ScanFilter(exclude=[str(tree / "src") + "/*"]))) == \
+           ["node_modules/pkg/index.js", "small.txt"]
+
+
+def test_include_globs_and_size_limits(tree):
+    assert listed(tree, FolderScanner(ScanFilter(include=['*.py', '*.js']))) == ["node_modules/pkg/index.js", "src/big.py"]
+    assert listed(tree, FolderScanner(ScanFilter(min_size=2, max_size=50))) == ["node_modules/pkg/index.js", "src/debug.log"]
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason="needs symlinks")
+def test_symlinked_folders_are_not_followed(tree, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "secret").write_text("s\n")
+    os.symlink(outside, tree / "link")
+
+    assert "link/secret" not in listed(tree, FolderScanner())
+
+
+def test_filter_round_trip():
+    scan_filter = ScanFilter(['*.py'], ['*.log'], 1, 10)
+
+    assert ScanFilter.from_dict(scan_filter.to_dict()).signature() == scan_filter.signature()
+    assert ScanFilter.from_dict(None).signature() == ScanFilter().signature()
+
+
+def test_unchanged_folders_are_skipped(tree):
+    first = FolderScanner()
+    listed(tree, first)
+    assert first.listed_dirs == 4
+
+    second = FolderScanner(dir_states=first.new_dir_states)
+    assert listed(tree, second) == []
+    assert (second.listed_dirs, second.skipped_dirs) == (0, 4)
+
+    #a new file changes the mtime of its folder, only that folder is listed again
+    (tree / "src" / "new.txt").write_text("new\n")
+    third = FolderScanner(dir_states=second.new_dir_states)
+    assert listed(tree, third) == ["src/big.py", "src/debug.log", "src/new.txt"]
+    assert (third.listed_dirs, third.skipped_dirs) == (1, 3)
+
+
+def test_states_of_another_filter_are_not_trusted(tree):
+    first = FolderScanner()
+    listed(tree, first)
+
+    second = FolderScanner(ScanFilter(exclude=['*.log']), first.new_dir_states)
+
+    assert listed(tree, second) == ["node_modules/pkg/index.js", "small.txt", "src/big.py"]
+    assert second.skipped_dirs == 0
+
+
+def test_folders_with_unknown_files_are_listed_every_time(tree):
+    known = {str(tree / "small.txt")}
+    first = FolderScanner(is_known=known.__contains__)
+    listed(tree, first)
+
+    #node_modules only holds a folder
+    assert sorted(first.new_dir_states) == [str(tree), str(tree / "node_modules")]
+
+
+def test_added_files_are_reported_until_baselined(make_checker, folder):
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    (folder / "sub").mkdir()
+    (folder / "sub" / "d.txt").write_text("new\n")
+
+    assert checker.scan_results()[SCAN_ADDED] == [checker.normalise_file_path(str(folder / "sub" / "d.txt"))]
+    #still reported while it is not in the baseline
+    assert checker.scan_results()[SCAN_ADDED] == [checker.normalise_file_path(str(folder / "sub" / "d.txt"))]
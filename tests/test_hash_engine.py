@@ -0,0 +1,129 @@
+import hashlib
+
+import pytest
+
+import hash_engine
+from hash_engine import HashEngine, available_algorithms, compute_file_hash, compute_file_hashes, new_hasher
+
+
+@pytest.fixture
+def files(tmp_path):
+    """40 files of different sizes, one of them empty, mapped to their SHA-256."""
+    digests = {}
+    for i in range(40):
+        data = bytes([i % 256]) * (i * 997)
+        path = tmp_path / f"file_{i:02d}"
+        path.write_bytes(data)
+        digests[str(path)] = hashlib.sha256(data).hexdigest()
+    return digests
+
+
+@pytest.mark.parametrize('mode', HashEngine.MODES)
+def test_every_mode_gives_the_same_digests(files, mode):
+    engine = HashEngine(mode=mode, workers=2, batch_size=3)
+
+    assert dict(engine.hash_files(list(files))) == files
+
+
+def test_unreadable_files_hash_to_none(files, tmp_path):
+    missing = str(tmp_path / "missing")
+    engine = HashEngine(mode='thread', workers=2)
+
+    results = dict(engine.hash_files([missing, *files]))
+
+    assert results[missing] is None
+    assert compute_file_hash(missing) is None
+
+
+def test_hash_files_takes_a_generator(files):
+    engine = HashEngine(mode='thread', workers=3, batch_size=1)
+
+    assert dict(engine.hash_files(file_path for file_path in files)) == files
+
+
+def test_stopping_early_leaves_no_work_behind(files):
+    engine = HashEngine(mode='thread', workers=2, batch_size=1)
+    results = engine.hash_files(list(files))
+
+    first = next(results)
+    results.close()
+
+    assert first[1] == files[first[0]]
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        HashEngine(mode='gpu')
+
+
+def test_default_workers():
+    assert HashEngine(mode='serial').workers == 1
+    assert HashEngine(mode='thread').workers >= 1
+
+
+@pytest.mark.parametrize('mode', HashEngine.MODES)
+def test_add_folder_is_the_same_in_every_mode(make_checker, folder, tmp_path, mode):
+    checker = make_checker(data_dir=str(tmp_path / mode), hash_mode=mode, hash_workers=2)
+
+    assert checker.add_folder_to_baseline(str(folder)) == 3
+
+    for name in ("a.txt", "b.txt", "c.txt"):
+        file_path = checker.normalise_file_path(str(folder / name))
+        expected = hashlib.sha256((folder / name).read_bytes()).hexdigest()
+        assert checker.baseline_hashes[file_path]['hash'] == expected
+
+
+@pytest.mark.parametrize('algorithm', available_algorithms())
+def test_every_available_algorithm(tmp_path, algorithm):
+    path = tmp_path / "data"
+    path.write_bytes(b"x" * 100000)
+    expected = new_hasher(algorithm)
+    expected.update(b"x" * 100000)
+
+    assert compute_file_hash(str(path), algorithm) == expected.hexdigest()
+    if algorithm in hashlib.algorithms_available:
+        assert expected.hexdigest() == hashlib.new(algorithm, b"x" * 100000).hexdigest()
+
+
+def test_several_algorithms_in_one_read(tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"contents")
+
+    assert compute_file_hash(str(path), ('sha256', 'md5')) == \
+           (hashlib.sha256(b"contents").hexdigest(), hashlib.md5(b"contents").hexdigest())
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        new_hasher('sha257')
+
+
+@pytest.mark.parametrize('size', [0, 1, hash_engine.READ_BLOCK_SIZE - 1, hash_engine.READ_BLOCK_SIZE * 3 + 5])
+def test_read_strategies_give_the_same_digest(tmp_path, size):
+    data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+    path = tmp_path / "data"
+    path.write_bytes(data)
+
+    digests = {strategy: compute_file_hashes(str(path), ('sha256',), strategy) for strategy in hash_engine.READ_STRATEGIES}
+
+    assert set(digests.values()) == {(hashlib.sha256(data).hexdigest(),)}
+
+
+def test_mmap_above_the_threshold(tmp_path, monkeypatch):
+    data = b"y" * 10000
+    path = tmp_path / "data"
+    path.write_bytes(data)
+    #a lower threshold and view size so a small file takes the mmap path, in several views
+    monkeypatch.setattr(hash_engine, 'MMAP_THRESHOLD', 1024)
+    monkeypatch.setattr(hash_engine, 'MMAP_BLOCK_SIZE', 4096)
+    mapped = []
+    update_by_mmap = hash_engine._update_by_mmap
+    monkeypatch.setattr(hash_engine, '_update_by_mmap', lambda file, hash_funcs: mapped.append(file) or update_by_mmap(file, hash_funcs))
+
+    assert compute_file_hash(str(path)) == hashlib.sha256(data).hexdigest()
+    assert len(mapped) == 1
+
+
+def test_invalid_read_strategy(tmp_path):
+    with pytest.raises(ValueError):
+        compute_file_hashes(str(tmp_path), ('sha256',), 'direct')
@@ -0,0 +1,146 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from baseline_seal import HmacSigner, MerkleSeal
+from fic_cli import build_parser
+from fic_core import SCAN_CHANGED
+from hash_engine import HashEngine
+from merkle import ChunkResumeState, changed_ranges, chunk_count, compute_chunk_hashes, merkle_root
+from throttle import ScanThrottle
+
+CHUNK_SIZE = 1024
+
+
+@pytest.fixture
+def big_file(tmp_path):
+    """A file of 10 and a half chunks, every chunk of other bytes."""
+    path = tmp_path / "big"
+    path.write_bytes(b"".join(bytes([i]) * CHUNK_SIZE for i in range(10)) + b"z" * (CHUNK_SIZE // 2))
+    return path
+
+
+def leaves_of(path):
+    data = path.read_bytes()
+    return [hashlib.sha256(data[start:start + CHUNK_SIZE]).hexdigest() for start in range(0, len(data), CHUNK_SIZE)]
+
+
+@pytest.mark.parametrize('mode', HashEngine.MODES)
+def test_chunk_hashes_in_every_mode(big_file, mode):
+    engine = HashEngine(mode=mode, workers=2)
+
+    assert compute_chunk_hashes(str(big_file), CHUNK_SIZE, engine=engine) == leaves_of(big_file)
+
+
+def test_pending_chunks_are_bounded(big_file):
+    engine = HashEngine(mode='thread', workers=2)
+    submitted = []
+
+    def indices():
+        for index in range(11):
+            submitted.append(index)
+            yield index
+
+    results = engine.hash_chunks(str(big_file), indices(), CHUNK_SIZE)
+    next(results)
+
+    assert len(submitted) == engine.workers * 4
+    results.close()
+
+
+def test_throttle_admits_every_chunk(big_file, monkeypatch):
+    throttle = ScanThrottle(bytes_per_second=1024 ** 3)
+    admitted = []
+    monkeypatch.setattr(throttle, 'admit_bytes', admitted.append)
+    engine = HashEngine(mode='thread', workers=2, throttle=throttle)
+
+    compute_chunk_hashes(str(big_file), CHUNK_SIZE, engine=engine)
+
+    assert admitted == [CHUNK_SIZE] * 11
+
+
+def test_unreadable_file(tmp_path):
+    assert compute_chunk_hashes(str(tmp_path / "missing"), CHUNK_SIZE) is None
+
+
+def test_resume_hashes_only_the_missing_chunks(big_file, tmp_path):
+    state_dir = str(tmp_path / "state")
+    stat_result = big_file.stat()
+    leaves = leaves_of(big_file)
+    ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256').save(
+        {index: "0" * 64 for index in range(5)})
+
+    resumed = compute_chunk_hashes(str(big_file), CHUNK_SIZE, state_dir=state_dir, stat_result=stat_result)
+
+    #the saved leaves are taken as they are, only the other chunks are read
+    assert resumed == ["0" * 64] * 5 + leaves[5:]
+    assert compute_chunk_hashes(str(big_file), CHUNK_SIZE, state_dir=state_dir, stat_result=stat_result) == leaves
+
+
+def test_resume_state_is_keyed_on_the_file_version(big_file, tmp_path):
+    state_dir = str(tmp_path / "state")
+    stat_result = big_file.stat()
+    ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256').save({0: "0" * 64})
+
+    def other_version(**fields):
+        #same size and mtime, but another file was put in its place or it was rewritten
+        return SimpleNamespace(**{'st_size': stat_result.st_size, 'st_mtime_ns': stat_result.st_mtime_ns,
+                                  'st_ctime_ns': stat_result.st_ctime_ns, 'st_ino': stat_result.st_ino, **fields})
+
+    assert ChunkResumeState(state_dir, str(big_file), other_version(), CHUNK_SIZE, 'sha256').load() == {0: "0" * 64}
+    assert ChunkResumeState(state_dir, str(big_file), other_version(st_ino=stat_result.st_ino + 1),
+                            CHUNK_SIZE, 'sha256').load() == {}
+    assert ChunkResumeState(state_dir, str(big_file), other_version(st_ctime_ns=stat_result.st_ctime_ns + 1),
+                            CHUNK_SIZE, 'sha256').load() == {}
+
+
+def test_sealed_resume_state_needs_its_mac(big_file, tmp_path):
+    state_dir = str(tmp_path / "state")
+    stat_result = big_file.stat()
+    seal = MerkleSeal(HmacSigner(b"test key"))
+    ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256').save({0: "0" * 64})
+
+    assert ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256', seal).load() == {}
+
+    ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256', seal).save({0: "0" * 64})
+
+    assert ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256', seal).load() == {0: "0" * 64}
+    assert ChunkResumeState(state_dir, str(big_file), stat_result, CHUNK_SIZE, 'sha256',
+                            MerkleSeal(HmacSigner(b"other key"))).load() == {}
+
+
+def test_root_covers_the_size():
+    leaves = [hashlib.sha256(b"a").hexdigest(), hashlib.sha256(b"b").hexdigest(), hashlib.sha256(b"c").hexdigest()]
+
+    assert merkle_root(leaves, 3) != merkle_root(leaves, 4)
+    assert merkle_root(leaves, 3) != merkle_root(leaves[:2], 3)
+    assert merkle_root(leaves, 3, version=1) == merkle_root(leaves, 4, version=1)
+    assert chunk_count(0, CHUNK_SIZE) == 1
+    assert chunk_count(CHUNK_SIZE + 1, CHUNK_SIZE) == 2
+
+
+def test_changed_ranges_are_merged():
+    old = ["a", "b", "c", "d", "e"]
+    new = ["a", "x", "y", "d"]
+
+    assert changed_ranges(old, new, 10, 38, 50) == [(10, 30), (40, 50)]
+
+
+def test_changed_byte_ranges_are_reported(make_checker, big_file):
+    checker = make_checker(chunk_threshold=CHUNK_SIZE, chunk_size=CHUNK_SIZE)
+    checker.add_files_to_baseline([str(big_file)])
+    file_path = checker.normalise_file_path(str(big_file))
+    with open(big_file, 'r+b') as f:
+        f.seek(CHUNK_SIZE * 3 + 10)
+        f.write(b"!")
+
+    assert checker.scan_results()[SCAN_CHANGED] == [file_path]
+    assert checker.changed_ranges[file_path] == [(CHUNK_SIZE * 3, CHUNK_SIZE * 4)]
+
+
+def test_chunk_size_has_to_be_positive(make_checker, capsys):
+    with pytest.raises(ValueError):
+        make_checker(chunk_size=0)
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(['--chunk-size-mb', '-1', 'check'])
@@ -0,0 +1,127 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import METRICS, Metrics, profile_capture, timed
+
+
+def test_counters_gauges_and_timers():
+    metrics = Metrics()
+    metrics.inc('files_hashed')
+    metrics.inc('files_hashed', 2)
+    metrics.set_gauge('event_queue_depth', 7)
+    metrics.set_gauge('event_queue_depth', 3)
+    with metrics.timer('scan_hash'):
+        pass
+    metrics.add_time('scan_hash', 1.5)
+
+    assert metrics.value('files_hashed') == 3
+    assert metrics.value('event_queue_depth') == 3
+    assert metrics.value('missing') == 0
+    seconds, runs = metrics.snapshot()['timers']['scan_hash']
+    assert runs == 2 and seconds >= 1.5
+
+
+def test_prometheus_text_format(tmp_path):
+    metrics = Metrics()
+    metrics.describe('files_hashed', "Files hashed.")
+    metrics.inc('files_hashed', 4)
+    metrics.set_gauge('pending_verifications', 2)
+    metrics.add_time('scan_stat', 0.25)
+
+    metrics.write_prometheus(str(tmp_path / "fic.prom"))
+    lines = (tmp_path / "fic.prom").read_text().splitlines()
+
+    assert lines[:3] == ["# HELP integrisecure_files_hashed_total Files hashed.",
+                         "# TYPE integrisecure_files_hashed_total counter",
+                         "integrisecure_files_hashed_total 4"]
+    assert "integrisecure_pending_verifications 2" in lines
+    assert "integrisecure_scan_stat_seconds_total 0.250000" in lines
+    assert "integrisecure_scan_stat_runs_total 1" in lines
+    assert not (tmp_path / "fic.prom.tmp").exists()
+
+
+def test_counters_are_exact_across_threads():
+    metrics = Metrics()
+
+    def count():
+        for _ in range(1000):
+            metrics.inc('events_received')
+
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert metrics.value('events_received') == 8000
+
+
+def test_timed_only_counts_the_producer():
+    metrics = Metrics()
+
+    def produce():
+        for item in range(3):
+            time.sleep(0.01)
+            yield item
+
+    for _ in timed(produce(), 'produce', metrics):
+        #the consumer's time is not part of the phase
+        time.sleep(0.05)
+
+    seconds, runs = metrics.snapshot()['timers']['produce']
+    assert runs == 1
+    assert 0.03 <= seconds < 0.15
+
+
+def test_timed_closes_the_wrapped_generator():
+    closed = []
+
+    def produce():
+        try:
+            yield from range(10)
+        finally:
+            closed.append(True)
+
+    items = timed(produce(), 'produce', Metrics())
+    next(items)
+    items.close()
+
+    assert closed == [True]
+
+
+def test_serve_metrics_over_http():
+    metrics = Metrics()
+    metrics.inc('verifications', 5)
+    server = metrics.serve(0)
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert "integrisecure_verifications_total 5" in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_profile_capture(tmp_path, capsys):
+    with profile_capture(str(tmp_path / "scan.prof"), tracemalloc_top=3):
+        [bytes(1000) for _ in range(100)]
+
+    assert (tmp_path / "scan.prof").stat().st_size > 0
+    assert "Peak traced memory" in capsys.readouterr().out
+
+
+def test_scans_fill_the_shared_registry(make_checker, folder):
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    before = METRICS.value('files_stat')
+
+    checker.scan_results()
+
+    assert METRICS.value('files_stat') - before == 3
+    assert 'scan_hash' in METRICS.snapshot()['timers']
@@ -0,0 +1,152 @@
+import sys
+import threading
+import time
+
+import pytest
+
+#the monitor imports watchdog and plyer at module level
+pytest.importorskip('watchdog')
+pytest.importorskip('plyer')
+
+from file_scanner import ScanFilter
+from fic_core import SCAN_ADDED, SCAN_CHANGED
+from rt_file_monitoring import EventPipeline, FileChangeHandler, Notifier, WatchRoots, count_kernel_watches, plan_watches
+
+
+class RecordingNotifier(Notifier):
+    """Notifier that keeps the notifications instead of showing them."""
+
+    def __init__(self):
+        super().__init__(interval=0)
+        self.shown = []
+
+    def show_notification(self, title, message):
+        self.shown.append(message)
+
+
+@pytest.fixture
+def pipeline(make_checker, folder):
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    pipeline = EventPipeline(checker, RecordingNotifier(), debounce=0, workers=1)
+    yield pipeline
+    pipeline.stop()
+
+
+def run_until_idle(pipeline):
+    """Drive the coalescer (the way the daemon does) until nothing is pending or running."""
+    deadline = time.monotonic() + 10
+    pipeline.coalesce()
+    while pipeline.pending or pipeline.in_flight or pipeline.rescan is not None or not pipeline.events.empty():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+        pipeline.coalesce()
+    #a path leaves in_flight before it is reported, the workers take their tasks in order
+    pipeline.executor.submit(lambda: None).result()
+
+
+def test_bursts_are_verified_once(pipeline, folder, monkeypatch):
+    verified = []
+    verify = pipeline.verify
+    monkeypatch.setattr(pipeline, 'verify', lambda *args: verified.append(args[0]) or verify(*args))
+    file_path = pipeline.checker.normalise_file_path(str(folder / "a.txt"))
+    (folder / "a.txt").write_text("changed\n")
+
+    for _ in range(5):
+        pipeline.submit(file_path)
+    run_until_idle(pipeline)
+
+    assert verified == [file_path]
+    assert pipeline.reported[file_path][0] == SCAN_CHANGED
+
+
+def test_a_change_is_reported_once_per_content(pipeline, folder):
+    file_path = pipeline.checker.normalise_file_path(str(folder / "a.txt"))
+    (folder / "a.txt").write_text("changed\n")
+
+    for content in ("changed\n", None, "changed again\n"):
+        if content is not None:
+            (folder / "a.txt").write_text(content)
+        pipeline.submit(file_path)
+        run_until_idle(pipeline)
+        pipeline.notifier.flush(force=True)
+
+    assert len(pipeline.notifier.shown) == 2
+
+
+def test_overflow_rescans_in_bounded_batches(make_checker, tmp_path):
+    folder = tmp_path / "many"
+    folder.mkdir()
+    for i in range(30):
+        (folder / f"{i}.txt").write_text(f"{i}\n")
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    (folder / "new.txt").write_text("new\n")
+    pipeline = EventPipeline(checker, RecordingNotifier(), debounce=0, workers=1, queue_size=1)
+    release = threading.Event()
+    verify = pipeline.verify
+    most_in_flight = []
+
+    def blocking_verify(file_path, throttled=False):
+        most_in_flight.append(len(pipeline.in_flight))
+        release.wait(10)
+        verify(file_path, throttled)
+
+    pipeline.verify = blocking_verify
+    try:
+        pipeline.submit(str(folder / "0.txt"))
+        pipeline.submit(str(folder / "1.txt"))
+        pipeline.coalesce()
+
+        assert len(pipeline.in_flight) == pipeline.max_in_flight
+        release.set()
+        run_until_idle(pipeline)
+    finally:
+        release.set()
+        pipeline.stop()
+
+    assert max(most_in_flight) <= pipeline.max_in_flight
+    assert pipeline.reported == {checker.normalise_file_path(str(folder / "new.txt")): (SCAN_ADDED, None)}
+
+
+def test_plan_watches_collapses_nested_folders(tmp_path):
+    root = str(tmp_path)
+    folders = [f"{root}/data", f"{root}/data/sub", f"{root}/other"]
+    files = [f"{root}/data/sub/a", f"{root}/etc/b", f"{root}/etc/c", f"{root}/other/d", f"{root}/single/e"]
+
+    assert plan_watches(files, folders) == ([f"{root}/data", f"{root}/other"], [f"{root}/etc", f"{root}/single"])
+
+
+def test_watch_roots_apply_the_folder_filters(tmp_path):
+    root = str(tmp_path)
+    roots = WatchRoots([root, f"{root}/logs"], {root: ScanFilter(exclude=['logs', '*.tmp'])})
+
+    assert roots.accepts(f"{root}/a.txt")
+    assert not roots.accepts(f"{root}/a.tmp")
+    assert roots.covers(f"{root}/logs/deeper")
+    #excluded by the outer folder, but added on its own without a filter
+    assert roots.accepts(f"{root}/logs/x.tmp")
+    assert not roots.accepts(str(tmp_path.parent / "outside.txt"))
+
+
+def test_files_created_below_a_root_are_monitored(pipeline, folder):
+    handler = FileChangeHandler(pipeline.checker.get_files_to_check(), pipeline, [str(folder)])
+
+    assert handler.is_monitored(str(folder / "new.txt"))
+    assert not handler.is_monitored(str(folder.parent / "new.txt"))
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="only inotify needs a watch per directory")
+def test_count_kernel_watches_uses_the_folder_states(make_checker, tmp_path):
+    folder = tmp_path / "tree"
+    for sub in ("a/b", "a/c", "d"):
+        (folder / sub).mkdir(parents=True)
+        (folder / sub / "file").write_text("x\n")
+    checker = make_checker()
+    checker.add_folder_to_baseline(str(folder))
+    checker.scan_results()
+    dir_states = {str(folder): checker.baseline_store.load_dir_states(str(folder))}
+
+    #tree, a, a/b, a/c and d, plus the directory watch on /etc
+    assert count_kernel_watches([str(folder)], ["/etc"], dir_states) == 6
+    assert count_kernel_watches([str(folder)], [], {}) == 1
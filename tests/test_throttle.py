@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+import throttle
+from throttle import ScanThrottle, TokenBucket
+
+
+class FakeClock:
+    """time.monotonic and time.sleep of the throttle module, sleeping only moves the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttle.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(throttle.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=10, burst=5)
+
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+    #the bucket is empty, not in debt, the next token is taken into debt
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.1)
+    clock.now += 1
+    assert bucket.acquire() == 0.0
+
+
+def test_big_requests_go_into_debt(clock):
+    bucket = TokenBucket(rate=100)
+
+    assert bucket.acquire(1000) == 0.0
+    #900 tokens of debt take 9 seconds to pay off
+    assert bucket.acquire(1) == pytest.approx(9.0)
+    assert clock.slept == [pytest.approx(9.0)]
+
+
+def test_admit_counts_the_waits(clock, tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"x" * 100)
+    scan_throttle = ScanThrottle(bytes_per_second=100)
+
+    assert scan_throttle.admit(str(path)) == path.stat().st_dev
+    scan_throttle.admit(str(path))
+    scan_throttle.admit(str(path))
+
+    #the first file emptied the bucket, the second took it into debt and the third waits for that
+    assert scan_throttle.throttled_seconds == pytest.approx(1.0)
+    assert scan_throttle.admit(str(tmp_path / "missing")) is None
+
+
+def test_admit_bytes_only_takes_bytes(clock, tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"x" * 1000)
+    scan_throttle = ScanThrottle(bytes_per_second=100, files_per_second=1)
+
+    scan_throttle.admit(str(path), read_bytes=False)
+    for _ in range(3):
+        scan_throttle.admit_bytes(100)
+
+    #with the 1000 bytes of the file taken by admit the chunks would wait 10 seconds
+    assert scan_throttle.throttled_seconds == pytest.approx(1.0)
+
+
+def test_busy_system_backs_off(clock, monkeypatch):
+    scan_throttle = ScanThrottle(max_load=1.0)
+    loads = iter([3.0, 2.0, 0.5])
+    monkeypatch.setattr(scan_throttle.system_load, 'load_per_cpu', lambda: next(loads))
+
+    scan_throttle.wait_for_quiet_system()
+
+    assert scan_throttle.backoff_seconds == 2 * throttle.BACKOFF_SECONDS
+
+
+def test_counters_are_exact_across_threads(tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"x")
+    #a rate so high that every wait is a tiny float, lost updates would show in the sum
+    scan_throttle = ScanThrottle(files_per_second=10 ** 9)
+    scan_throttle.files_bucket.tokens = -1.0
+    waits = []
+    acquire = scan_throttle.files_bucket.acquire
+
+    def recording_acquire(amount=1):
+        waited = acquire(amount)
+        waits.append(waited)
+        return waited
+
+    scan_throttle.files_bucket.acquire = recording_acquire
+
+    def admit_many():
+        for _ in range(200):
+            scan_throttle.admit(str(path))
+
+    threads = [threading.Thread(target=admit_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(waits) == 1600
+    assert scan_throttle.throttled_seconds == pytest.approx(sum(waits))
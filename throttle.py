@@ -0,0 +1,163 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+#how long a scan pauses when the system is too busy, before looking again
+BACKOFF_SECONDS = 5
+#load average and I/O wait are sampled at most this often
+SAMPLE_INTERVAL_SECONDS = 1
+
+
+class TokenBucket:
+    """Rate limiter refilled with rate tokens per second, holding at most burst tokens.
+
+    A request larger than the bucket is allowed to take it into debt, the next request then
+    waits until the debt is paid off, so big files are limited to the rate as well.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Take amount tokens, sleeping as long as the bucket is in debt. Returns the seconds waited."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            #wait for the debt left by earlier requests, then take this request's tokens
+            wait = max(0.0, -self.tokens / self.rate)
+            self.tokens -= amount
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SystemLoad:
+    """Samples the 1 minute load average per CPU and the I/O wait share of CPU time (Linux)."""
+
+    def __init__(self):
+        self.cpu_count = os.cpu_count() or 1
+        self.last_cpu_times = self.read_cpu_times()
+
+    @staticmethod
+    def read_cpu_times():
+        try:
+            with open('/proc/stat', 'r') as f:
+                fields = f.readline().split()
+        except OSError:
+            return None
+        #cpu user nice system idle iowait irq softirq steal ...
+        return [int(value) for value in fields[1:9]]
+
+    def load_per_cpu(self):
+        try:
+            return os.getloadavg()[0] / self.cpu_count
+        except (AttributeError, OSError):
+            return None
+
+    def iowait_percent(self):
+        """I/O wait since the previous call in percent of all CPU time, None where /proc/stat is missing."""
+        cpu_times = self.read_cpu_times()
+        if cpu_times is None or self.last_cpu_times is None:
+            return None
+        deltas = [now - before for now, before in zip(cpu_times, self.last_cpu_times)]
+        self.last_cpu_times = cpu_times
+        total = sum(deltas)
+        return 100.0 * deltas[4] / total if total else 0.0
+
+
+class ScanThrottle:
+    """Keeps scans from saturating a production host.
+
+    Every file has to be admitted before it is read. Admission takes one token from the files per
+    second bucket and the file size from the bytes per second bucket, and waits while the load
+    average per CPU or the I/O wait percentage are above their thresholds. per_device limits the
+    batches reading from one device (st_dev) at the same time, see HashEngine.
+    """
+
+    def __init__(self, bytes_per_second=None, files_per_second=None, per_device=None, max_load=None, max_iowait=None):
+        self.bytes_bucket = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.files_bucket = TokenBucket(files_per_second) if files_per_second else None
+        self.per_device = per_device
+        self.max_load = max_load
+        self.max_iowait = max_iowait
+        self.system_load = SystemLoad() if max_load or max_iowait else None
+
+        self.lock = threading.Lock()
+        self.last_sample = 0.0
+        self.busy = False
+        self.throttled_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def admit(self, file_path, read_bytes=True):
+        """Block until file_path may be read. Returns its device id, None if it cannot be stat'ed.
+
+        With read_bytes False only the file is admitted, the caller admits its bytes with admit_bytes as it reads them.
+        """
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return None
+        self.wait_for_quiet_system()
+        if self.files_bucket is not None:
+            self.take(self.files_bucket, 1)
+        if read_bytes and self.bytes_bucket is not None:
+            self.take(self.bytes_bucket, stat_result.st_size)
+        return stat_result.st_dev
+
+    def admit_bytes(self, amount):
+        """Block until amount more bytes of an admitted file may be read."""
+        self.wait_for_quiet_system()
+        if self.bytes_bucket is not None:
+            self.take(self.bytes_bucket, amount)
+
+    def take(self, bucket, amount):
+        #the hashing workers admit files concurrently, the wait is counted under the lock but not waited under it
+        waited = bucket.acquire(amount)
+        with self.lock:
+            self.throttled_seconds += waited
+
+    def system_busy(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_sample < SAMPLE_INTERVAL_SECONDS:
+                return self.busy
+            self.last_sample = now
+            load = self.system_load.load_per_cpu() if self.max_load else None
+            iowait = self.system_load.iowait_percent() if self.max_iowait else None
+            self.busy = ((load is not None and load > self.max_load)
+                         or (iowait is not None and iowait > self.max_iowait))
+            return self.busy
+
+    def wait_for_quiet_system(self):
+        if self.system_load is None:
+            return
+        while self.system_busy():
+            time.sleep(BACKOFF_SECONDS)
+            with self.lock:
+                self.backoff_seconds += BACKOFF_SECONDS
+
+
+def lower_priority(niceness=10, idle_io=True):
+    """Lower the CPU (nice) and, on Linux, the I/O (ionice) priority of this process.
+
+    Call it before the hashing pools are started: threads and worker processes inherit both.
+    """
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError) as e:
+        print(f"Could not change the CPU priority: {e}")
+
+    if idle_io and sys.platform.startswith('linux'):
+        try:
+            #class 3 (idle) only gets disk time when no other process asks for it
+            subprocess.run(['ionice', '-c', '3', '-p', str(os.getpid())], check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Could not change the I/O priority: {e}")